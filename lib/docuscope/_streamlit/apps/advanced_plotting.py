@@ -64,7 +64,7 @@ def main():
 		with st.sidebar.expander("About general tags"):
 			st.markdown(_messages.message_general_tags)		
 
-		tag_radio_tokens = st.sidebar.radio("Select tags to display:", ("Parts-of-Speech", "DocuScope"), on_change=_handlers.clear_plots, args=(user_session_id,), horizontal=True)
+		tag_radio_tokens = st.sidebar.radio("Select tags to display:", _handlers.tagset_choices(("Parts-of-Speech", "DocuScope"), user_session_id), on_change=_handlers.clear_plots, args=(user_session_id,), horizontal=True)
 
 		if tag_radio_tokens == 'Parts-of-Speech':
 			tag_type = st.sidebar.radio("Select from general or specific tags", ("General", "Specific"), on_change=_handlers.clear_plots, args=(user_session_id,), horizontal=True)
@@ -217,7 +217,7 @@ def main():
 		with st.sidebar.expander("About general tags"):
 			st.markdown(_messages.message_general_tags)		
 
-		tag_radio_tokens = st.sidebar.radio("Select tags to display:", ("Parts-of-Speech", "DocuScope"), on_change=_handlers.clear_plots, args=(user_session_id,), horizontal=True)
+		tag_radio_tokens = st.sidebar.radio("Select tags to display:", _handlers.tagset_choices(("Parts-of-Speech", "DocuScope"), user_session_id), on_change=_handlers.clear_plots, args=(user_session_id,), horizontal=True)
 		
 		if tag_radio_tokens == 'Parts-of-Speech':
 			tag_type = st.sidebar.radio("Select from general or specific tags", ("General", "Specific"), on_change=_handlers.clear_plots, args=(user_session_id,), horizontal=True)
@@ -316,7 +316,7 @@ def main():
 		with st.sidebar.expander("About general tags"):
 			st.markdown(_messages.message_general_tags)		
 
-		tag_radio_tokens = st.sidebar.radio("Select tags to display:", ("Parts-of-Speech", "DocuScope"), on_change=_handlers.clear_plots, args=(user_session_id,), horizontal=True)
+		tag_radio_tokens = st.sidebar.radio("Select tags to display:", _handlers.tagset_choices(("Parts-of-Speech", "DocuScope"), user_session_id), on_change=_handlers.clear_plots, args=(user_session_id,), horizontal=True)
 
 		if tag_radio_tokens == 'Parts-of-Speech':
 			tag_type = st.sidebar.radio("Select from general or specific tags", ("General", "Specific"), on_change=_handlers.clear_plots, args=(user_session_id,), horizontal=True)
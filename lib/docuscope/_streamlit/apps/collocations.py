@@ -132,7 +132,7 @@ def main():
 			st.markdown(_messages.message_anchor_tags)
 		
 		st.sidebar.markdown("### Anchor tag")
-		tag_radio = st.sidebar.radio("Select tagset for node word:", ("No Tag", "Parts-of-Speech", "DocuScope"), horizontal=True)
+		tag_radio = st.sidebar.radio("Select tagset for node word:", _handlers.tagset_choices(("No Tag", "Parts-of-Speech", "DocuScope"), user_session_id), horizontal=True)
 		if tag_radio == 'Parts-of-Speech':
 			tag_type = st.sidebar.radio("Select from general or specific tags", ("General", "Specific"), horizontal=True)
 			if tag_type == 'General':
@@ -180,7 +180,7 @@ def main():
 					with st.spinner('Processing collocates...'):
 						tok_pl = st.session_state[user_session_id]["target"]["ds_tokens"]
 
-						coll_df = _analysis.collocations_pl(tok_pl, node_word=node_word, node_tag=node_tag, preceding=to_left, following=to_right, statistic=stat_mode, count_by=count_by)
+						coll_df = _analysis.collocations_pl(tok_pl, node_word=node_word, node_tag=node_tag, preceding=to_left, following=to_right, statistic=stat_mode, count_by=count_by, span_tables=_handlers.get_span_tables(user_session_id))
 				
 				if coll_df.is_empty():
 					st.markdown(_warnings.warning_12, unsafe_allow_html=True)
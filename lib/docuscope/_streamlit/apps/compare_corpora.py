@@ -60,7 +60,7 @@ def main():
 		table_radio = st.sidebar.radio("Select the keyness table to display:", ("Tokens", "Tags Only"), key = _handlers.persist("kt_radio1", pathlib.Path(__file__).stem, user_session_id), horizontal=True)
 		st.sidebar.markdown("---")
 		if table_radio == 'Tokens':
-			tag_radio = st.sidebar.radio("Select tags to display:", ("Parts-of-Speech", "DocuScope"), key = _handlers.persist("kt_radio2", pathlib.Path(__file__).stem, user_session_id), horizontal=True)
+			tag_radio = st.sidebar.radio("Select tags to display:", _handlers.tagset_choices(("Parts-of-Speech", "DocuScope"), user_session_id, "kt_radio2", corpus_types=('target', 'reference')), key = _handlers.persist("kt_radio2", pathlib.Path(__file__).stem, user_session_id), horizontal=True)
 			if tag_radio == 'Parts-of-Speech':
 				tag_type = st.sidebar.radio("Select from general or specific tags", ("General", "Specific"), horizontal=True)			
 				if tag_type == 'General':
@@ -109,7 +109,7 @@ def main():
 	
 		else:
 			st.sidebar.markdown("### Tagset")
-			tag_radio_tags = st.sidebar.radio("Select tags to display:", ("Parts-of-Speech", "DocuScope"), key = _handlers.persist("kt_radio3", pathlib.Path(__file__).stem, user_session_id), horizontal=True)
+			tag_radio_tags = st.sidebar.radio("Select tags to display:", _handlers.tagset_choices(("Parts-of-Speech", "DocuScope"), user_session_id, "kt_radio3", corpus_types=('target', 'reference')), key = _handlers.persist("kt_radio3", pathlib.Path(__file__).stem, user_session_id), horizontal=True)
 	
 			if tag_radio_tags == 'Parts-of-Speech':
 				df = st.session_state[user_session_id]["target"]["kt_pos"].filter(pl.col("Tag") != "FU")
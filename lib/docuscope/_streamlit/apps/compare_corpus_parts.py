@@ -59,7 +59,7 @@ def main():
 
 		st.sidebar.markdown("---")
 		if table_radio == 'Tokens':
-			tag_radio_tokens = st.sidebar.radio("Select tags to display:", ("Parts-of-Speech", "DocuScope"), key = _handlers.persist("cp_radio2", pathlib.Path(__file__).stem, user_session_id), horizontal=True)
+			tag_radio_tokens = st.sidebar.radio("Select tags to display:", _handlers.tagset_choices(("Parts-of-Speech", "DocuScope"), user_session_id, "cp_radio2"), key = _handlers.persist("cp_radio2", pathlib.Path(__file__).stem, user_session_id), horizontal=True)
 			if tag_radio_tokens == 'Parts-of-Speech':
 				tag_type = st.sidebar.radio("Select from general or specific tags", ("General", "Specific"), horizontal=True)			
 				if tag_type == 'General':
@@ -131,7 +131,7 @@ def main():
 		else:
 			
 			st.sidebar.markdown("### Tagset")
-			tag_radio_tags = st.sidebar.radio("Select tags to display:", ("Parts-of-Speech", "DocuScope"), key = _handlers.persist("cp_radio3", pathlib.Path(__file__).stem, user_session_id), horizontal=True)
+			tag_radio_tags = st.sidebar.radio("Select tags to display:", _handlers.tagset_choices(("Parts-of-Speech", "DocuScope"), user_session_id, "cp_radio3"), key = _handlers.persist("cp_radio3", pathlib.Path(__file__).stem, user_session_id), horizontal=True)
 	
 			if tag_radio_tags == 'Parts-of-Speech':
 				df = st.session_state[user_session_id]["target"]["kt_pos_cp"].filter(pl.col("Tag") != "FU")
@@ -260,22 +260,26 @@ def main():
 
 						tar_pl = _analysis.subset_pl(tok_pl, tar_list)
 						ref_pl = _analysis.subset_pl(tok_pl, ref_list)
+						span_tables = _handlers.get_span_tables(user_session_id)
+						tar_spans = _analysis.subset_span_tables_pl(span_tables, tar_list)
+						ref_spans = _analysis.subset_span_tables_pl(span_tables, ref_list)
 											
-						wc_tar_pos, wc_tar_ds = _analysis.frequency_tables_pl(tar_pl)
-						tc_tar_pos, tc_tar_ds = _analysis.tag_tables_pl(tar_pl)
+						wc_tar_pos, wc_tar_ds = _analysis.frequency_tables_pl(tar_pl, tar_spans)
+						tc_tar_pos, tc_tar_ds = _analysis.tag_tables_pl(tar_pl, tar_spans)
 		
-						wc_ref_pos, wc_ref_ds = _analysis.frequency_tables_pl(ref_pl)
-						tc_ref_pos, tc_ref_ds = _analysis.tag_tables_pl(ref_pl)
+						wc_ref_pos, wc_ref_ds = _analysis.frequency_tables_pl(ref_pl, ref_spans)
+						tc_ref_pos, tc_ref_ds = _analysis.tag_tables_pl(ref_pl, ref_spans)
 
 						kw_pos_cp = _analysis.keyness_pl(wc_tar_pos, wc_ref_pos)
 						kw_ds_cp  = _analysis.keyness_pl(wc_tar_ds, wc_ref_ds)
 						kt_pos_cp = _analysis.keyness_pl(tc_tar_pos, tc_ref_pos, tags_only=True)
 						kt_ds_cp  = _analysis.keyness_pl(tc_tar_ds, tc_ref_ds, tags_only=True)
 
-						tar_tokens_pos = tar_pl.group_by(["doc_id", "pos_id", "pos_tag"]).agg(pl.col("token").str.concat("")).filter(pl.col("pos_tag") != "Y").height
-						ref_tokens_pos = ref_pl.group_by(["doc_id", "pos_id", "pos_tag"]).agg(pl.col("token").str.concat("")).filter(pl.col("pos_tag") != "Y").height
-						tar_tokens_ds = tar_pl.group_by(["doc_id", "ds_id", "ds_tag"]).agg(pl.col("token").str.concat("")).filter(~(pl.col("token").str.contains("^[[[:punct:]] ]+$") & pl.col("ds_tag").str.contains("Untagged"))).height
-						ref_tokens_ds = ref_pl.group_by(["doc_id", "ds_id", "ds_tag"]).agg(pl.col("token").str.concat("")).filter(~(pl.col("token").str.contains("^[[[:punct:]] ]+$") & pl.col("ds_tag").str.contains("Untagged"))).height
+						# tokens are counted as in the tag tables of each part (see handlers_database.corpus_metadata)
+						tar_tokens_pos = tc_tar_pos.get_column("AF").sum()
+						ref_tokens_pos = tc_ref_pos.get_column("AF").sum()
+						tar_tokens_ds = tc_tar_ds.get_column("AF").sum()
+						ref_tokens_ds = tc_ref_ds.get_column("AF").sum()
 						tar_ndocs = tar_pl.get_column("doc_id").unique().len()
 						ref_ndocs = ref_pl.get_column("doc_id").unique().len()
 					
@@ -40,7 +40,7 @@ def main():
 	st.markdown(_messages.message_download_tagged)
 	
 	st.sidebar.markdown("### Tagset to embed")
-	download_radio = st.sidebar.radio("Select tagset:", ("Parts-of-Speech", "DocuScope"), horizontal=True)
+	download_radio = st.sidebar.radio("Select tagset:", _handlers.tagset_choices(("Parts-of-Speech", "DocuScope"), user_session_id), horizontal=True)
 
 	if download_radio == 'Parts-of-Speech':
 		tagset = 'pos'
@@ -51,7 +51,7 @@ def main():
 		tok_pl = st.session_state[user_session_id]["target"]["ds_tokens"]
 
 		with st.sidebar:
-			download_file = _handlers.convert_to_zip(tok_pl, tagset)
+			download_file = _handlers.convert_to_zip(tok_pl, tagset, _handlers.get_span_tables(user_session_id))
 
 			st.download_button(
     			label="Download to Zip",
@@ -120,7 +120,7 @@ def main():
 				
 				with st.sidebar:
 					with st.spinner('Processing KWIC...'):
-						kwic_df = _analysis.kwic_pl(tok_pl, node_word=node_word, search_type=search_type, ignore_case=ignore_case)
+						kwic_df = _analysis.kwic_pl(tok_pl, node_word=node_word, search_type=search_type, ignore_case=ignore_case, span_tables=_handlers.get_span_tables(user_session_id))
 				if kwic_df.is_empty() == False:
 					if "kwic" not in st.session_state[user_session_id]["target"]:
 						st.session_state[user_session_id]["target"]["kwic"] = {}
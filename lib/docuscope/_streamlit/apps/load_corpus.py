@@ -16,7 +16,6 @@ from collections import Counter
 from lingua import Language, LanguageDetectorBuilder
 import pathlib
 import polars as pl
-import spacy
 import streamlit as st
 
 from docuscope._streamlit import categories as _categories
@@ -24,14 +23,14 @@ from docuscope._streamlit import states as _states
 from docuscope._streamlit.utilities import analysis_functions as _analysis
 from docuscope._streamlit.utilities import handlers_database as _handlers
 from docuscope._streamlit.utilities import handlers_imports as _imports
+from docuscope._streamlit.utilities import handlers_jobs as _jobs
+from docuscope._streamlit.utilities import handlers_models as _models
 from docuscope._streamlit.utilities import messages as _messages
 from docuscope._streamlit.utilities import process_corpus as _process
 from docuscope._streamlit.utilities import warnings as _warnings
 
 # set paths
 HERE = pathlib.Path(__file__).parents[1].resolve()
-MODEL_LARGE = str(HERE.joinpath("models/en_docusco_spacy"))
-MODEL_SMALL = str(HERE.joinpath("models/en_docusco_spacy_cd"))
 OPTIONS = str(HERE.joinpath("options.toml"))
 
 # import options
@@ -41,6 +40,18 @@ _options = _imports.import_options_general(OPTIONS)
 ENABLE_DETECT = _options['global']['check_language']
 DESKTOP = _options['global']['desktop_mode']
 CHECK_SIZE = _options['global']['check_size']
+BATCH_SIZE = _options['global'].get('batch_size')
+N_PROCESS = _options['global'].get('n_process', 1)
+CHUNK_SIZE = _options['global'].get('chunk_size', 500)
+CACHE_MAX_BYTES = _options['global'].get('cache_max_bytes', 0)
+LARGE_DOCS = _options['global'].get('large_docs', False)
+PIPE_PROFILE = _options['global'].get('pipe_profile', 'full')
+# tagging profiles offered when a target is processed (see process_corpus.PIPE_PROFILES); pipe_profile sets the default
+PROFILE_NAMES = {"Both": "full", "Parts-of-Speech": "pos", "DocuScope": "ds"}
+TOKEN_ENCODING = _options['global'].get('token_encoding', 'string')
+
+# plain text files, archives of them (.zip, .tar, .tar.gz/.tgz, .tar.bz2, .tar.xz) or single compressed text files (.gz, .bz2, .xz)
+TEXT_TYPES = ["txt", "zip", "tar", "gz", "tgz", "bz2", "xz"]
 
 if CHECK_SIZE == True:
 	MAX_TEXT = _options['global']['max_bytes_text']
@@ -55,12 +66,70 @@ def load_detector():
 	detector = LanguageDetectorBuilder.from_all_languages().with_low_accuracy_mode().build()
 	return(detector)
 
-@st.cache_resource(show_spinner=False)
-def load_models():
-	large_model = spacy.load(MODEL_LARGE)
-	small_model = spacy.load(MODEL_SMALL)
-	models = {"Large Dictionary": large_model, "Common Dictionary": small_model}
-	return models
+def load_model(model_name, profile="full"):
+	# models are loaded on first use unless the warm-up at startup got there first; a load is reported with the time it took
+	if _models.is_loaded(model_name, profile):
+		return(_models.get_model(model_name, profile))
+	with st.spinner(f'Loading the {model_name} model...'):
+		nlp = _models.get_model(model_name, profile)
+	st.toast(f"Loaded the {model_name} model in {_models.load_times()[(model_name, profile)]:.1f} seconds.")
+	return(nlp)
+
+def resume_jobs(user_session_id, corpus_type, model_name=None, docs=None):
+	# lists interrupted tagging jobs (all of them in desktop mode, otherwise this session's) with buttons to resume or discard them
+	# with docs, lists the jobs of other sessions over the same uploads instead, as a session that reconnects gets a new id
+	if docs is None:
+		jobs = _jobs.list_jobs(None if DESKTOP == True else user_session_id, corpus_type)
+	else:
+		jobs = [job for job in _jobs.find_jobs(docs, corpus_type) if job['session_id'] != user_session_id]
+	if model_name is not None:
+		jobs = [job for job in jobs if job['model'] == model_name]
+	if len(jobs) == 0:
+		return
+	st.markdown("##### Resume processing:")
+	st.markdown(_messages.message_resume_jobs if docs is None else _messages.message_resume_uploads)
+	for job in jobs:
+		col1, col2, col3 = st.columns([4, 1, 1])
+		col1.markdown(f"{job['total']} documents with the {job['model']} ({job['done']} already tagged)")
+		if col3.button("Discard", key=f"discard_{job['job_id']}"):
+			_jobs.remove_job(job['job_id'])
+			st.rerun()
+		if col2.button("Resume", key=f"resume_{job['job_id']}"):
+			with st.spinner('Processing corpus data...'):
+				nlp = load_model(job['model'], job['profile'])
+				if ENABLE_DETECT == True:
+					timings = []
+					tokens, exceptions = _jobs.run_job(job['job_id'], nlp, load_detector(), Language.ENGLISH, batch_size=BATCH_SIZE, n_process=N_PROCESS, chunk_size=CHUNK_SIZE, cache_max_bytes=CACHE_MAX_BYTES, large_docs=LARGE_DOCS, timings=timings)
+					_handlers.update_language_report(timings, user_session_id, corpus_type)
+				else:
+					tokens, exceptions = _jobs.run_job(job['job_id'], nlp, batch_size=BATCH_SIZE, n_process=N_PROCESS, chunk_size=CHUNK_SIZE, cache_max_bytes=CACHE_MAX_BYTES, large_docs=LARGE_DOCS)
+				_jobs.remove_job(job['job_id'])
+				_handlers.clear_spool(user_session_id, corpus_type)
+
+			if len(exceptions) > 0 and tokens.is_empty() == True:
+				st.session_state[user_session_id]['warning'] = 10 if corpus_type == 'target' else 11
+				st.rerun()
+			elif len(exceptions) > 0:
+				if corpus_type == 'target':
+					st.session_state[user_session_id]['warning'] = 40
+					st.session_state[user_session_id]['exceptions'] = exceptions
+				else:
+					st.session_state[user_session_id]['warning'] = 41
+					st.session_state[user_session_id]['ref_exceptions'] = exceptions
+			else:
+				st.session_state[user_session_id]['warning'] = 0
+
+			corpus = _analysis.build_corpus_pl(_process.encode_tokens_pl(tokens, TOKEN_ENCODING))
+			_handlers.load_corpus_new(corpus, user_session_id, corpus_type)
+			if corpus_type == 'target':
+				st.session_state[user_session_id]['model'] = job['model']
+				_handlers.init_metadata_target(user_session_id)
+				_handlers.update_session('has_target', True, user_session_id)
+			else:
+				_handlers.init_metadata_reference(user_session_id)
+				_handlers.update_session('has_reference', True, user_session_id)
+			st.rerun()
+	st.markdown("---")
 
 def main():
 
@@ -69,6 +138,12 @@ def main():
 
 	if user_session_id not in st.session_state:
 		st.session_state[user_session_id] = {}
+
+	# once per session, remove the spooled uploads and stale tagging jobs that sessions which have ended left behind
+	if 'spools_cleaned' not in st.session_state[user_session_id]:
+		_handlers.clean_spools()
+		_jobs.clean_jobs()
+		st.session_state[user_session_id]['spools_cleaned'] = True
 	
 	try:
 		session = pl.DataFrame.to_dict(st.session_state[user_session_id]["session"], as_series=False)
@@ -92,6 +167,47 @@ def main():
 		
 		with st.expander("Documents:"):
 			st.write(metadata_target.get('docids')[0]['ids'])
+
+		if 'language_target' in st.session_state[user_session_id]:
+			with st.expander("Language screening:"):
+				st.markdown(_messages.message_language_report)
+				st.dataframe(st.session_state[user_session_id]['language_target'], hide_index=True)
+
+		with st.expander("Add or remove documents:"):
+			st.markdown(_messages.message_add_remove)
+			with st.form("add-form", clear_on_submit=True):
+				add_files = st.file_uploader("Upload documents to add", type=TEXT_TYPES, accept_multiple_files=True)
+				add_submitted = st.form_submit_button("ADD DOCUMENTS")
+			if add_submitted and len(add_files) > 0:
+				add_files, dup_ids, dup_docs, corpus_size = _handlers.spool_uploads(add_files, user_session_id, 'added', target_docs=metadata_target.get('docids')[0]['ids'])
+				if len(dup_ids) > 0:
+					st.markdown(_warnings._20_corpus_duplicates(sorted(dup_ids)), unsafe_allow_html=True)
+				elif len(dup_docs) > 0:
+					st.markdown(_warnings._24_loaded_duplicates(dup_docs), unsafe_allow_html=True)
+				else:
+					with st.spinner('Processing documents...'):
+						nlp = load_model(metadata_target.get('model')[0], _handlers.corpus_profile(user_session_id))
+						# added documents are screened like the ones in the loaded corpus
+						if ENABLE_DETECT == True:
+							timings = []
+							add_tokens, exceptions = _process.stream_corpus(add_files, nlp, load_detector(), Language.ENGLISH, batch_size=BATCH_SIZE, n_process=N_PROCESS, chunk_size=CHUNK_SIZE, cache_max_bytes=CACHE_MAX_BYTES, large_docs=LARGE_DOCS, timings=timings)
+							_handlers.update_language_report(timings, user_session_id, 'target', append=True)
+						else:
+							add_tokens, exceptions = _process.stream_corpus(add_files, nlp, batch_size=BATCH_SIZE, n_process=N_PROCESS, chunk_size=CHUNK_SIZE, cache_max_bytes=CACHE_MAX_BYTES, large_docs=LARGE_DOCS)
+						_handlers.clear_spool(user_session_id, 'added')
+					if add_tokens.is_empty() == False:
+						_handlers.add_documents(_process.encode_tokens_pl(add_tokens, TOKEN_ENCODING), user_session_id, 'target')
+					if len(exceptions) > 0:
+						st.session_state[user_session_id]['warning'] = 40
+						st.session_state[user_session_id]['exceptions'] = exceptions
+					st.rerun()
+			to_remove = st.multiselect("Select documents to remove:", metadata_target.get('docids')[0]['ids'])
+			if st.button("Remove Documents") and len(to_remove) > 0:
+				if len(to_remove) == len(metadata_target.get('docids')[0]['ids']):
+					st.markdown(_warnings._22_remove_all, unsafe_allow_html=True)
+				else:
+					_handlers.remove_documents(to_remove, user_session_id, 'target')
+					st.rerun()
 		
 		if session.get('has_meta')[0] == True:
 			st.markdown('##### Target corpus metadata:')
@@ -126,6 +242,11 @@ def main():
 	
 			with st.expander("Documents in reference corpus:"):
 				st.write(metadata_reference.get('docids')[0]['ids'])
+
+			if 'language_reference' in st.session_state[user_session_id]:
+				with st.expander("Language screening of reference corpus:"):
+					st.markdown(_messages.message_language_report)
+					st.dataframe(st.session_state[user_session_id]['language_reference'], hide_index=True)
 				
 		else:
 			st.markdown("---")
@@ -134,6 +255,8 @@ def main():
 						
 			st.markdown("---")
 			if load_ref == 'Yes':
+
+				resume_jobs(user_session_id, 'reference', metadata_target.get('model')[0])
 									
 				ref_corpus_source = st.radio("What kind of reference corpus would you like to prepare?",
 						["Internal", "External", "New"],
@@ -213,22 +336,8 @@ def main():
 						st.sidebar.markdown("Once you have selected a file, use the button to process your corpus.")
 
 						if st.sidebar.button("Load Reference Corpus"):
-							ds_tokens = tok_pl
-							ft_pos, ft_ds = _analysis.frequency_tables_pl(ds_tokens)
-							tt_pos, tt_ds = _analysis.tag_tables_pl(ds_tokens)
-							dtm_pos, dtm_ds = _analysis.dtm_pl(ds_tokens)
-
-							_handlers.load_corpus_new(
-								ds_tokens,
-								dtm_ds,
-								dtm_pos,
-								ft_ds,
-								ft_pos,
-								tt_ds,
-								tt_pos,
-								user_session_id,
-								'reference'
-								)
+							corpus = _analysis.build_corpus_pl(_process.encode_tokens_pl(tok_pl, TOKEN_ENCODING))
+							_handlers.load_corpus_new(corpus, user_session_id, 'reference')
 							_handlers.init_metadata_reference(user_session_id)
 							_handlers.update_session('has_reference', True, user_session_id)
 							st.sidebar.markdown("---")
@@ -251,24 +360,34 @@ def main():
 					st.markdown(_messages.message_load_reference)
 
 					with st.form("ref-form", clear_on_submit=True):
-						ref_files = st.file_uploader("Upload your reference corpus", type=["txt"], accept_multiple_files=True, key='reffiles')
+						ref_files = st.file_uploader("Upload your reference corpus", type=TEXT_TYPES, accept_multiple_files=True, key='reffiles')
 						submitted = st.form_submit_button("UPLOAD REFERENCE")
 
 						if submitted:
 							st.session_state[user_session_id]['warning'] = 0
 				
 						if CHECK_SIZE == True:
-							dup_ids, dup_ref, corpus_size = _process.check_corpus(ref_files, check_size=True, check_ref=True, target_docs=metadata_target.get('docids')[0]['ids'])
+							ref_files, dup_ids, dup_ref, corpus_size = _handlers.spool_uploads(ref_files, user_session_id, 'reference', target_docs=metadata_target.get('docids')[0]['ids'], max_bytes=MAX_TEXT)
 							if 'ready_to_process' not in st.session_state[user_session_id]:
 								st.session_state[user_session_id]['ready_to_process'] = False
 							st.session_state[user_session_id]['ready_to_process'] = False
 					
 						if CHECK_SIZE == False:
-							dup_ids, dup_ref = _process.check_corpus(ref_files, check_ref=True, target_docs=metadata_target.get('docids')[0]['ids'])
+							ref_files, dup_ids, dup_ref, corpus_size = _handlers.spool_uploads(ref_files, user_session_id, 'reference', target_docs=metadata_target.get('docids')[0]['ids'])
 							corpus_size = 0
 							if 'ready_to_process' not in st.session_state[user_session_id]:
 								st.session_state[user_session_id]['ready_to_process'] = False
 							st.session_state[user_session_id]['ready_to_process'] = False
+
+					exact_dups, near_dups = _handlers.find_duplicates(ref_files, user_session_id, 'reference')
+					if len(exact_dups) + len(near_dups) > 0:
+						st.markdown("---")
+						st.markdown(_warnings._23_content_duplicates([[doc.name for doc in group] for group in exact_dups], [[doc.name for doc in group] for group in near_dups]), unsafe_allow_html=True)
+						if st.toggle("Drop duplicates before processing (the first file of each group is kept)", value=True, key='drop_dups_reference'):
+							ref_files = _process.drop_duplicates(ref_files, exact_dups, near_dups)
+							dup_ids, dup_ref = _process.check_corpus(ref_files, check_ref=True, target_docs=metadata_target.get('docids')[0]['ids'])
+							if CHECK_SIZE == True:
+								corpus_size = sum(doc.size for doc in ref_files)
 												
 					if CHECK_SIZE == True:
 						if corpus_size > MAX_TEXT:
@@ -295,6 +414,9 @@ def main():
 							{len(ref_files)} reference corpus files ready to be processed! Use the button on the sidebar.
 							""")
 							st.session_state[user_session_id]['ready_to_process'] = True
+
+					if DESKTOP == False and st.session_state[user_session_id]['ready_to_process'] == True:
+						resume_jobs(user_session_id, 'reference', metadata_target.get('model')[0], docs=ref_files)
 	
 					if st.session_state[user_session_id]['ready_to_process'] == True:
 						st.sidebar.markdown("### Process Reference")
@@ -302,42 +424,34 @@ def main():
 						if st.sidebar.button("Process Reference Corpus"):
 							with st.sidebar:
 								with st.spinner('Processing corpus data...'):
-									models = load_models()
 									selected_dict = metadata_target.get('model')[0]
-									nlp = models[selected_dict]
+									# the reference is tagged with the tagsets of the target, so the two can be compared
+									profile = _handlers.corpus_profile(user_session_id)
+									nlp = load_model(selected_dict, profile)
+									job_id = _jobs.create_job(ref_files, user_session_id, 'reference', selected_dict, profile)
 
 									if ENABLE_DETECT == True:
 										detector = load_detector()
-										ref_corp, exceptions = _process.process_corpus_detect(ref_files, nlp, detector, Language.ENGLISH)
+										timings = []
+										ref_tokens, exceptions = _jobs.run_job(job_id, nlp, detector, Language.ENGLISH, batch_size=BATCH_SIZE, n_process=N_PROCESS, chunk_size=CHUNK_SIZE, cache_max_bytes=CACHE_MAX_BYTES, large_docs=LARGE_DOCS, timings=timings)
+										_handlers.update_language_report(timings, user_session_id, 'reference')
 									
 									if ENABLE_DETECT == False:
-										ref_corp, exceptions = _process.process_corpus(ref_files, nlp)
+										ref_tokens, exceptions = _jobs.run_job(job_id, nlp, batch_size=BATCH_SIZE, n_process=N_PROCESS, chunk_size=CHUNK_SIZE, cache_max_bytes=CACHE_MAX_BYTES, large_docs=LARGE_DOCS)
+									_jobs.remove_job(job_id)
+									_handlers.clear_spool(user_session_id, 'reference')
 								
-								if len(exceptions) > 0 and bool(ref_corp) == False:
+								if len(exceptions) > 0 and ref_tokens.is_empty() == True:
 									st.session_state[user_session_id]['warning'] = 11
 									exceptions = None
 									st.rerun()
 								
-								elif len(exceptions) > 0 and bool(ref_corp) == True:
+								elif len(exceptions) > 0 and ref_tokens.is_empty() == False:
 									st.session_state[user_session_id]['warning'] = 41
 									st.session_state[user_session_id]['ref_exceptions'] = exceptions
 
-									ds_tokens = _process.tokens_to_pl(ref_corp)
-									ft_pos, ft_ds = _analysis.frequency_tables_pl(ds_tokens)
-									tt_pos, tt_ds = _analysis.tag_tables_pl(ds_tokens)
-									dtm_pos, dtm_ds = _analysis.dtm_pl(ds_tokens)
-
-									_handlers.load_corpus_new(
-										ds_tokens,
-										dtm_ds,
-										dtm_pos,
-										ft_ds,
-										ft_pos,
-										tt_ds,
-										tt_pos,
-										user_session_id,
-										'reference'
-										)
+									corpus = _analysis.build_corpus_pl(_process.encode_tokens_pl(ref_tokens, TOKEN_ENCODING))
+									_handlers.load_corpus_new(corpus, user_session_id, 'reference')
 									_handlers.init_metadata_reference(user_session_id)
 									_handlers.update_session('has_reference', True, user_session_id)
 									st.rerun()
@@ -346,22 +460,8 @@ def main():
 									st.success('Processing complete!')
 									st.session_state[user_session_id]['warning'] = 0
 									
-									ds_tokens = _process.tokens_to_pl(ref_corp)
-									ft_pos, ft_ds = _analysis.frequency_tables_pl(ds_tokens)
-									tt_pos, tt_ds = _analysis.tag_tables_pl(ds_tokens)
-									dtm_pos, dtm_ds = _analysis.dtm_pl(ds_tokens)
-
-									_handlers.load_corpus_new(
-										ds_tokens,
-										dtm_ds,
-										dtm_pos,
-										ft_ds,
-										ft_pos,
-										tt_ds,
-										tt_pos,
-										user_session_id,
-										'reference'
-										)
+									corpus = _analysis.build_corpus_pl(_process.encode_tokens_pl(ref_tokens, TOKEN_ENCODING))
+									_handlers.load_corpus_new(corpus, user_session_id, 'reference')
 									_handlers.init_metadata_reference(user_session_id)
 									_handlers.update_session('has_reference', True, user_session_id)
 									st.rerun()
@@ -382,7 +482,7 @@ def main():
 				   					"This is the option you want if you're planning to explore your data outside of the tool, in coding enviroments like R or Python. The data include the token file, frequency tables, and document-term-matrices."])
 				
 				if data_select == "Corpus file only":
-					download_file = st.session_state[user_session_id]["target"]["ds_tokens"].to_pandas().to_parquet()
+					download_file = st.session_state[user_session_id]["target"]["ds_tokens"].drop("token_id", strict=False).to_pandas().to_parquet()
 					
 					st.markdown("---")
 					st.markdown("#### Click the button to download your corpus file.")
@@ -434,7 +534,7 @@ def main():
 										"This is the option you want if you're planning to explore your data outside of the tool, in coding enviroments like R or Python. The data include the token file, frequency tables, and document-term-matrices."])
 					
 					if data_select == "Corpus file only":
-						download_file = st.session_state[user_session_id]["reference"]["ds_tokens"].to_pandas().to_parquet()
+						download_file = st.session_state[user_session_id]["reference"]["ds_tokens"].drop("token_id", strict=False).to_pandas().to_parquet()
 						
 						st.markdown("---")
 						st.markdown("#### Click the button to download your corpus file.")
@@ -479,6 +579,7 @@ def main():
 		st.sidebar.markdown('### Reset all tools and files:')
 		st.sidebar.markdown(":warning: Using the **reset** button will cause all files, tables, and plots to be cleared.")
 		if st.sidebar.button("Reset Corpus"):
+			_handlers.clear_spool(user_session_id)
 			st.session_state[user_session_id] = {}
 			_handlers.generate_temp(_states.STATES.items(), user_session_id)
 			_handlers.init_session(user_session_id)
@@ -504,6 +605,8 @@ def main():
 
 		st.markdown("---")
 
+		resume_jobs(user_session_id, 'target')
+
 		st.markdown("### Process a corpus:")
 		
 		corpus_source = st.radio("What kind of corpus would you like to prepare?",
@@ -585,22 +688,8 @@ def main():
 				st.sidebar.markdown("Once you have selected a file, use the button to process your corpus.")
 
 				if st.sidebar.button("Load Target Corpus"):
-					ds_tokens = tok_pl
-					ft_pos, ft_ds = _analysis.frequency_tables_pl(ds_tokens)
-					tt_pos, tt_ds = _analysis.tag_tables_pl(ds_tokens)
-					dtm_pos, dtm_ds = _analysis.dtm_pl(ds_tokens)
-
-					_handlers.load_corpus_new(
-						ds_tokens,
-						dtm_ds,
-						dtm_pos,
-						ft_ds,
-						ft_pos,
-						tt_ds,
-						tt_pos,
-						user_session_id,
-						'target'
-						)
+					corpus = _analysis.build_corpus_pl(_process.encode_tokens_pl(tok_pl, TOKEN_ENCODING))
+					_handlers.load_corpus_new(corpus, user_session_id, 'target')
 					_handlers.init_metadata_target(user_session_id)
 					_handlers.update_session('has_target', True, user_session_id)
 					st.sidebar.markdown("---")
@@ -617,25 +706,36 @@ def main():
 			st.markdown(_messages.message_load_target_new)
 							
 			with st.form("corpus-form", clear_on_submit=True):
-				corp_files = st.file_uploader("Upload your target corpus", type=["txt"], accept_multiple_files=True)
+				corp_files = st.file_uploader("Upload your target corpus", type=TEXT_TYPES, accept_multiple_files=True)
+				folder_cats = st.checkbox("Use sub-folder names in archives as document categories", key='folder_cats')
 				submitted = st.form_submit_button("UPLOAD TARGET")
 
 				if submitted:
 					st.session_state[user_session_id]['warning'] = 0
 				
 				if CHECK_SIZE == True:
-					dup_ids, corpus_size = _process.check_corpus(corp_files, check_size=True)
+					corp_files, dup_ids, dup_docs, corpus_size = _handlers.spool_uploads(corp_files, user_session_id, 'target', folder_categories=folder_cats, max_bytes=MAX_TEXT)
 					if 'ready_to_process' not in st.session_state[user_session_id]:
 						st.session_state[user_session_id]['ready_to_process'] = False
 					st.session_state[user_session_id]['ready_to_process'] = False
 					
 				if CHECK_SIZE == False:
-					dup_ids = _process.check_corpus(corp_files)
+					corp_files, dup_ids, dup_docs, corpus_size = _handlers.spool_uploads(corp_files, user_session_id, 'target', folder_categories=folder_cats)
 					corpus_size = 0
 					if 'ready_to_process' not in st.session_state[user_session_id]:
 						st.session_state[user_session_id]['ready_to_process'] = False
 					st.session_state[user_session_id]['ready_to_process'] = False
 
+			exact_dups, near_dups = _handlers.find_duplicates(corp_files, user_session_id, 'target')
+			if len(exact_dups) + len(near_dups) > 0:
+				st.markdown("---")
+				st.markdown(_warnings._23_content_duplicates([[doc.name for doc in group] for group in exact_dups], [[doc.name for doc in group] for group in near_dups]), unsafe_allow_html=True)
+				if st.toggle("Drop duplicates before processing (the first file of each group is kept)", value=True, key='drop_dups_target'):
+					corp_files = _process.drop_duplicates(corp_files, exact_dups, near_dups)
+					dup_ids = _process.check_corpus(corp_files)
+					if CHECK_SIZE == True:
+						corpus_size = sum(doc.size for doc in corp_files)
+
 			if CHECK_SIZE == True:
 					if corpus_size > MAX_TEXT:
 						st.markdown(_warnings._30_corpus_size, unsafe_allow_html=True)
@@ -658,11 +758,14 @@ def main():
 					""")
 					st.session_state[user_session_id]['ready_to_process'] = True	
 
+			if DESKTOP == False and st.session_state[user_session_id]['ready_to_process'] == True:
+				resume_jobs(user_session_id, 'target', docs=corp_files)
+
 			st.sidebar.markdown("### Models")
-			models = load_models()
 			selected_dict = st.sidebar.selectbox("Select a DocuScope model:", options=["Large Dictionary", "Common Dictionary"])
-			nlp = models[selected_dict]
 			st.session_state[user_session_id]['model'] = selected_dict
+			selected_profile = st.sidebar.radio("Select tagsets to process:", list(PROFILE_NAMES.keys()), index=list(PROFILE_NAMES.values()).index(PIPE_PROFILE), horizontal=True)
+			profile = PROFILE_NAMES[selected_profile]
 		
 			with st.sidebar.expander("Which model do I choose?"):
 				st.markdown(_messages.message_models)		
@@ -675,37 +778,30 @@ def main():
 				if st.sidebar.button("Process Target"):
 					with st.sidebar:
 						with st.spinner('Processing corpus data...'):
+							nlp = load_model(selected_dict, profile)
+							# tagged documents are checkpointed, so an interrupted run can be resumed
+							job_id = _jobs.create_job(corp_files, user_session_id, 'target', selected_dict, profile)
 							if ENABLE_DETECT == True:
 								detector = load_detector()
-								corp, exceptions = _process.process_corpus_detect(corp_files, nlp, detector, Language.ENGLISH)
+								timings = []
+								corp_tokens, exceptions = _jobs.run_job(job_id, nlp, detector, Language.ENGLISH, batch_size=BATCH_SIZE, n_process=N_PROCESS, chunk_size=CHUNK_SIZE, cache_max_bytes=CACHE_MAX_BYTES, large_docs=LARGE_DOCS, timings=timings)
+								_handlers.update_language_report(timings, user_session_id, 'target')
 
 							if ENABLE_DETECT == False:
-								corp, exceptions = _process.process_corpus(corp_files, nlp)
+								corp_tokens, exceptions = _jobs.run_job(job_id, nlp, batch_size=BATCH_SIZE, n_process=N_PROCESS, chunk_size=CHUNK_SIZE, cache_max_bytes=CACHE_MAX_BYTES, large_docs=LARGE_DOCS)
+							_jobs.remove_job(job_id)
+							_handlers.clear_spool(user_session_id, 'target')
 						
-						if len(exceptions) > 0 and bool(corp) == False:
+						if len(exceptions) > 0 and corp_tokens.is_empty() == True:
 							st.session_state[user_session_id]['warning'] = 10
 							st.rerun()
 						
-						elif len(exceptions) > 0 and bool(corp) == True:
+						elif len(exceptions) > 0 and corp_tokens.is_empty() == False:
 							st.session_state[user_session_id]['warning'] = 40
 							st.session_state[user_session_id]['exceptions'] = exceptions
 
-							ds_tokens = _process.tokens_to_pl(corp)
-							ft_pos, ft_ds = _analysis.frequency_tables_pl(ds_tokens)
-							tt_pos, tt_ds = _analysis.tag_tables_pl(ds_tokens)
-							dtm_pos, dtm_ds = _analysis.dtm_pl(ds_tokens)
-
-							_handlers.load_corpus_new(
-								ds_tokens,
-								dtm_ds,
-								dtm_pos,
-								ft_ds,
-								ft_pos,
-								tt_ds,
-								tt_pos,
-								user_session_id,
-								'target'
-								)
+							corpus = _analysis.build_corpus_pl(_process.encode_tokens_pl(corp_tokens, TOKEN_ENCODING))
+							_handlers.load_corpus_new(corpus, user_session_id, 'target')
 							_handlers.init_metadata_target(user_session_id)
 							_handlers.update_session('has_target', True, user_session_id)
 							st.rerun()
@@ -714,22 +810,8 @@ def main():
 							st.success('Processing complete!')
 							st.session_state[user_session_id]['warning'] = 0
 
-							ds_tokens = _process.tokens_to_pl(corp)
-							ft_pos, ft_ds = _analysis.frequency_tables_pl(ds_tokens)
-							tt_pos, tt_ds = _analysis.tag_tables_pl(ds_tokens)
-							dtm_pos, dtm_ds = _analysis.dtm_pl(ds_tokens)
-
-							_handlers.load_corpus_new(
-								ds_tokens,
-								dtm_ds,
-								dtm_pos,
-								ft_ds,
-								ft_pos,
-								tt_ds,
-								tt_pos,
-								user_session_id,
-								'target'
-								)
+							corpus = _analysis.build_corpus_pl(_process.encode_tokens_pl(corp_tokens, TOKEN_ENCODING))
+							_handlers.load_corpus_new(corpus, user_session_id, 'target')
 							_handlers.init_metadata_target(user_session_id)
 							_handlers.update_session('has_target', True, user_session_id)
 							st.rerun()
@@ -136,7 +136,7 @@ def main():
 
 			st.sidebar.markdown("---")
 
-			tag_radio = st.sidebar.radio("Select a tagset:", ("Parts-of-Speech", "DocuScope"), horizontal=True)
+			tag_radio = st.sidebar.radio("Select a tagset:", _handlers.tagset_choices(("Parts-of-Speech", "DocuScope"), user_session_id), horizontal=True)
 			if tag_radio == 'Parts-of-Speech':
 				ts = 'pos'
 			if tag_radio == 'DocuScope':
@@ -153,7 +153,7 @@ def main():
 					with st.sidebar:
 						with st.spinner('Processing n-grams...'):
 							tok_pl = st.session_state[user_session_id]["target"]["ds_tokens"]
-							ngram_df = _analysis.ngrams_pl(tok_pl, ngram_span, count_by=ts)
+							ngram_df = _analysis.ngrams_pl(tok_pl, ngram_span, count_by=ts, span_tables=_handlers.get_span_tables(user_session_id))
 					
 					#cap size of dataframe
 					if ngram_df.height < 2:
@@ -188,7 +188,7 @@ def main():
 				else:
 					search = "contains"
 				
-				tag_radio = st.sidebar.radio("Select a tagset:", ("Parts-of-Speech", "DocuScope"), horizontal=True)
+				tag_radio = st.sidebar.radio("Select a tagset:", _handlers.tagset_choices(("Parts-of-Speech", "DocuScope"), user_session_id), horizontal=True)
 				
 				if tag_radio == 'Parts-of-Speech':
 					ts = 'pos'
@@ -196,7 +196,7 @@ def main():
 					ts = 'ds'
 				
 			if from_anchor == 'Tag':
-				tag_radio = st.sidebar.radio("Select a tagset:", ("Parts-of-Speech", "DocuScope"), horizontal=True)
+				tag_radio = st.sidebar.radio("Select a tagset:", _handlers.tagset_choices(("Parts-of-Speech", "DocuScope"), user_session_id), horizontal=True)
 				
 				if tag_radio == 'Parts-of-Speech':
 					if session.get('has_target')[0] == False:
@@ -238,10 +238,10 @@ def main():
 							tok_pl = st.session_state[user_session_id]["target"]["ds_tokens"]
 
 							if from_anchor == 'Token':
-								ngram_df = _analysis.ngrams_by_token_pl(tok_pl, node_word, position, ngram_span, search, ts)
+								ngram_df = _analysis.ngrams_by_token_pl(tok_pl, node_word, position, ngram_span, search, ts, span_tables=_handlers.get_span_tables(user_session_id))
 								#cap size of dataframe
 							if from_anchor == 'Tag':
-								ngram_df = _analysis.ngrams_by_tag_pl(tok_pl, tag, position, ngram_span, ts)
+								ngram_df = _analysis.ngrams_by_tag_pl(tok_pl, tag, position, ngram_span, ts, span_tables=_handlers.get_span_tables(user_session_id))
 					
 					#cap size of dataframe
 					if ngram_df is None or ngram_df.height == 0:
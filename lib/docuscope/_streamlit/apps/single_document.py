@@ -56,7 +56,7 @@ def main():
 		with st.sidebar.expander("About general tags"):
 			st.markdown(_messages.message_general_tags)		
 
-		tag_radio = st.sidebar.radio("Select tags to display:", ("Parts-of-Speech", "DocuScope"), key = _handlers.persist("sd_radio", pathlib.Path(__file__).stem, user_session_id), horizontal=True)
+		tag_radio = st.sidebar.radio("Select tags to display:", _handlers.tagset_choices(("Parts-of-Speech", "DocuScope"), user_session_id, "sd_radio"), key = _handlers.persist("sd_radio", pathlib.Path(__file__).stem, user_session_id), horizontal=True)
 	
 		if tag_radio == 'Parts-of-Speech':
 			tag_type = st.sidebar.radio("Select from general or specific tags", ("General", "Specific"), horizontal=True)
@@ -233,7 +233,7 @@ def main():
 			else:
 				tok_pl = st.session_state[user_session_id]["target"]["ds_tokens"]
 
-				doc_pos, doc_simple, doc_ds = _analysis.html_build_pl(tok_pl, doc_key)
+				doc_pos, doc_simple, doc_ds = _analysis.html_build_pl(tok_pl, doc_key, _handlers.get_span_tables(user_session_id), st.session_state[user_session_id]["target"].get("doc_offsets"))
 				
 				if "doc_pos" not in st.session_state[user_session_id]["target"]:
 					st.session_state[user_session_id]["target"]["doc_pos"] = {}
@@ -48,9 +48,11 @@ def main():
 	
 		_handlers.load_widget_state(pathlib.Path(__file__).stem, user_session_id)
 		metadata_target = _handlers.load_metadata('target', user_session_id)
+		with st.spinner('Updating dispersions...'):
+			_handlers.update_dispersions(user_session_id)
 
 		st.sidebar.markdown("### Tagset")
-		tag_radio = st.sidebar.radio("Select tags to display:", ("Parts-of-Speech", "DocuScope"), key = _handlers.persist("tt_radio", pathlib.Path(__file__).stem, user_session_id), horizontal=True)
+		tag_radio = st.sidebar.radio("Select tags to display:", _handlers.tagset_choices(("Parts-of-Speech", "DocuScope"), user_session_id, "tt_radio"), key = _handlers.persist("tt_radio", pathlib.Path(__file__).stem, user_session_id), horizontal=True)
 		if tag_radio == 'Parts-of-Speech':
 			tag_type = st.sidebar.radio("Select from general or specific tags", ("General", "Specific"), horizontal=True)			
 			if tag_type == 'General':
@@ -73,10 +75,19 @@ def main():
 		if len(filter_vals) > 0:
 			df = df.filter(pl.col("Tag").is_in(filter_vals))
 
+		# the dispersion measures are stored with the table, so filtering on them does not recount the corpus
+		if "DP" in df.columns:
+			dp_range = st.slider("Filter by dispersion (Gries' DP):", 0.0, 1.0, (0.0, 1.0), step=0.01)
+			if dp_range != (0.0, 1.0):
+				df = df.filter(pl.col("DP").is_between(dp_range[0], dp_range[1]))
+
 		st.dataframe(df, hide_index=True, 
 				column_config={
 					"Range": st.column_config.NumberColumn(format="%.2f %%"),
-					"RF": st.column_config.NumberColumn(format="%.2f")}
+					"RF": st.column_config.NumberColumn(format="%.2f"),
+					"DP": st.column_config.NumberColumn(format="%.3f"),
+					"D": st.column_config.NumberColumn(format="%.3f"),
+					"D2": st.column_config.NumberColumn(format="%.3f")}
 		)
 	
 		st.sidebar.markdown("---")
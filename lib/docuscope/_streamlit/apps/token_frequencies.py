@@ -47,10 +47,12 @@ def main():
 	
 		_handlers.load_widget_state(pathlib.Path(__file__).stem, user_session_id)
 		metadata_target = _handlers.load_metadata('target', user_session_id)
+		with st.spinner('Updating dispersions...'):
+			_handlers.update_dispersions(user_session_id)
 						
 		st.sidebar.markdown("### Tagset")
 
-		tag_radio = st.sidebar.radio("Select tags to display:", ("Parts-of-Speech", "DocuScope"), key = _handlers.persist("ft_radio", pathlib.Path(__file__).stem, user_session_id), horizontal=True)
+		tag_radio = st.sidebar.radio("Select tags to display:", _handlers.tagset_choices(("Parts-of-Speech", "DocuScope"), user_session_id, "ft_radio"), key = _handlers.persist("ft_radio", pathlib.Path(__file__).stem, user_session_id), horizontal=True)
 		if tag_radio == 'Parts-of-Speech':
 			tag_type = st.sidebar.radio("Select from general or specific tags", ("General", "Specific"), horizontal=True)			
 			if tag_type == 'General':
@@ -72,10 +74,19 @@ def main():
 		if len(filter_vals) > 0:
 			df = df.filter(pl.col("Tag").is_in(filter_vals))
 
+		# the dispersion measures are stored with the table, so filtering on them does not recount the corpus
+		if "DP" in df.columns:
+			dp_range = st.slider("Filter by dispersion (Gries' DP):", 0.0, 1.0, (0.0, 1.0), step=0.01)
+			if dp_range != (0.0, 1.0):
+				df = df.filter(pl.col("DP").is_between(dp_range[0], dp_range[1]))
+
 		st.dataframe(df, hide_index=True, 
 				column_config={
 					"Range": st.column_config.NumberColumn(format="%.2f %%"),
-					"RF": st.column_config.NumberColumn(format="%.2f")}
+					"RF": st.column_config.NumberColumn(format="%.2f"),
+					"DP": st.column_config.NumberColumn(format="%.3f"),
+					"D": st.column_config.NumberColumn(format="%.3f"),
+					"D2": st.column_config.NumberColumn(format="%.3f")}
 		)
 				
 		with st.expander("Column explanation"):
@@ -96,6 +107,34 @@ def main():
 						mime="application/vnd.ms-excel",
 						)
 		st.sidebar.markdown("---")
+
+		# token-level document-term matrix for the selected tagset, kept sparse from the span tables to the file
+		download_dtm = st.sidebar.toggle("Download document-term matrix?")
+		if download_dtm == True:
+			with st.sidebar:
+				st.markdown(_messages.message_download_dtm)
+				dtm_format = st.radio("Select a format:", (".npz", "Parquet"), horizontal=True)
+				dtm_weight = st.radio("Select a weighting:", ("Counts", "Proportions", "Scaled (not centered)", "TF-IDF"), horizontal=True)
+				if st.button("Generate matrix"):
+					with st.spinner('Building matrix...'):
+						count_by = 'pos' if tag_radio == 'Parts-of-Speech' else 'ds'
+						dtm, docs, types = _analysis.sparse_dtm_pl(st.session_state[user_session_id]["target"]["ds_tokens"], count_by, _handlers.get_span_tables(user_session_id))
+						schemes = {"Proportions": "prop", "Scaled (not centered)": "scale", "TF-IDF": "tfidf"}
+						if dtm_weight in schemes:
+							dtm = _analysis.sparse_dtm_weight(dtm, schemes[dtm_weight])
+						if dtm_format == ".npz":
+							download_file = _handlers.convert_sparse_dtm_to_npz(dtm, docs, types)
+							file_name = "token_dtm.npz"
+						else:
+							download_file = _handlers.convert_sparse_dtm_to_parquet(dtm, docs, types)
+							file_name = "token_dtm.parquet"
+					st.download_button(
+						label="Download matrix",
+						data=download_file,
+						file_name=file_name,
+						mime="application/octet-stream",
+						)
+			st.sidebar.markdown("---")
 				
 	else:
 		st.markdown(_messages.message_tables)
@@ -13,11 +13,16 @@
 
 # pylint: disable = protected-access
 
+import pathlib
+
 from docuscope._imports import streamlit as st
 from docuscope._imports import st_runtime
 
 from . import patches
 
+HERE = pathlib.Path(__file__).parents[1].resolve()
+OPTIONS = str(HERE.joinpath("options.toml"))
+
 def main(args):
     start_streamlit_server(args.path, {})
 
@@ -25,6 +30,19 @@ def main(args):
 def start_streamlit_server(script_path, config):
     st.web.bootstrap.load_config_options(flag_options=config)
     patches.apply_streamlit_server_patches()
+    warm_up_models()
 
     st_runtime.exists()
     st.web.bootstrap.run(script_path, args=[], flag_options={}, is_hello=False)
+
+
+def warm_up_models():
+    """Start loading the models listed in warm_up_models (options.toml) on a background thread"""
+    from docuscope._streamlit.utilities import handlers_imports, handlers_models
+
+    options = handlers_imports.import_options_general(OPTIONS)
+    model_names = options["global"].get("warm_up_models", [])
+    if len(model_names) > 0:
+        handlers_models.warm_up(
+            model_names, options["global"].get("pipe_profile", "full")
+        )
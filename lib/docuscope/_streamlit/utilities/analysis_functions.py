@@ -13,17 +13,19 @@
 # limitations under the License.
 
 import altair as alt
+import io
 import numpy as np
 import pandas as pd
 import polars as pl
 import scipy
 from sklearn import decomposition
+import zipfile
 
 def subset_pl(tok_pl, select_ids: list):
 	token_subset = (
 		tok_pl
 		.with_columns(
-			pl.col("doc_id").str.split_exact("_", 0)
+			pl.col("doc_id").cast(pl.String).str.split_exact("_", 0)
 			.struct.rename_fields(["cat_id"])
 			.alias("id")
 		)
@@ -33,217 +35,747 @@ def subset_pl(tok_pl, select_ids: list):
 		)
 	return(token_subset)
 
-def frequency_tables_pl(tok_pl):
+def subset_span_tables_pl(span_tables, select_ids: list):
+	# the span tables (see span_tables_pl) of the documents in the categories select_ids
+	if span_tables is None:
+		return(None)
+	pos_spans, ds_spans, span_vocab = span_tables
+	return((subset_pl(pos_spans, select_ids), subset_pl(ds_spans, select_ids), span_vocab))
+
+DISPERSIONS = ["DP", "D", "D2"]
+
+def summarize_counts_pl(df, keys: list, dispersion=False):
+	# absolute frequency (AF) and range of each key from per-document counts (doc_id, keys, len) in long format
+	# Range is the percentage of the documents in df that contain the key
+	# grouping the counts keeps the cost proportional to the number of counts, where a pivot on doc_id would make one column per document
+	# dispersion=True adds Gries' DP, Juilland's D and Carroll's D2, with each document's size taken as the sum of its counts
+	# documents without the key contribute only through their size, so the measures are put together from sums over the counts that exist
+	df = (
+		df
+		.with_columns(
+			pl.col("doc_id").n_unique().alias("ndocs")
+		)
+		)
+	aggs = [
+		pl.col("len").sum().cast(pl.UInt32).alias("AF"),
+		pl.col("doc_id").n_unique().alias("Range"),
+		pl.col("ndocs").first()
+	]
+	if dispersion == True:
+		df = (
+			df
+			.with_columns(
+				pl.col("len").sum().over("doc_id").alias("size")
+			)
+			.with_columns(
+				# share of the corpus and relative frequency of the key in each document
+				pl.col("size").truediv(pl.col("len").sum()).alias("share"),
+				pl.col("len").truediv(pl.col("size")).alias("p")
+			)
+			)
+		aggs += [
+			# DP is half the sum of |v/f - s| over all documents; a document without the key adds its share s
+			pl.col("len").truediv(pl.col("len").sum()).sub(pl.col("share")).abs().sub(pl.col("share")).sum().alias("DP"),
+			pl.col("p").sum().alias("p_sum"),
+			pl.col("p").pow(2).sum().alias("p_sq"),
+			pl.col("p").mul(pl.col("p").log(2)).sum().alias("p_log")
+		]
+	df = (
+		df
+		.group_by(keys)
+		.agg(aggs)
+		# normalize over total documents in corpus
+		.with_columns(
+			pl.col("Range").truediv(pl.col("ndocs")).mul(100)
+		)
+		)
+	if dispersion == True:
+		ndocs = pl.col("ndocs").cast(pl.Float64)
+		mean = pl.col("p_sum").truediv(ndocs)
+		sd = pl.col("p_sq").truediv(ndocs).sub(mean.pow(2)).clip(lower_bound=0).sqrt()
+		df = (
+			df
+			.with_columns(
+				pl.col("DP").add(1).mul(0.5),
+				# Juilland's D from the coefficient of variation and Carroll's D2 from the entropy of the relative frequencies
+				pl.when(ndocs > 1).then(sd.truediv(mean).truediv(ndocs.sub(1).sqrt()).neg().add(1)).alias("D"),
+				pl.when(ndocs > 1).then(pl.col("p_sum").log(2).sub(pl.col("p_log").truediv(pl.col("p_sum"))).truediv(ndocs.log(2))).alias("D2")
+			)
+			)
+		return(df.select(keys + ["AF", "Range"] + DISPERSIONS))
+	return(df.select(keys + ["AF", "Range"]))
+
+def update_dispersions_pl(corpus):
+	# DP, D and D2 cannot be merged like AF and Range, because every document's share of the corpus changes
+	# when documents are added or removed; they are computed again from the corpus' per-document counts
+	# adding and removing documents drops them, and this is run once when a view that shows them is next opened
+	tables = ["ft_pos", "ft_ds", "tt_pos", "tt_ds"]
+	if "pos_spans" in corpus:
+		span_tables = (corpus["pos_spans"], corpus["ds_spans"], corpus["span_vocab"])
+	else:
+		span_tables = span_tables_pl(corpus["ds_tokens"])
+	span_counts = tuple(counts.cache() for counts in span_counts_pl(span_tables))
+	counts = pl.collect_all(
+		list(token_counts_pl(None, span_tables, span_counts, lazy=True)) +
+		list(tag_counts_pl(None, span_tables, span_counts, lazy=True))
+		)
+	updated = {}
+	for table, df in zip(tables, counts):
+		keys = [col for col in ["Token", "Tag"] if col in corpus[table].columns]
+		updated[table] = (
+			corpus[table]
+			.drop(DISPERSIONS, strict=False)
+			.join(summarize_counts_pl(df, keys, dispersion=True).select(keys + DISPERSIONS), on=keys, how="left")
+			)
+	return(updated)
+
+def frequency_tables_pl(tok_pl, span_tables=None, counts=None):
 	
 	def summarize_counts(df):
 			df = (
-				df
-				.pivot(index="Token", on="doc_id", values="len", aggregate_function="sum")
-				.with_columns(
-					pl.all().exclude("Token").cast(pl.UInt32, strict=True)
-				)
-				# calculate range
-				.with_columns(
-					pl.sum_horizontal(pl.selectors.numeric().is_not_null())
-					.alias("Range")
-				)
-				.with_columns(
-					pl.selectors.numeric().fill_null(strategy="zero")
-				)
-				# normalize over total documents in corpus
-				.with_columns(
-						pl.col("Range").truediv(pl.sum_horizontal(pl.selectors.numeric().exclude("Range").is_not_null())).mul(100)
-				)
-				# calculate absolute frequency
-				.with_columns(
-					pl.sum_horizontal(pl.selectors.numeric().exclude("Range"))
-					.alias("AF")
-				)
-				.sort("AF", descending = True)
-				.select(["Token", "AF", "Range"])
+				summarize_counts_pl(df, ["Token", "Tag"], dispersion=True)
 				# calculate relative frequency
 				.with_columns(
 					pl.col("AF").truediv(pl.sum("AF")).mul(1000000)
 					.alias("RF")
 				)
-				# format data
-				.unnest("Token")
-				.select(["Token", "Tag", "AF", "RF", "Range"])
+				.select(["Token", "Tag", "AF", "RF", "Range"] + DISPERSIONS)
 				)
 			return(df)
 	
-	# format tokens and sum by doc_id
-	df_pos = (
+	# format tokens and sum by doc_id, unless the counts have already been made (see build_corpus_pl)
+	if counts is None:
+		counts = token_counts_pl(tok_pl, span_tables)
+	df_pos, df_ds = counts
+	
+	df_pos = summarize_counts(df_pos).sort(["AF", "Token", "Tag"], descending=[True, False, False])
+	
+	df_ds = summarize_counts(df_ds).sort(["AF", "Token", "Tag"], descending=[True, False, False])
+
+	return(df_pos, df_ds)
+
+def vocab_pl(tok_pl, vocab=None):
+	# integer token vocabulary (token_id, token, lower): each distinct surface form is stored once, with its lowercased form
+	# returns ds_tokens with a token_id column and the vocabulary; a vocabulary that is passed in is extended with any new tokens
+	if vocab is not None and "token_id" in tok_pl.columns:
+		return(tok_pl, vocab)
+	if vocab is None:
+		vocab = pl.DataFrame(schema=[("token_id", pl.UInt32), ("token", pl.String), ("lower", pl.String)])
+	new_tokens = (
 		tok_pl
-		.group_by(["doc_id", "pos_id", "pos_tag"], maintain_order = True)
-		.agg(
-			pl.col("token").str.concat("")
-		)
+		.select(pl.col("token").unique(maintain_order = True))
+		.join(vocab, on="token", how="anti")
+		.with_row_index("token_id", offset=vocab.height)
 		.with_columns(
-			pl.col("token").str.to_lowercase().str.strip_chars())
-		.filter(
-			pl.col("pos_tag") != "Y"
+			pl.col("token").str.to_lowercase().str.strip_chars().alias("lower")
 		)
-		.rename({"pos_tag": "Tag"})
-		.rename({"token": "Token"})
-		.group_by(["doc_id", "Token", "Tag"]).len()
-		.with_columns(
-			pl.struct(["Token", "Tag"])
 		)
-		.select(pl.exclude("Tag"))
+	vocab = pl.concat([vocab, new_tokens])
+	tok_pl = (
+		tok_pl
+		.drop("token_id", strict=False)
+		.join(vocab.select(["token", "token_id"]), on="token", how="left")
 		)
-	
-	df_pos = summarize_counts(df_pos).sort(["AF", "Token"], descending=[True, False])
-   
-	df_ds = (
+	return(tok_pl, vocab)
+
+def span_tables_pl(tok_pl, vocab=None):
+	# the part-of-speech and DocuScope spans of a corpus, built once when it is loaded and read by the analysis functions
+	# pos_spans: doc_id, pos_id, pos_tag, span_id, lower_id, start, length (in corpus order)
+	# ds_spans: doc_id, ds_id, ds_tag, span_id, lower_id, start, length
+	# span_vocab: span_id, text (as in the document), lower_id, lower (lowercased and stripped), shared by both tagsets
+	# start and length locate a span's tokens in ds_tokens; its text is put together from the token vocabulary
+	# once per distinct sequence of token ids, not once per span
+	tok_pl, vocab = vocab_pl(tok_pl, vocab)
+	tok_pl = tok_pl.with_row_index("start")
+	span_keys = [["doc_id", "pos_id", "pos_tag"], ["doc_id", "ds_id", "ds_tag"]]
+	spans = [
 		tok_pl
-		.group_by(["doc_id", "ds_id", "ds_tag"], maintain_order = True)
+		.group_by(keys, maintain_order = True)
 		.agg(
-			pl.col("token").str.concat("")
+			pl.col("token_id"),
+			pl.col("start").first(),
+			pl.len().alias("length")
+		)
+		for keys in span_keys
+	]
+	sequences = (
+		pl.concat([df.select("token_id").with_row_index("row").with_columns(pl.lit(i, pl.UInt8).alias("table")) for i, df in enumerate(spans)])
+		.group_by("token_id")
+		.agg(
+			pl.col(["table", "row"])
+		)
+		.with_row_index("sequence")
+		)
+	texts = (
+		sequences
+		.select(["sequence", "token_id"])
+		.explode("token_id")
+		.join(vocab.select(["token_id", "token"]), on="token_id", how="left")
+		.group_by("sequence", maintain_order = True)
+		.agg(
+			pl.col("token").str.concat("").alias("text")
+		)
+		)
+	span_vocab = extend_span_vocab_pl(None, texts.get_column("text"))
+	ids = (
+		sequences
+		.select(["sequence", "table", "row"])
+		.join(texts.join(span_vocab.select(["text", "span_id", "lower_id"]), on="text"), on="sequence")
+		.explode(["table", "row"])
+		.sort(["table", "row"])
+		)
+	span_tables = []
+	for i, keys in enumerate(span_keys):
+		table_ids = ids.filter(pl.col("table") == i)
+		span_tables.append(
+			spans[i]
+			.with_columns(
+				table_ids.get_column("span_id"),
+				table_ids.get_column("lower_id")
+			)
+			.select(keys + ["span_id", "lower_id", "start", "length"])
+			)
+	return(span_tables[0], span_tables[1], span_vocab)
+
+def extend_span_vocab_pl(span_vocab, texts):
+	# adds new span texts to a span vocabulary; existing ids do not change
+	# lower_id is the first span_id with the same lowercased text, so it is also stable when the vocabulary grows
+	if span_vocab is None:
+		span_vocab = pl.DataFrame(schema=[("span_id", pl.UInt32), ("text", pl.String), ("lower_id", pl.UInt32), ("lower", pl.String)])
+	new_texts = (
+		pl.DataFrame({"text": texts}, schema={"text": pl.String})
+		.unique(maintain_order = True)
+		.join(span_vocab, on="text", how="anti")
+		.with_row_index("span_id", offset=span_vocab.height)
+		.with_columns(
+			pl.col("text").str.to_lowercase().str.strip_chars().alias("lower")
+		)
 		)
+	span_vocab = (
+		pl.concat([span_vocab.drop("lower_id"), new_texts.select(["span_id", "text", "lower"])])
 		.with_columns(
-			pl.col("token").str.to_lowercase().str.strip_chars())
+			pl.col("span_id").min().over("lower").alias("lower_id")
+		)
+		.select(["span_id", "text", "lower_id", "lower"])
+		)
+	return(span_vocab)
+
+def merge_span_tables_pl(span_tables, new_tables):
+	# appends the span tables of new documents (see span_tables_pl) to those of a loaded corpus,
+	# mapping the new spans onto the corpus' span vocabulary; start is recounted over the combined, doc_id-sorted tables
+	pos_spans, ds_spans, span_vocab = span_tables
+	new_pos, new_ds, new_vocab = new_tables
+	span_vocab = extend_span_vocab_pl(span_vocab, new_vocab.get_column("text"))
+	mapping = (
+		new_vocab
+		.select(["span_id", "text"])
+		.join(span_vocab.select(["text", pl.col("span_id").alias("new_span_id"), "lower_id"]), on="text")
+		)
+	def merge(spans, new_spans):
+		new_spans = (
+			new_spans
+			.with_columns(
+				pl.col("span_id").replace_strict(mapping.get_column("span_id"), mapping.get_column("lower_id")).alias("lower_id"),
+				pl.col("span_id").replace_strict(mapping.get_column("span_id"), mapping.get_column("new_span_id"))
+			)
+			)
+		return(
+			pl.concat([spans, new_spans])
+			.sort(pl.col("doc_id").cast(pl.String), maintain_order=True)
+			.with_columns(
+				pl.col("length").cum_sum().sub(pl.col("length")).cast(pl.UInt32).alias("start")
+			)
+			)
+	return(merge(pos_spans, new_pos), merge(ds_spans, new_ds), span_vocab)
+
+def sort_tokens_pl(tok_pl):
+	# ds_tokens is kept sorted by doc_id, so that each document is one run of rows (see doc_offsets_pl)
+	if tok_pl.get_column("doc_id").cast(pl.String).is_sorted():
+		return(tok_pl)
+	return(tok_pl.sort(pl.col("doc_id").cast(pl.String), maintain_order=True))
+
+def doc_offsets_pl(tok_pl, span_tables=None):
+	# CSR-style index of a doc_id-sorted corpus: the rows [start, end) that each document takes up
+	# in ds_tokens (token_start, token_end) and in the span tables (pos_start, pos_end, ds_start, ds_end)
+	tables = [("token", tok_pl)]
+	if span_tables is not None:
+		tables += [("pos", span_tables[0]), ("ds", span_tables[1])]
+	doc_offsets = None
+	for prefix, df in tables:
+		lengths = (
+			df
+			.group_by(pl.col("doc_id").cast(pl.String), maintain_order = True).len(name=f"{prefix}_end")
+			.with_columns(pl.lit(0, pl.UInt32).alias(f"{prefix}_start"))
+			)
+		doc_offsets = lengths if doc_offsets is None else doc_offsets.join(lengths, on="doc_id", how="left")
+	return(merge_doc_offsets_pl(doc_offsets))
+
+def merge_doc_offsets_pl(doc_offsets, new_offsets=None, remove_ids=None):
+	# drops removed documents and appends new ones, then counts the rows of each document again in doc_id order
+	if remove_ids is not None:
+		doc_offsets = doc_offsets.filter(pl.col("doc_id").is_in(remove_ids).not_())
+	if new_offsets is not None:
+		doc_offsets = pl.concat([doc_offsets, new_offsets]).sort("doc_id", maintain_order=True)
+	prefixes = [col.removesuffix("_start") for col in doc_offsets.columns if col.endswith("_start")]
+	length = {prefix: pl.col(f"{prefix}_end").sub(pl.col(f"{prefix}_start")) for prefix in prefixes}
+	doc_offsets = (
+		doc_offsets
+		.with_columns(
+			[length[prefix].cum_sum().sub(length[prefix]).cast(pl.UInt32).alias(f"{prefix}_start") for prefix in prefixes] +
+			[length[prefix].cum_sum().cast(pl.UInt32).alias(f"{prefix}_end") for prefix in prefixes]
+		)
+		.select(["doc_id"] + [f"{prefix}_{end}" for prefix in prefixes for end in ["start", "end"]])
+		)
+	return(doc_offsets)
+
+def doc_slice_pl(df, doc_offsets, doc_key, prefix="token"):
+	# the rows of one document, sliced from ds_tokens (prefix="token") or a span table ("pos" or "ds") without scanning it
+	offsets = doc_offsets.filter(pl.col("doc_id") == doc_key)
+	if offsets.height == 0:
+		return(df.clear())
+	offsets = offsets.row(0, named=True)
+	return(df.slice(offsets[f"{prefix}_start"], offsets[f"{prefix}_end"] - offsets[f"{prefix}_start"]))
+
+def lowers_pl(span_vocab):
+	# the distinct lowercased span texts (lower_id, lower)
+	return(span_vocab.select(["lower_id", "lower"]).unique("lower_id"))
+
+def span_counts_pl(span_tables):
+	# per-document counts of each distinct span (doc_id, span_id, lower_id, tag, len) as lazy frames
+	# the token and tag counts are both sums over these, so a corpus that is being loaded only groups its spans once
+	pos_spans, ds_spans, span_vocab = span_tables
+	pos_counts = pos_spans.lazy().group_by(["doc_id", "span_id", "lower_id", "pos_tag"]).len()
+	ds_counts = ds_spans.lazy().group_by(["doc_id", "span_id", "lower_id", "ds_tag"]).len()
+	return(pos_counts, ds_counts)
+
+def token_counts_pl(tok_pl, span_tables=None, span_counts=None, lazy=False):
+	# per-document token counts (doc_id, Token, Tag, len) that underlie the frequency tables
+	# spans are counted by their integer ids and the strings are joined on to the counts
+	# lazy=True returns the query plans, so that they can be collected together with others (see build_corpus_pl)
+	if span_tables is None:
+		span_tables = span_tables_pl(tok_pl)
+	if span_counts is None:
+		span_counts = span_counts_pl(span_tables)
+	pos_counts, ds_counts = span_counts
+	lowers = lowers_pl(span_tables[2]).lazy()
+
+	df_pos = (
+		pos_counts
 		.filter(
-			~(pl.col("token").str.contains("^[[[:punct:]] ]+$") & pl.col("ds_tag").str.contains("Untagged"))
+			pl.col("pos_tag") != "Y"
 		)
-		.rename({"ds_tag": "Tag"})
-		.rename({"token": "Token"})
-		.group_by(["doc_id", "Token", "Tag"]).len()
-		.with_columns(
-			pl.struct(["Token", "Tag"])
+		.group_by(["doc_id", "lower_id", "pos_tag"]).agg(pl.col("len").sum())
+		.join(lowers, on="lower_id")
+		.select([pl.col("doc_id"), pl.col("lower").alias("Token"), pl.col("pos_tag").alias("Tag"), pl.col("len")])
+		.with_columns(pl.col(["doc_id", "Tag"]).cast(pl.String))
 		)
-		.select(pl.exclude("Tag"))
+
+	df_ds = (
+		ds_counts
+		.group_by(["doc_id", "lower_id", "ds_tag"]).agg(pl.col("len").sum())
+		.join(lowers, on="lower_id")
+		.filter(
+			~(pl.col("lower").str.contains("^[[[:punct:]] ]+$") & (pl.col("ds_tag") == "Untagged"))
+		)
+		.select([pl.col("doc_id"), pl.col("lower").alias("Token"), pl.col("ds_tag").alias("Tag"), pl.col("len")])
+		.with_columns(pl.col(["doc_id", "Tag"]).cast(pl.String))
 		)
-	
-	df_ds = summarize_counts(df_ds).sort(["AF", "Token"], descending=[True, False])
 
-	return(df_pos, df_ds)
-    
-def tag_tables_pl(tok_pl):
+	if lazy == True:
+		return(df_pos, df_ds)
+	return(tuple(pl.collect_all([df_pos, df_ds])))
+	
+def tag_tables_pl(tok_pl, span_tables=None, counts=None):
 	
 	def summarize_counts(df):
 			df = (
-				df
-				.pivot(index="Tag", on="doc_id", values="len", aggregate_function="sum")
-				.with_columns(
-					pl.all().exclude("Tag").cast(pl.UInt32, strict=True)
-				)
-				# calculate range
-				.with_columns(
-					Range=pl.sum_horizontal(pl.selectors.numeric().is_not_null())
-				)
- 				.with_columns(
-					pl.selectors.numeric().fill_null(strategy="zero")
-				)
-				# normalize over total documents in corpus
-				.with_columns(
-						pl.col("Range").truediv(pl.sum_horizontal(pl.selectors.numeric().exclude("Range").is_not_null())).mul(100)
-				)
-				# calculate absolute frequency
-				.with_columns(
-					pl.sum_horizontal(pl.selectors.numeric().exclude("Range"))
-					.alias("AF")
-				)
-				.sort("AF", descending = True)
-				.select(["Tag", "AF", "Range"])
+				summarize_counts_pl(df, ["Tag"], dispersion=True)
 				# calculate relative frequency
 				.with_columns(
 					pl.col("AF").truediv(pl.sum("AF")).mul(100)
 					.alias("RF")
 				)
-			  .select(["Tag", "AF", "RF", "Range"])
+				.select(["Tag", "AF", "RF", "Range"] + DISPERSIONS)
 				)
 			return(df)
 	
-	# format tokens and sum by doc_id
+	# format tokens and sum by doc_id, unless the counts have already been made (see build_corpus_pl)
+	if counts is None:
+		counts = tag_counts_pl(tok_pl, span_tables)
+	df_pos, df_ds = counts
+	
+	df_pos = summarize_counts(df_pos).sort(["AF", "Tag"], descending=[True, False])
+	
+	df_ds = summarize_counts(df_ds).sort(["AF", "Tag"], descending=[True, False])
+
+	return(df_pos, df_ds)
+
+def tag_counts_pl(tok_pl, span_tables=None, span_counts=None, lazy=False):
+	# per-document tag counts (doc_id, Tag, len) that underlie the tag tables and document-term matrices
+	if span_tables is None:
+		span_tables = span_tables_pl(tok_pl)
+	if span_counts is None:
+		span_counts = span_counts_pl(span_tables)
+	pos_counts, ds_counts = span_counts
+
 	df_pos = (
-		tok_pl
+		pos_counts
 		.filter(pl.col("pos_tag") != "Y")
-		.group_by(["doc_id", "pos_id", "pos_tag"], maintain_order = True)
-		.first()
-		.group_by(["doc_id", "pos_tag"]).len()
+		.group_by(["doc_id", "pos_tag"]).agg(pl.col("len").sum())
 		.rename({"pos_tag": "Tag"})
+		.with_columns(pl.col(["doc_id", "Tag"]).cast(pl.String))
 		)
-	
-	df_pos = summarize_counts(df_pos).sort(["AF", "Tag"], descending=[True, False])
    
+	# a span's text is punctuation only when each of its tokens is
+	punct_ids = span_tables[2].filter(pl.col("text").str.contains("^[[[:punct:]] ]+$")).get_column("span_id")
 	df_ds = (
-		tok_pl
-		.filter(~(pl.col("token").str.contains("^[[[:punct:]] ]+$") & pl.col("ds_tag").str.contains("Untagged")))
-		.group_by(["doc_id", "ds_id", "ds_tag"], maintain_order = True)
-		.first()
-		.group_by(["doc_id", "ds_tag"]).len()
+		ds_counts
+		.filter(~(pl.col("span_id").is_in(punct_ids) & (pl.col("ds_tag") == "Untagged")))
+		.group_by(["doc_id", "ds_tag"]).agg(pl.col("len").sum())
 		.rename({"ds_tag": "Tag"})
+		.with_columns(pl.col(["doc_id", "Tag"]).cast(pl.String))
 		)
-	
-	df_ds = summarize_counts(df_ds).sort(["AF", "Tag"], descending=[True, False])
 
-	return(df_pos, df_ds)
+	if lazy == True:
+		return(df_pos, df_ds)
+	return(tuple(pl.collect_all([df_pos, df_ds])))
 
-def dtm_pl(tok_pl):
-	
-	df_pos = (
-		tok_pl
-		.filter(pl.col("pos_tag") != "Y")
-		.group_by(["doc_id", "pos_id", "pos_tag"], maintain_order = True)
-		.first()
-		.group_by(["doc_id", "pos_tag"]).len()
-		.rename({"pos_tag": "tag"})
+def dtm_counts_pl(df):
+	# pivots per-document tag counts (doc_id, Tag, len) into a document-term matrix
+	# tags are ordered by total frequency, and documents by where they first appear in that order
+	df = (
+		df
+		.rename({"Tag": "tag"})
 		.with_columns(pl.col("len").sum().over('tag').alias('total'))
-		.sort(["total", "doc_id"], descending=[True, False])
+		# tags with the same total are ordered by name, so the layout does not depend on the order of the counts
+		.sort(["total", "doc_id", "tag"], descending=[True, False, False])
 		.pivot(index="doc_id", on="tag", values="len", aggregate_function="sum")
 		.fill_null(strategy="zero")
 		)
+	return(df)
 
-	df_ds = (
+def dtm_pl(tok_pl, span_tables=None, counts=None):
+	
+	if counts is None:
+		counts = tag_counts_pl(tok_pl, span_tables)
+	df_pos, df_ds = counts
+
+	df_pos = dtm_counts_pl(df_pos)
+
+	df_ds = dtm_counts_pl(df_ds)
+
+	return(df_pos, df_ds)
+
+def index_corpus_pl(tok_pl):
+	# the doc_id-sorted ds_tokens (with token ids), token vocabulary, span tables and document offsets of a corpus
+	tok_pl, vocab = vocab_pl(sort_tokens_pl(tok_pl))
+	pos_spans, ds_spans, span_vocab = span_tables_pl(tok_pl, vocab)
+	corpus = {
+		"ds_tokens": tok_pl,
+		"vocab": vocab,
+		"pos_spans": pos_spans,
+		"ds_spans": ds_spans,
+		"span_vocab": span_vocab,
+		"doc_offsets": doc_offsets_pl(tok_pl, (pos_spans, ds_spans, span_vocab))
+	}
+	return(corpus)
+
+def build_corpus_pl(tok_pl):
+	# builds everything that is stored for a loaded corpus (see index_corpus_pl) along with its seven tables
+	# the spans are grouped once per document (span_counts_pl) and the token and tag counts for both tagsets
+	# are summed from those cached counts in a single lazy plan; the tag tables and document-term matrices share the tag counts
+	# this replaces eight aggregations over the whole corpus, and the load metadata is read from the finished tables
+	# (see handlers_database.init_metadata_target)
+	corpus = index_corpus_pl(tok_pl)
+	tok_pl = corpus["ds_tokens"]
+	span_tables = (corpus["pos_spans"], corpus["ds_spans"], corpus["span_vocab"])
+	span_counts = tuple(counts.cache() for counts in span_counts_pl(span_tables))
+	ft_pos, ft_ds, tt_pos, tt_ds = pl.collect_all(
+		list(token_counts_pl(tok_pl, span_tables, span_counts, lazy=True)) +
+		list(tag_counts_pl(tok_pl, span_tables, span_counts, lazy=True))
+		)
+	corpus["ft_pos"], corpus["ft_ds"] = frequency_tables_pl(tok_pl, counts=(ft_pos, ft_ds))
+	corpus["tt_pos"], corpus["tt_ds"] = tag_tables_pl(tok_pl, counts=(tt_pos, tt_ds))
+	corpus["dtm_pos"], corpus["dtm_ds"] = dtm_pl(tok_pl, counts=(tt_pos, tt_ds))
+	return(corpus)
+
+# A count summary holds everything the frequency tables, tag tables and document-term matrices are computed from,
+# without the tokens themselves: per-document token counts (ft_pos, ft_ds: doc_id, Token, Tag, len),
+# per-document tag counts (tt_pos, tt_ds: doc_id, Tag, len) and per-document totals (docs: doc_id, tokens, tokens_pos, tokens_ds).
+# Summaries of separately tagged shards are merged by adding up their counts, which is associative and commutative,
+# so shards can be summarized and merged in any grouping or order and give the same tables as the whole corpus.
+COUNT_SUMMARY_KEYS = {
+	"docs": ["doc_id"],
+	"ft_pos": ["doc_id", "Token", "Tag"],
+	"ft_ds": ["doc_id", "Token", "Tag"],
+	"tt_pos": ["doc_id", "Tag"],
+	"tt_ds": ["doc_id", "Tag"]
+}
+
+def count_summary_pl(tok_pl, span_tables=None, batch_tokens=2**22):
+	# the count summary of a corpus in ds_tokens format; frames are sorted by their keys, as merged summaries are
+	# a LazyFrame (such as pl.scan_parquet of a tagged corpus) is read and summarized about batch_tokens rows at a time,
+	# cut where doc_id changes so that no span is split, and the batches are merged; only one batch is held in memory
+	if isinstance(tok_pl, pl.LazyFrame):
+		runs = tok_pl.select(pl.col("doc_id").cast(pl.String).rle().struct.field("len")).collect().get_column("len")
+		ends = runs.cum_sum().to_list()
+		batches = []
+		start = 0
+		for i, end in enumerate(ends):
+			if end - start >= batch_tokens or i == len(ends) - 1:
+				batches.append((start, end - start))
+				start = end
+		if len(batches) == 0:
+			return(count_summary_pl(tok_pl.collect()))
+		# a document whose rows are not contiguous can fall into more than one batch, and its counts are then added up
+		summaries = [count_summary_pl(tok_pl.slice(offset, length).collect()) for offset, length in batches]
+		return(merge_count_summaries_pl(summaries, allow_overlap=True))
+	if span_tables is None:
+		span_tables = span_tables_pl(tok_pl)
+	span_counts = tuple(counts.cache() for counts in span_counts_pl(span_tables))
+	ft_pos, ft_ds, tt_pos, tt_ds = pl.collect_all(
+		list(token_counts_pl(tok_pl, span_tables, span_counts, lazy=True)) +
+		list(tag_counts_pl(tok_pl, span_tables, span_counts, lazy=True))
+		)
+	docs = (
 		tok_pl
-		.filter(~(pl.col("token").str.contains("^[[[:punct:]] ]+$") & pl.col("ds_tag").str.contains("Untagged")))
-		.group_by(["doc_id", "ds_id", "ds_tag"], maintain_order = True)
-		.first()
-		.group_by(["doc_id", "ds_tag"]).len()
-		.rename({"ds_tag": "tag"})
-		.with_columns(pl.col("len").sum().over('tag').alias('total'))
-		.sort(["total", "doc_id"], descending=[True, False])
-		.pivot(index="doc_id", on="tag", values="len", aggregate_function="sum")
-		.fill_null(strategy="zero")
+		.group_by(pl.col("doc_id").cast(pl.String)).len(name="tokens")
+		.join(tt_pos.group_by("doc_id").agg(pl.col("len").sum().alias("tokens_pos")), on="doc_id", how="left")
+		.join(tt_ds.group_by("doc_id").agg(pl.col("len").sum().alias("tokens_ds")), on="doc_id", how="left")
+		.fill_null(0)
+		)
+	summary = {"docs": docs, "ft_pos": ft_pos, "ft_ds": ft_ds, "tt_pos": tt_pos, "tt_ds": tt_ds}
+	return({key: summary[key].sort(keys) for key, keys in COUNT_SUMMARY_KEYS.items()})
+
+def merge_count_summaries_pl(summaries: list, allow_overlap=False):
+	# adds up the counts of any number of summaries in one aggregation per table
+	# shards are expected to hold different documents, so a doc_id found in more than one summary is an error
+	# (usually a shard merged twice) unless allow_overlap=True, in which case its counts are summed
+	if allow_overlap == False:
+		overlap = (
+			pl.concat([summary["docs"].select("doc_id") for summary in summaries])
+			.filter(pl.col("doc_id").is_duplicated())
+			.unique()
+			.sort("doc_id")
+			.get_column("doc_id")
+			)
+		if len(overlap) > 0:
+			raise ValueError(f"{len(overlap)} documents appear in more than one summary ({', '.join(overlap.head(5).to_list())}{', ...' if len(overlap) > 5 else ''})")
+	plans = [
+		pl.concat([summary[key].lazy() for summary in summaries])
+		.group_by(keys)
+		.agg(pl.exclude(keys).sum())
+		.sort(keys)
+		for key, keys in COUNT_SUMMARY_KEYS.items()
+	]
+	return(dict(zip(COUNT_SUMMARY_KEYS, pl.collect_all(plans))))
+
+def summary_tables_pl(summary):
+	# the frequency tables, tag tables and document-term matrices of a (merged) count summary
+	# these are the same tables that build_corpus_pl makes from ds_tokens, and the ft_* and tt_* tables are what keyness_pl compares
+	tables = {}
+	tables["ft_pos"], tables["ft_ds"] = frequency_tables_pl(None, counts=(summary["ft_pos"], summary["ft_ds"]))
+	tables["tt_pos"], tables["tt_ds"] = tag_tables_pl(None, counts=(summary["tt_pos"], summary["tt_ds"]))
+	tables["dtm_pos"], tables["dtm_ds"] = dtm_pl(None, counts=(summary["tt_pos"], summary["tt_ds"]))
+	return(tables)
+
+def write_count_summary_pl(summary, path):
+	# a count summary is stored as a zip archive of parquet files, one per table
+	with zipfile.ZipFile(path, "w", zipfile.ZIP_STORED) as file_zip:
+		for key in COUNT_SUMMARY_KEYS:
+			output = io.BytesIO()
+			summary[key].write_parquet(output)
+			file_zip.writestr(key + ".parquet", output.getvalue())
+
+def read_count_summary_pl(path):
+	with zipfile.ZipFile(path) as file_zip:
+		names = set(file_zip.namelist())
+		missing = [key for key in COUNT_SUMMARY_KEYS if key + ".parquet" not in names]
+		if len(missing) > 0:
+			raise ValueError(f"{path} is not a count summary (missing {', '.join(missing)})")
+		return({key: pl.read_parquet(file_zip.read(key + ".parquet")) for key in COUNT_SUMMARY_KEYS})
+
+def merge_counts_pl(table_pl, counts_pl, ndocs, ndocs_new, scale, subtract=False):
+	# adds (or subtracts) per-document counts to a frequency or tag table without recounting the corpus
+	# the number of documents containing each row is recovered from Range and the corpus size before the change
+	# any dispersion columns are dropped, as they would need the whole corpus to be counted again (see update_dispersions_pl)
+	table_pl = table_pl.drop(DISPERSIONS, strict=False)
+	keys = [col for col in ["Token", "Tag"] if col in table_pl.columns]
+	sign = -1 if subtract == True else 1
+	delta = (
+		counts_pl
+		.group_by(keys)
+		.agg(
+			pl.col("len").sum().cast(pl.Int64).mul(sign).alias("AF_delta"),
+			pl.col("doc_id").n_unique().cast(pl.Int64).mul(sign).alias("Range_delta")
+		)
+	)
+	df = (
+		table_pl
+		.with_columns(
+			pl.col("Range").mul(ndocs).truediv(100).round(0).cast(pl.Int64).alias("Range_n")
+		)
+		.join(delta, on=keys, how="full", coalesce=True)
+		.with_columns(
+			pl.col("AF").cast(pl.Int64).fill_null(0).add(pl.col("AF_delta").fill_null(0)),
+			pl.col("Range_n").fill_null(0).add(pl.col("Range_delta").fill_null(0))
+		)
+		.filter(pl.col("AF") > 0)
+		# divide by a column rather than a scalar so the values match a full recompute exactly
+		.with_columns(
+			pl.lit(ndocs_new, dtype=pl.UInt32).alias("ndocs")
+		)
+		.with_columns(
+			pl.col("Range_n").truediv(pl.col("ndocs")).mul(100).alias("Range")
+		)
+		.with_columns(
+			pl.col("AF").truediv(pl.sum("AF")).mul(scale)
+			.alias("RF")
+		)
+		.sort(["AF"] + keys, descending=[True] + [False]*len(keys))
+		.select(table_pl.columns)
+		.cast(table_pl.schema)
 	)
+	return(df)
 
-	return(df_pos, df_ds)
+def merge_dtm_pl(dtm_pl, counts_pl, remove_ids=None):
+	# adds rows for new documents (and drops rows for removed ones)
+	# the matrix is turned back into counts and pivoted again as in dtm_pl, so that its rows and columns are in the order of a full rebuild
+	counts = (
+		dtm_pl
+		.unpivot(index="doc_id", variable_name="Tag", value_name="len")
+		.filter(pl.col("len") > 0)
+		)
+	if remove_ids is not None:
+		counts = counts.filter(pl.col("doc_id").is_in(remove_ids).not_())
+	counts = pl.concat([counts, counts_pl.select(["doc_id", "Tag", "len"])], how="vertical_relaxed")
+	return(dtm_counts_pl(counts))
+
+def remove_documents_pl(corpus, doc_ids: list):
+	# subtracts the contributions of doc_ids from a loaded corpus (ds_tokens, ft_*, tt_*, dtm_* and the span tables) without a full recompute
+	ds_tokens = corpus["ds_tokens"]
+	removed = ds_tokens.filter(pl.col("doc_id").is_in(doc_ids))
+	if removed.height == 0:
+		return(corpus)
+	# the removed documents are counted from their rows of the span tables
+	span_tables = None
+	if "pos_spans" in corpus:
+		span_tables = tuple(corpus[key].filter(pl.col("doc_id").is_in(doc_ids)) for key in ["pos_spans", "ds_spans"]) + (corpus["span_vocab"],)
+	ft_pos, ft_ds = token_counts_pl(removed, span_tables)
+	tt_pos, tt_ds = tag_counts_pl(removed, span_tables)
+	updated = {
+		"ds_tokens": ds_tokens.filter(pl.col("doc_id").is_in(doc_ids).not_()),
+		"dtm_ds": merge_dtm_pl(corpus["dtm_ds"], tt_ds.clear(), remove_ids=doc_ids),
+		"dtm_pos": merge_dtm_pl(corpus["dtm_pos"], tt_pos.clear(), remove_ids=doc_ids)
+	}
+	# Range is a share of the documents with counts in a tagset (a document of only punctuation has none),
+	# which are the rows of its document-term matrix
+	ndocs_pos, ndocs_pos_new = corpus["dtm_pos"].height, updated["dtm_pos"].height
+	ndocs_ds, ndocs_ds_new = corpus["dtm_ds"].height, updated["dtm_ds"].height
+	updated.update({
+		"ft_ds": merge_counts_pl(corpus["ft_ds"], ft_ds, ndocs_ds, ndocs_ds_new, 1000000, subtract=True),
+		"ft_pos": merge_counts_pl(corpus["ft_pos"], ft_pos, ndocs_pos, ndocs_pos_new, 1000000, subtract=True),
+		"tt_ds": merge_counts_pl(corpus["tt_ds"], tt_ds, ndocs_ds, ndocs_ds_new, 100, subtract=True),
+		"tt_pos": merge_counts_pl(corpus["tt_pos"], tt_pos, ndocs_pos, ndocs_pos_new, 100, subtract=True)
+	})
+	if "doc_offsets" in corpus:
+		updated["doc_offsets"] = merge_doc_offsets_pl(corpus["doc_offsets"], remove_ids=doc_ids)
+	# the vocabularies are kept as they are, so ids stay valid if documents are added later
+	for key in ["vocab", "span_vocab"]:
+		if key in corpus:
+			updated[key] = corpus[key]
+	if "pos_spans" in corpus:
+		for key in ["pos_spans", "ds_spans"]:
+			updated[key] = (
+				corpus[key]
+				.filter(pl.col("doc_id").is_in(doc_ids).not_())
+				.with_columns(
+					pl.col("length").cum_sum().sub(pl.col("length")).cast(pl.UInt32).alias("start")
+				)
+				)
+	return(updated)
 
-def collocations_pl(tok_pl, node_word, preceding=4, following=4, statistic='pmi', count_by='pos', node_tag=None):
+def add_documents_pl(corpus, tok_pl):
+	# merges newly tagged documents (in ds_tokens format) into a loaded corpus, counting only the new documents
+	# documents whose ids are already in the corpus are replaced
+	doc_ids = tok_pl.get_column("doc_id").unique().to_list()
+	corpus = remove_documents_pl(corpus, doc_ids)
+	ds_tokens = corpus["ds_tokens"]
+	# continue the span ids of the loaded corpus so that spans stay unique
+	tok_pl = tok_pl.with_columns(
+		pl.col("pos_id").add(ds_tokens.get_column("pos_id").max() or 0).cast(pl.UInt32),
+		pl.col("ds_id").add(ds_tokens.get_column("ds_id").max() or 0).cast(pl.UInt32)
+	)
+	# the new tokens are added to the corpus' vocabulary, so that ds_tokens keeps one set of token ids
+	vocab = corpus.get("vocab")
+	if "token_id" in ds_tokens.columns:
+		tok_pl, vocab = vocab_pl(tok_pl.drop("token_id", strict=False), vocab)
+	span_tables = span_tables_pl(tok_pl, vocab)
+	ft_pos, ft_ds = token_counts_pl(tok_pl, span_tables)
+	tt_pos, tt_ds = tag_counts_pl(tok_pl, span_tables)
+	updated = {
+		"ds_tokens": pl.concat([ds_tokens, tok_pl]).sort(pl.col("doc_id").cast(pl.String), maintain_order=True),
+		"dtm_ds": merge_dtm_pl(corpus["dtm_ds"], tt_ds),
+		"dtm_pos": merge_dtm_pl(corpus["dtm_pos"], tt_pos)
+	}
+	# as in remove_documents_pl, Range counts the documents with counts in a tagset
+	ndocs_pos, ndocs_pos_new = corpus["dtm_pos"].height, updated["dtm_pos"].height
+	ndocs_ds, ndocs_ds_new = corpus["dtm_ds"].height, updated["dtm_ds"].height
+	updated.update({
+		"ft_ds": merge_counts_pl(corpus["ft_ds"], ft_ds, ndocs_ds, ndocs_ds_new, 1000000),
+		"ft_pos": merge_counts_pl(corpus["ft_pos"], ft_pos, ndocs_pos, ndocs_pos_new, 1000000),
+		"tt_ds": merge_counts_pl(corpus["tt_ds"], tt_ds, ndocs_ds, ndocs_ds_new, 100),
+		"tt_pos": merge_counts_pl(corpus["tt_pos"], tt_pos, ndocs_pos, ndocs_pos_new, 100)
+	})
+	if "token_id" in ds_tokens.columns:
+		updated["vocab"] = vocab
+	if "pos_spans" in corpus:
+		updated["pos_spans"], updated["ds_spans"], updated["span_vocab"] = merge_span_tables_pl((corpus["pos_spans"], corpus["ds_spans"], corpus["span_vocab"]), span_tables)
+	if "doc_offsets" in corpus:
+		new_offsets = doc_offsets_pl(tok_pl, span_tables if "pos_spans" in corpus else None)
+		updated["doc_offsets"] = merge_doc_offsets_pl(corpus["doc_offsets"], new_offsets)
+	return(updated)
+
+def collocations_pl(tok_pl, node_word, preceding=4, following=4, statistic='pmi', count_by='pos', node_tag=None, span_tables=None):
 
 	if count_by == 'pos':
 		grouping_tag = "pos_tag"
-		grouping_id = "pos_id"
-		expr_filter = pl.col("pos_tag") != "Y"
 	else:
 		grouping_tag = "ds_tag"
-		grouping_id = "ds_id"
-		expr_filter = ~(pl.col("token").str.contains("^[[[:punct:]] ]+$") & pl.col("ds_tag").str.contains("Untagged"))
 
+	# spans are windowed and counted by their lower_id; the strings are only joined on to the counts
+	if span_tables is None:
+		span_tables = span_tables_pl(tok_pl)
+	pos_spans, ds_spans, span_vocab = span_tables
+	spans = pos_spans if count_by == 'pos' else ds_spans
+	spans = spans.with_columns(pl.col(["doc_id", grouping_tag]).cast(pl.String))
+	lowers = lowers_pl(span_vocab)
+
+	if count_by == 'pos':
+		expr_filter = pl.col("pos_tag") != "Y"
+	else:
+		punct_ids = lowers.filter(pl.col("lower").str.contains("^[[[:punct:]] ]+$")).get_column("lower_id")
+		expr_filter = ~(pl.col("lower_id").is_in(punct_ids) & (pl.col("ds_tag") == "Untagged"))
+
+	node_ids = lowers.filter(pl.col("lower") == node_word.lower()).get_column("lower_id")
 	if node_tag is None:
-		expr = pl.col("token") == node_word.lower()
+		expr = pl.col("lower_id").is_in(node_ids)
 	else:
-		expr = (pl.col("token") == node_word.lower()) & (pl.col(grouping_tag).str.starts_with(node_tag))
+		expr = pl.col("lower_id").is_in(node_ids) & (pl.col(grouping_tag).str.starts_with(node_tag))
 
 	look_around_token = [
-		pl.col("token").shift(-i).alias(f"tok_lag_{i}") for i in range(-preceding, following + 1)
+		pl.col("lower_id").shift(-i).alias(f"tok_lag_{i}") for i in range(-preceding, following + 1)
 	]
 	look_around_tag = [
 		pl.col(grouping_tag).shift(-i).alias(f"tag_lag_{i}") for i in range(-preceding, following + 1)
 	]
 
 	total_df = (
-		tok_pl
-		.group_by(["doc_id", grouping_id, grouping_tag], maintain_order = True)
-		.agg(
-			pl.col("token").str.concat("")
-			)
-		.with_columns(
-			pl.col("token").str.to_lowercase().str.strip_chars())
+		spans
 		.filter(expr_filter)
-		.group_by(["token", grouping_tag]).len(name="Freq_Total")
-		.rename({"token": "Token", grouping_tag: "Tag"})
+		.group_by(["lower_id", grouping_tag]).len(name="Freq_Total")
+		.join(lowers, on="lower_id")
+		.select([pl.col("lower").alias("Token"), pl.col(grouping_tag).alias("Tag"), pl.col("Freq_Total")])
 	)
 
 	token_total = sum(total_df.get_column("Freq_Total"))
@@ -266,22 +798,17 @@ def collocations_pl(tok_pl, node_word, preceding=4, following=4, statistic='pmi'
 	if statistic=='pmi3':
 		mi_funct = pl.col("Freq_Span").truediv(token_total).log(base=2).sub(pl.col("Freq_Total").truediv(token_total).mul(node_freq).truediv(token_total).log(base=2)).sub(pl.col("Freq_Span").truediv(token_total).log(base=2).mul(-2))
 
+	alpha_ids = lowers.filter(pl.col("lower").str.contains("[a-z]")).get_column("lower_id")
+
 	coll_df = (
-		tok_pl
-		.group_by(["doc_id", grouping_id, grouping_tag], maintain_order = True)
-		.agg(
-			pl.col("token").str.concat("")
-			)
-		.with_columns(
-			pl.col("token").str.to_lowercase().str.strip_chars())
+		spans
 		.filter(
-			pl.col('token').str.contains("[a-z]")
+			pl.col("lower_id").is_in(alpha_ids)
 			)
 		.with_columns(
 			look_around_token + look_around_tag
 			)
 		.filter(expr)
-		#.drop(["tok_lag_0", "tag_lag_0"])
 		.group_by("doc_id")
 		.agg(
 			pl.concat_list([f"tok_lag_{i}" for i in range(-preceding, following + 1)]).alias("span_tok"),
@@ -298,12 +825,14 @@ def collocations_pl(tok_pl, node_word, preceding=4, following=4, statistic='pmi'
 			)
 		.drop(["span_tok", "span_tag"])
 		.with_columns(
-			Token=pl.col("pre_node_tok").list.concat("post_node_tok"),
+			lower_id=pl.col("pre_node_tok").list.concat("post_node_tok"),
 			Tag=pl.col("pre_node_tag").list.concat("post_node_tag")
 			)
-		.select(["Token", "Tag"])
-		.explode(["Token", "Tag"])
-		.group_by(["Token", "Tag"]).len(name="Freq_Span")
+		.select(["lower_id", "Tag"])
+		.explode(["lower_id", "Tag"])
+		.group_by(["lower_id", "Tag"]).len(name="Freq_Span")
+		.join(lowers, on="lower_id")
+		.select([pl.col("lower").alias("Token"), pl.col("Tag"), pl.col("Freq_Span")])
 		.sort("Freq_Span")
 		.join(total_df, on=["Token", "Tag"])
 		.with_columns(
@@ -401,31 +930,40 @@ def keyness_pl(target_pl, reference_pl, correct=False, tags_only=False, threshol
 		return(kw_df.select(["Tag", "LL", "LR", "PV", "RF", "RF_Ref", "AF", "AF_Ref", "Range", "Range_Ref"]))
 	
 
-def ngrams_by_token_pl(tok_pl, node_word: str, node_position, span, search_type, count_by='pos'):
+def ngrams_by_token_pl(tok_pl, node_word: str, node_position, span, search_type, count_by='pos', span_tables=None):
 	
 	if count_by == 'pos':
 		grouping_tag = "pos_tag"
-		grouping_id = "pos_id"
-		expr_filter = pl.col("pos_tag") != "Y"
 	else:
 		grouping_tag = "ds_tag"
-		grouping_id = "ds_id"
-		expr_filter = ~(pl.col("token").str.contains("^[[[:punct:]] ]+$") & pl.col("ds_tag").str.contains("Untagged"))
+
+	if span_tables is None:
+		span_tables = span_tables_pl(tok_pl)
+	pos_spans, ds_spans, span_vocab = span_tables
+	spans = pos_spans if count_by == 'pos' else ds_spans
+	lowers = lowers_pl(span_vocab)
+
+	if count_by == 'pos':
+		expr_filter = pl.col("pos_tag") != "Y"
+	else:
+		punct_ids = span_vocab.filter(pl.col("text").str.contains("^[[[:punct:]] ]+$")).get_column("span_id")
+		expr_filter = ~(pl.col("span_id").is_in(punct_ids) & (pl.col("ds_tag") == "Untagged"))
 	
 	if search_type == "fixed":
-		expr = pl.col("token") == node_word.lower()
+		expr_node = pl.col("lower") == node_word.lower()
 	elif search_type == "starts_with":
-		expr = pl.col("token").str.starts_with(node_word.lower())
+		expr_node = pl.col("lower").str.starts_with(node_word.lower())
 	elif search_type == "ends_with":
-		expr = pl.col("token").str.ends_with(node_word.lower())
+		expr_node = pl.col("lower").str.ends_with(node_word.lower())
 	elif search_type == "contains":
-		expr = pl.col("token").str.contains(node_word.lower())
+		expr_node = pl.col("lower").str.contains(node_word.lower())
+	expr = pl.col("lower_id").is_in(lowers.filter(expr_node).get_column("lower_id"))
 	
 	preceding = node_position - 1
 	following = span - node_position
 	
 	look_around_token = [
-		pl.col("token").shift(-i).alias(f"tok_lag_{i}") for i in range(-preceding, following + 1)
+		pl.col("lower_id").shift(-i).alias(f"tok_lag_{i}") for i in range(-preceding, following + 1)
 	]
 	look_around_tag = [
 		pl.col(grouping_tag).shift(-i).alias(f"tag_lag_{i}") for i in range(-preceding, following + 1)
@@ -437,17 +975,16 @@ def ngrams_by_token_pl(tok_pl, node_word: str, node_position, span, search_type,
 	rename_tags = [
 		 pl.col('tags').struct.rename_fields([f'Tag_{i + 1}' for i in range(span)])
 	]
+
+	lookup_tokens = [
+		pl.col(f'Token_{i + 1}').replace_strict(lowers.get_column("lower_id"), lowers.get_column("lower"), default=None) for i in range(span)
+	]
 	
 	ngram_df = (
-		tok_pl
-		.group_by(["doc_id", grouping_id, grouping_tag], maintain_order = True)
-		.agg(
-			pl.col("token").str.concat("")
-			)
+		spans
+		.with_columns(pl.col(["doc_id", grouping_tag]).cast(pl.String))
 		.filter(expr_filter)
-		.with_columns(pl.col("token").len().alias("total"))
-		.with_columns(
-			pl.col("token").str.to_lowercase().str.strip_chars())
+		.with_columns(pl.col("lower_id").len().alias("total"))
 		.with_columns(
 			look_around_token + look_around_tag
 			)
@@ -469,65 +1006,51 @@ def ngrams_by_token_pl(tok_pl, node_word: str, node_position, span, search_type,
 		.with_columns(
 			pl.col(["ngram", "tags"]).list.to_struct()
 			)
-		.group_by(["doc_id", "total", "ngram", "tags"]).len().sort("len", descending=True)
-		.with_columns(
-			pl.struct(["ngram", "tags"])
-			)
-		.select(pl.exclude("tags"))
-		.pivot(index=["ngram", "total"], on="doc_id", values="len", aggregate_function="sum")
-		.with_columns(
-			pl.all().exclude("ngram").cast(pl.UInt32, strict=True)
-			)
-		# calculate range
-		.with_columns(
-			pl.sum_horizontal(pl.selectors.numeric().exclude("total").is_not_null())
-			.alias("Range")
-			)
-		.with_columns(
-			pl.selectors.numeric().fill_null(strategy="zero")
-			)
-		# normalize over total documents in corpus
-		.with_columns(
-			pl.col("Range").truediv(pl.sum_horizontal(pl.selectors.numeric().exclude(["Range", "total"]).is_not_null())).mul(100)
-			)
-		# calculate absolute frequency
-		.with_columns(
-			pl.sum_horizontal(pl.selectors.numeric().exclude(["Range", "total"]))
-			.alias("AF")
-			)
+		.group_by(["doc_id", "total", "ngram", "tags"]).len()
+		.pipe(summarize_counts_pl, ["ngram", "tags", "total"])
 		.sort("AF", descending = True)
 		# calculate relative frequency
 		.with_columns(
 			pl.col("AF").truediv(pl.col("total")).mul(1000000)
 			.alias("RF")
 			)
-		.select(["ngram", "AF", "RF", "Range"])
-		.unnest("ngram")
+		.select(["ngram", "tags", "AF", "RF", "Range"])
 		.with_columns(
 			rename_tokens + rename_tags
 			)
 		.unnest(["ngram", "tags"])
+		.with_columns(
+			lookup_tokens
+			)
 		)
 		return ngram_df
 
-def ngrams_by_tag_pl(tok_pl, tag: str, node_position, span, count_by='pos'):
+def ngrams_by_tag_pl(tok_pl, tag: str, node_position, span, count_by='pos', span_tables=None):
 			
 	if count_by == 'pos':
 		grouping_tag = "pos_tag"
-		grouping_id = "pos_id"
 		expr = pl.col("pos_tag") == tag
-		expr_filter = pl.col("pos_tag") != "Y"
 	else:
 		grouping_tag = "ds_tag"
-		grouping_id = "ds_id"
 		expr = pl.col("ds_tag") == tag
-		expr_filter = ~(pl.col("token").str.contains("^[[[:punct:]] ]+$") & pl.col("ds_tag").str.contains("Untagged"))
+
+	if span_tables is None:
+		span_tables = span_tables_pl(tok_pl)
+	pos_spans, ds_spans, span_vocab = span_tables
+	spans = pos_spans if count_by == 'pos' else ds_spans
+	lowers = lowers_pl(span_vocab)
+
+	if count_by == 'pos':
+		expr_filter = pl.col("pos_tag") != "Y"
+	else:
+		punct_ids = span_vocab.filter(pl.col("text").str.contains("^[[[:punct:]] ]+$")).get_column("span_id")
+		expr_filter = ~(pl.col("span_id").is_in(punct_ids) & (pl.col("ds_tag") == "Untagged"))
 	
 	preceding = node_position - 1
 	following = span - node_position
 	
 	look_around_token = [
-		pl.col("token").shift(-i).alias(f"tok_lag_{i}") for i in range(-preceding, following + 1)
+		pl.col("lower_id").shift(-i).alias(f"tok_lag_{i}") for i in range(-preceding, following + 1)
 	]
 	look_around_tag = [
 		pl.col(grouping_tag).shift(-i).alias(f"tag_lag_{i}") for i in range(-preceding, following + 1)
@@ -539,17 +1062,16 @@ def ngrams_by_tag_pl(tok_pl, tag: str, node_position, span, count_by='pos'):
 	rename_tags = [
 		 pl.col('tags').struct.rename_fields([f'Tag_{i + 1}' for i in range(span)])
 	]
+
+	lookup_tokens = [
+		pl.col(f'Token_{i + 1}').replace_strict(lowers.get_column("lower_id"), lowers.get_column("lower"), default=None) for i in range(span)
+	]
 	
 	ngram_df = (
-		tok_pl
-		.group_by(["doc_id", grouping_id, grouping_tag], maintain_order = True)
-		.agg(
-			pl.col("token").str.concat("")
-			)
+		spans
+		.with_columns(pl.col(["doc_id", grouping_tag]).cast(pl.String))
 		.filter(expr_filter)
-		.with_columns(pl.col("token").len().alias("total"))
-		.with_columns(
-			pl.col("token").str.to_lowercase().str.strip_chars())
+		.with_columns(pl.col("lower_id").len().alias("total"))
 		.with_columns(
 			look_around_token + look_around_tag
 			)
@@ -571,59 +1093,48 @@ def ngrams_by_tag_pl(tok_pl, tag: str, node_position, span, count_by='pos'):
 		.with_columns(
 			pl.col(["ngram", "tags"]).list.to_struct()
 			)
-		.group_by(["doc_id", "total", "ngram", "tags"]).len().sort("len", descending=True)
-		.with_columns(
-			pl.struct(["ngram", "tags"])
-			)
-		.select(pl.exclude("tags"))
-		.pivot(index=["ngram", "total"], on="doc_id", values="len", aggregate_function="sum")
-		.with_columns(
-			pl.all().exclude("ngram").cast(pl.UInt32, strict=True)
-			)
-		# calculate range
-		.with_columns(
-			pl.sum_horizontal(pl.selectors.numeric().exclude("total").is_not_null())
-			.alias("Range")
-			)
-		.with_columns(
-			pl.selectors.numeric().fill_null(strategy="zero")
-			)
-		# normalize over total documents in corpus
-		.with_columns(
-			pl.col("Range").truediv(pl.sum_horizontal(pl.selectors.numeric().exclude(["Range", "total"]).is_not_null())).mul(100)
-			)
-		# calculate absolute frequency
-		.with_columns(
-			AF=pl.sum_horizontal(pl.selectors.numeric().exclude(["Range", "total"]))
-			)
+		.group_by(["doc_id", "total", "ngram", "tags"]).len()
+		.pipe(summarize_counts_pl, ["ngram", "tags", "total"])
 		.sort("AF", descending = True)
 		# calculate relative frequency
 		.with_columns(
 			pl.col("AF").truediv(pl.col("total")).mul(1000000)
 			.alias("RF")
 			)
-		.select(["ngram", "AF", "RF", "Range"])
-		.unnest("ngram")
+		.select(["ngram", "tags", "AF", "RF", "Range"])
 		.with_columns(
 			rename_tokens + rename_tags
 			)
 		.unnest(["ngram", "tags"])
+		.with_columns(
+			lookup_tokens
+			)
 		)
 		return ngram_df
 
-def ngrams_pl(tok_pl, span, count_by='pos', min_frequency=10):
+def ngrams_pl(tok_pl, span, count_by='pos', min_frequency=10, span_tables=None):
 	
 	if count_by == 'pos':
 		grouping_tag = "pos_tag"
-		grouping_id = "pos_id"
-		expr_filter = pl.col("pos_tag") != "Y"
 	else:
 		grouping_tag = "ds_tag"
-		grouping_id = "ds_id"
-		expr_filter = ~(pl.col("token").str.contains("^[[[:punct:]] ]+$") & pl.col("ds_tag").str.contains("Untagged"))
+
+	# ngrams are built and counted from lower_ids; the strings replace them once the table is summarized
+	if span_tables is None:
+		span_tables = span_tables_pl(tok_pl)
+	pos_spans, ds_spans, span_vocab = span_tables
+	spans = pos_spans if count_by == 'pos' else ds_spans
+	spans = spans.with_columns(pl.col(["doc_id", grouping_tag]).cast(pl.String))
+	lowers = lowers_pl(span_vocab)
+
+	if count_by == 'pos':
+		expr_filter = pl.col("pos_tag") != "Y"
+	else:
+		punct_ids = span_vocab.filter(pl.col("text").str.contains("^[[[:punct:]] ]+$")).get_column("span_id")
+		expr_filter = ~(pl.col("span_id").is_in(punct_ids) & (pl.col("ds_tag") == "Untagged"))
 		
 	look_around_token = [
-		pl.col("token").shift(-i).alias(f"tok_lag_{i}") for i in range(span)
+		pl.col("lower_id").shift(-i).alias(f"tok_lag_{i}") for i in range(span)
     ]
 	look_around_tag = [
 		pl.col(grouping_tag).shift(-i).alias(f"tag_lag_{i}") for i in range(span)
@@ -635,17 +1146,15 @@ def ngrams_pl(tok_pl, span, count_by='pos', min_frequency=10):
 	rename_tags = [
 		 pl.col('tags').struct.rename_fields([f'Tag_{i + 1}' for i in range(span)])
 	]
+
+	lookup_tokens = [
+		pl.col(f'Token_{i + 1}').replace_strict(lowers.get_column("lower_id"), lowers.get_column("lower"), default=None) for i in range(span)
+	]
 	
 	ngram_df = (
-		tok_pl
-		.group_by(["doc_id", grouping_id, grouping_tag], maintain_order = True)
-		.agg(
-			pl.col("token").str.concat("")
-			)
+		spans
 		.filter(expr_filter)
-		.with_columns(pl.col("token").len().alias("total"))
-		.with_columns(
-			pl.col("token").str.to_lowercase().str.strip_chars())
+		.with_columns(pl.col("lower_id").len().alias("total"))
 		.with_columns(
 			look_around_token + look_around_tag
 			)
@@ -658,44 +1167,22 @@ def ngrams_pl(tok_pl, span, count_by='pos', min_frequency=10):
 		.with_columns(
 			pl.col(["ngram", "tags"]).list.to_struct()
 			)
-		.group_by(["doc_id", "total", "ngram", "tags"]).len().sort("len", descending=True)
-		.with_columns(
-			pl.struct(["ngram", "tags"])
-			)
-		.select(pl.exclude("tags"))
-		.pivot(index=["ngram", "total"], on="doc_id", values="len", aggregate_function="sum")
-		.with_columns(
-			pl.all().exclude("ngram").cast(pl.UInt32, strict=True)
-			)
-		# calculate range
-		.with_columns(
-			pl.sum_horizontal(pl.selectors.numeric().exclude("total").is_not_null())
-			.alias("Range")
-			)
-		.with_columns(
-			pl.selectors.numeric().fill_null(strategy="zero")
-			)
-		# normalize over total documents in corpus
-		.with_columns(
-				pl.col("Range").truediv(pl.sum_horizontal(pl.selectors.numeric().exclude(["Range", "total"]).is_not_null())).mul(100)
-			)
-		# calculate absolute frequency
-		.with_columns(
-			pl.sum_horizontal(pl.selectors.numeric().exclude(["Range", "total"]))
-			.alias("AF")
-			)
+		.group_by(["doc_id", "total", "ngram", "tags"]).len()
+		.pipe(summarize_counts_pl, ["ngram", "tags", "total"])
 		.sort("AF", descending = True)
-        # calculate relative frequency
+		# calculate relative frequency
 		.with_columns(
 			pl.col("AF").truediv(pl.col("total")).mul(1000000)
 			.alias("RF")
 			)
-		.select(["ngram", "AF", "RF", "Range"])
-		.unnest("ngram")
+		.select(["ngram", "tags", "AF", "RF", "Range"])
 		.with_columns(
 			rename_tokens + rename_tags
 			)
 		.unnest(["ngram", "tags"])
+		.with_columns(
+			lookup_tokens
+			)
 		.sort(["AF", "Token_1", "Token_2"], descending=[True, False, False])
 		.filter(
                pl.col('RF') >= min_frequency
@@ -704,62 +1191,62 @@ def ngrams_pl(tok_pl, span, count_by='pos', min_frequency=10):
 	
 	return ngram_df
 
-def kwic_pl(tok_pl, node_word: str, search_type="fixed", ignore_case=True):
+def kwic_pl(tok_pl, node_word: str, search_type="fixed", ignore_case=True, span_tables=None):
 	
 	if search_type == "fixed" and ignore_case == True:
-		expr = pl.col("token").str.to_lowercase().str.strip_chars() == node_word.lower()
+		expr = pl.col("text").str.to_lowercase().str.strip_chars() == node_word.lower()
 	if search_type == "fixed" and ignore_case == False:
-		expr = pl.col("token").str.strip_chars() == node_word
+		expr = pl.col("text").str.strip_chars() == node_word
 	elif search_type == "starts_with" and ignore_case == True:
-		expr = pl.col("token").str.to_lowercase().str.strip_chars().str.starts_with(node_word.lower())
+		expr = pl.col("text").str.to_lowercase().str.strip_chars().str.starts_with(node_word.lower())
 	elif search_type == "starts_with" and ignore_case == False:
-		expr = pl.col("token").str.strip_chars().str.starts_with(node_word)
+		expr = pl.col("text").str.strip_chars().str.starts_with(node_word)
 	elif search_type == "ends_with" and ignore_case == True:
-		expr = pl.col("token").str.to_lowercase().str.strip_chars().str.ends_with(node_word.lower())
+		expr = pl.col("text").str.to_lowercase().str.strip_chars().str.ends_with(node_word.lower())
 	elif search_type == "ends_with" and ignore_case == False:
-		expr = pl.col("token").str.ends_with(node_word)
+		expr = pl.col("text").str.ends_with(node_word)
 	elif search_type == "contains" and ignore_case == True:
-		expr = pl.col("token").str.to_lowercase().str.strip_chars().str.contains(node_word.lower())
+		expr = pl.col("text").str.to_lowercase().str.strip_chars().str.contains(node_word.lower())
 	elif search_type == "contains" and ignore_case == False:
-		expr = pl.col("token").str.strip_chars().str.contains(node_word)
+		expr = pl.col("text").str.strip_chars().str.contains(node_word)
 
 	
 	preceding = 7
 	following = 7
+
+	# the search runs over the distinct span texts, and the windows around each hit are put together from span_ids
+	if span_tables is None:
+		span_tables = span_tables_pl(tok_pl)
+	pos_spans, ds_spans, span_vocab = span_tables
+	node_ids = span_vocab.filter(expr).get_column("span_id")
 	
 	look_around_token = [
-		pl.col("token").shift(-i).alias(f"tok_lag_{i}") for i in range(-preceding, following + 1)
+		pl.col("span_id").shift(-i).alias(f"tok_lag_{i}") for i in range(-preceding, following + 1)
     ]
 	
 	kwic_df = (
-		tok_pl
-		.group_by(["doc_id", "pos_id"], maintain_order = True)
-		.agg(
-			pl.col("token").str.concat("")
-			)
+		pos_spans
+		.with_columns(pl.col("doc_id").cast(pl.String))
 		.with_columns(
 			look_around_token
 			)
-		.filter(expr)
+		.filter(pl.col("span_id").is_in(node_ids))
 		.group_by("doc_id")
 		.agg(
 			pl.concat_list([f"tok_lag_{i}" for i in range(-preceding, following + 1)]).alias("node")
 			)
 		.explode("node")
+		.with_row_index("hit")
+		.explode("node")
 		.with_columns(
-			pre_node=pl.col("node").list.head(7)
-		)
-		.with_columns(
-			post_node=pl.col("node").list.tail(7)
-		)
-		.with_columns(
-			pl.col("node").list.get(7)
-		)
-		.with_columns(
-			pl.col("pre_node").list.join("")
+			pl.col("node").replace_strict(span_vocab.get_column("span_id"), span_vocab.get_column("text"), default=None)
 		)
-		.with_columns(
-			pl.col("post_node").list.join("")
+		.group_by("hit", maintain_order = True)
+		.agg(
+			pl.col("doc_id").first(),
+			pl.col("node").head(preceding).str.concat("").alias("pre_node"),
+			pl.col("node").get(preceding),
+			pl.col("node").tail(following).str.concat("").alias("post_node")
 		)
 		.select(["doc_id", "pre_node", "node", "post_node"])
 		.sort("doc_id")
@@ -810,6 +1297,86 @@ def dtm_weight_pl(dtm_pl, scheme="prop"):
 	)
 	return(weighted_df)
 
+def sparse_dtm_pl(tok_pl, count_by='pos', span_tables=None):
+	# token-level document-term matrix as a scipy.sparse CSR matrix, built from the span tables without a dense pivot
+	# returns the matrix, its rows (doc_id, sorted) and its columns (Token, Tag), which are ordered by total frequency as in dtm_pl
+	# tokens are counted as in the frequency tables, so the column sums are the AF column of ft_pos or ft_ds
+	if span_tables is None:
+		span_tables = span_tables_pl(tok_pl)
+	pos_spans, ds_spans, span_vocab = span_tables
+	lowers = lowers_pl(span_vocab)
+
+	if count_by == 'pos':
+		grouping_tag = "pos_tag"
+		spans = pos_spans
+		expr_filter = pl.col("pos_tag") != "Y"
+	else:
+		grouping_tag = "ds_tag"
+		spans = ds_spans
+		punct_ids = lowers.filter(pl.col("lower").str.contains("^[[[:punct:]] ]+$")).get_column("lower_id")
+		expr_filter = ~(pl.col("lower_id").is_in(punct_ids) & (pl.col("ds_tag") == "Untagged"))
+
+	# every document has a row, even if none of its tokens are counted
+	docs = spans.select(pl.col("doc_id").cast(pl.String).unique().sort())
+	counts = (
+		spans
+		.filter(expr_filter)
+		.group_by([pl.col("doc_id").cast(pl.String), "lower_id", pl.col(grouping_tag).cast(pl.String).alias("Tag")]).len()
+		)
+	types = (
+		counts
+		.group_by(["lower_id", "Tag"]).agg(pl.col("len").sum().alias("total"))
+		.join(lowers, on="lower_id")
+		.sort(["total", "lower", "Tag"], descending=[True, False, False])
+		.with_row_index("col")
+		)
+	cells = (
+		counts
+		.join(docs.with_row_index("row"), on="doc_id")
+		.join(types.select(["lower_id", "Tag", "col"]), on=["lower_id", "Tag"])
+		)
+	dtm = scipy.sparse.csr_matrix(
+		(cells.get_column("len").to_numpy(), (cells.get_column("row").to_numpy(), cells.get_column("col").to_numpy())),
+		shape=(docs.height, types.height)
+		)
+	return(dtm, docs, types.select([pl.col("lower").alias("Token"), "Tag"]))
+
+def sparse_dtm_weight(dtm, scheme="prop"):
+	# the weighting schemes of dtm_weight_pl for a sparse document-term matrix (see sparse_dtm_pl)
+	# only the stored counts are weighted, so the matrix stays sparse: "scale" divides each column by its standard deviation
+	# but does not center it, since subtracting the mean would fill in every zero (so it is not the "scale" of dtm_weight_pl);
+	# columns whose standard deviation is zero, or undefined in a one-document corpus, are left unscaled
+	dtm = dtm.tocsr().astype(np.float64)
+	if scheme == "prop":
+		totals = np.asarray(dtm.sum(axis=1)).ravel()
+		dtm.data = dtm.data / np.repeat(totals, np.diff(dtm.indptr))
+	if scheme == "scale":
+		n = dtm.shape[0]
+		mean = np.asarray(dtm.mean(axis=0)).ravel()
+		sq_mean = np.asarray(dtm.multiply(dtm).mean(axis=0)).ravel()
+		std = np.ones_like(mean)
+		if n > 1:
+			std = np.sqrt(np.clip(sq_mean - np.square(mean), 0, None) * n / (n - 1))
+			std[std == 0] = 1
+		dtm.data = dtm.data / std[dtm.indices]
+	if scheme == "tfidf":
+		idf = np.log10(dtm.shape[0] / dtm.getnnz(axis=0))
+		dtm.data = dtm.data * idf[dtm.indices]
+	return(dtm)
+
+def sparse_dtm_triplets_pl(dtm, docs, types):
+	# the stored cells of a sparse document-term matrix in long format (doc_id, Token, Tag, value)
+	dtm = dtm.tocoo()
+	triplets = (
+		pl.DataFrame({"row": dtm.row, "col": dtm.col, "value": dtm.data})
+		.with_columns(pl.col(["row", "col"]).cast(pl.UInt32))
+		.join(docs.with_row_index("row"), on="row")
+		.join(types.with_row_index("col"), on="col")
+		.sort(["row", "col"])
+		.select(["doc_id", "Token", "Tag", "value"])
+		)
+	return(triplets)
+
 def dtm_simplify_pl(dtm_pl):
  simple_df = (
 	dtm_pl
@@ -871,29 +1438,20 @@ def freq_simplify_pl(df_pl):
 
 
 def tags_simplify_pl(dtm_pl):
+	# unpivoted to one row per document and tag, so a large corpus is not transposed into one column per document
+	# every document in the matrix has tokens, so dropping the zeros leaves the number of documents unchanged
 	simple_df = (
 		dtm_pl
-		.transpose(include_header=True, header_name="Tag", column_names="doc_id")
-		.with_columns(
-				pl.sum_horizontal(pl.selectors.numeric() > 0)
-				.alias("Range")
-		)
-	.with_columns(
-		pl.col("Range").truediv(pl.sum_horizontal(pl.selectors.numeric().exclude("Range").is_not_null())).mul(100)
-		)
-		# calculate absolute frequency
-		.with_columns(
-			pl.sum_horizontal(pl.selectors.numeric().exclude("Range"))
-			.alias("AF")
-		)
+		.unpivot(pl.selectors.numeric(), index="doc_id", variable_name="Tag", value_name="len")
+		.filter(pl.col("len") > 0)
+		.pipe(summarize_counts_pl, ["Tag"], dispersion=True)
 		.sort("AF", descending = True)
-		.select(["Tag", "AF", "Range"])
 		# calculate relative frequency
 		.with_columns(
 			pl.col("AF").truediv(pl.sum("AF")).mul(100)
 			.alias("RF")
 		)
-		.select(["Tag", "AF", "RF", "Range"])
+		.select(["Tag", "AF", "RF", "Range"] + DISPERSIONS)
 		)
 	return(simple_df)
 
@@ -1062,12 +1620,30 @@ def scatterplots_pl(dtm_pl, axis_vals: list):
 	return(df_plot)
 
 
-def html_build_pl(tok_pl, doc_key):
+def html_build_pl(tok_pl, doc_key, span_tables=None, doc_offsets=None):
+	# the document's spans are read from the span tables, with their text from the span vocabulary
+	# with doc_offsets (see doc_offsets_pl) the document is sliced out rather than filtered from the whole corpus
+	if span_tables is None:
+		if doc_offsets is None:
+			doc_tokens = tok_pl.filter(pl.col("doc_id") == doc_key)
+		else:
+			doc_tokens = doc_slice_pl(tok_pl, doc_offsets, doc_key)
+		span_tables = span_tables_pl(doc_tokens)
+		doc_offsets = None
+	pos_spans, ds_spans, span_vocab = span_tables
+	if doc_offsets is None:
+		pos_spans = pos_spans.filter(pl.col("doc_id") == doc_key)
+		ds_spans = ds_spans.filter(pl.col("doc_id") == doc_key)
+	else:
+		pos_spans = doc_slice_pl(pos_spans, doc_offsets, doc_key, "pos")
+		ds_spans = doc_slice_pl(ds_spans, doc_offsets, doc_key, "ds")
+	texts = span_vocab.select(["span_id", pl.col("text").alias("token")])
+	doc_pos = pos_spans.join(texts, on="span_id", how="left").select(["pos_id", "pos_tag", "token"])
+	doc_ds = ds_spans.join(texts, on="span_id", how="left").select(["ds_id", "ds_tag", "token"])
+
 	html_pos = (
-		tok_pl
-		.filter(pl.col("doc_id") == doc_key)
-		.group_by(["pos_id", "pos_tag"], maintain_order = True)
-		.agg(pl.col("token").str.concat(""))
+		doc_pos
+		.with_columns(pl.col("pos_tag").cast(pl.String))
 		.with_columns(pl.col("token").str.extract("(\s)$")
 					.alias("ws"))
 		.with_columns(pl.col("token").str.strip_chars())
@@ -1095,10 +1671,8 @@ def html_build_pl(tok_pl, doc_key):
 	)
 
 	html_simple = (
-		tok_pl
-		.filter(pl.col("doc_id") == doc_key)
-		.group_by(["pos_id", "pos_tag"], maintain_order = True)
-		.agg(pl.col("token").str.concat(""))
+		doc_pos
+		.with_columns(pl.col("pos_tag").cast(pl.String))
 		.with_columns(pl.col("pos_tag")
 		.str.replace('^NN\S*$', '#NounCommon')
 		.str.replace('^VV\S*$', '#VerbLex')
@@ -1142,10 +1716,8 @@ def html_build_pl(tok_pl, doc_key):
 	)
 
 	html_ds = (
-		tok_pl
-		.filter(pl.col("doc_id") == doc_key)
-		.group_by(["ds_id", "ds_tag"], maintain_order = True)
-		.agg(pl.col("token").str.concat(""))
+		doc_ds
+		.with_columns(pl.col("ds_tag").cast(pl.String))
 		.with_columns(pl.col("token").str.extract("(\s)$")
 					.alias("ws"))
 		.with_columns(pl.col("token").str.strip_chars())
@@ -0,0 +1,84 @@
+# Copyright (C) 2024 David West Brown
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import pathlib
+
+import polars as pl
+
+from docuscope import _config
+from docuscope._utilities.filehash import hash_bytes
+
+# Functions for caching tagged documents on disk.
+# Entries are keyed by the hash of the uploaded bytes (as computed when uploads are spooled) together with the name and version of the model that tagged them,
+# the components it ran and how long documents were split, so re-uploading the same file with the same model and settings skips spaCy entirely.
+# Each entry is a parquet file with the token, pos_tag and ds_tag columns of a single document.
+# Reading an entry refreshes its modification time, which is what least-recently-used eviction sorts on.
+
+def get_cache_dir():
+	cache_dir = _config.get_config_dir().joinpath("cache", "tagged")
+	cache_dir.mkdir(parents=True, exist_ok=True)
+	return(cache_dir)
+
+def model_id(nlp_model, max_chars, chunk_chars):
+	# a profile that excludes the tagger or the ner leaves its tags empty, and the chunk sizes change where long documents are cut,
+	# so both are part of the key
+	meta = nlp_model.meta
+	pipes = "+".join(nlp_model.pipe_names)
+	return(f"{meta['lang']}_{meta['name']}-{meta['version']}_{pipes}_{max_chars}-{chunk_chars}")
+
+def cache_key(doc_hash, model_key):
+	return(hash_bytes(model_key.encode('utf-8'), doc_hash.encode('utf-8')))
+
+def read_cached(key, cache_dir=None):
+	# cache_dir defaults to the shared cache; resumable jobs pass their own checkpoint folder
+	cache_dir = get_cache_dir() if cache_dir is None else pathlib.Path(cache_dir)
+	path = cache_dir.joinpath(key + ".parquet")
+	try:
+		df = pl.read_parquet(path)
+		os.utime(path)
+	except:
+		return(None)
+	return(df)
+
+def write_cached(key, df, cache_dir=None):
+	cache_dir = get_cache_dir() if cache_dir is None else pathlib.Path(cache_dir)
+	path = cache_dir.joinpath(key + ".parquet")
+	temp_path = path.with_suffix(f".{os.getpid()}.tmp")
+	df.select(["token", "pos_tag", "ds_tag"]).write_parquet(temp_path)
+	os.replace(temp_path, path)
+
+def cache_info():
+	entries = list(get_cache_dir().glob("*.parquet"))
+	total_bytes = sum(f.stat().st_size for f in entries)
+	return(len(entries), total_bytes)
+
+def evict_cache(max_bytes):
+	# removes the least recently used entries until the cache fits within max_bytes
+	entries = [(f, f.stat()) for f in get_cache_dir().glob("*.parquet")]
+	entries = sorted(entries, key=lambda x: x[1].st_mtime)
+	total_bytes = sum(s.st_size for f, s in entries)
+	n_removed = 0
+	bytes_removed = 0
+	for f, s in entries:
+		if total_bytes <= max_bytes:
+			break
+		try:
+			f.unlink()
+		except FileNotFoundError:
+			pass
+		total_bytes -= s.st_size
+		n_removed += 1
+		bytes_removed += s.st_size
+	return(n_removed, bytes_removed)
@@ -14,6 +14,8 @@
 
 import os
 import pathlib
+import shutil
+import time
 
 import docx
 from docx.shared import RGBColor
@@ -21,6 +23,7 @@ from docx.shared import Pt
 import gzip
 import glob
 from io import BytesIO
+import numpy as np
 import pickle
 import streamlit as st
 import pandas as pd
@@ -29,11 +32,18 @@ import random
 import zipfile
 import xlsxwriter
 
+from docuscope._streamlit.utilities import analysis_functions as _analysis
+from docuscope._streamlit.utilities import process_corpus as _process
+
 HERE = pathlib.Path(__file__).parents[1].resolve()
 CORPUS_DIR = HERE.joinpath("_corpora")
 TEMP_DIR = HERE.joinpath("_temp")
 OPTIONS = str(HERE.joinpath("options.toml"))
 IMPORTS = str(HERE.joinpath("utilities/handlers_imports.py"))
+# tagsets as they are offered in the tools, and the tagging profile (see process_corpus.PIPE_PROFILES) that gives only that tagset
+TAGSETS = {"Parts-of-Speech": "pos", "DocuScope": "ds"}
+# spooled uploads of sessions that have not been used for this long (in seconds) are removed (see clean_spools)
+SPOOL_MAX_AGE = 24*60*60
 
 # Functions for handling states and files.
 # Handling can be done either by storing temporary files locally or by storing data in session memory.
@@ -87,28 +97,40 @@ def update_session(key, value, session_id):
 
 # Functions for storing and managing corpus metadata
 
-def init_metadata_target(session_id):
-	df = st.session_state[session_id]["target"]["ds_tokens"]
-	tags_to_check = df.get_column("ds_tag").to_list()
+def corpus_metadata(corpus):
+	# counts, ids and tags of a loaded corpus, read from its tables rather than by grouping ds_tokens again
+	# tokens are counted as in the tag tables: part-of-speech spans other than Y and DocuScope spans other than untagged punctuation
+	ds_tags = corpus["tt_ds"].get_column("Tag").to_list()
 	tags = ['Actors', 'Organization', 'Planning', 'Sentiment', 'Signposting', 'Stance']
-	if any(tag in item for item in tags_to_check for tag in tags):
+	if any(tag in item for item in ds_tags for tag in tags):
 		model = 'Common Dictionary'
 	else:
 		model = 'Large Dictionary'
-	ds_tags = df.get_column("ds_tag").unique().to_list()
-	tags_pos = df.get_column("pos_tag").unique().to_list()
-	if "Untagged" in ds_tags:
-		ds_tags.remove("Untagged")
-	if "Y" in tags_pos:
-		tags_pos.remove("Y")
-	temp_metadata_target = {}
-	temp_metadata_target['tokens_pos'] = df.group_by(["doc_id", "pos_id", "pos_tag"]).agg(pl.col("token").str.concat("")).filter(pl.col("pos_tag") != "Y").height
-	temp_metadata_target['tokens_ds'] = df.group_by(["doc_id", "ds_id", "ds_tag"]).agg(pl.col("token").str.concat("")).filter(~(pl.col("token").str.contains("^[[[:punct:]] ]+$") & pl.col("ds_tag").str.contains("Untagged"))).height
-	temp_metadata_target['ndocs'] = len(df.get_column("doc_id").unique().to_list())
-	temp_metadata_target['model'] = model
-	temp_metadata_target['docids'] = {'ids': sorted(df.get_column("doc_id").unique().to_list())}
-	temp_metadata_target['tags_ds'] = {'tags': sorted(ds_tags)}
-	temp_metadata_target['tags_pos'] = {'tags': sorted(tags_pos)}
+	# a pipeline without the tagger leaves every part-of-speech tag but punctuation and numbers empty,
+	# and one without the ner leaves every token untagged, so the tagsets are read from the tags as well
+	pos_tags = corpus["tt_pos"].get_column("Tag").to_list()
+	tagsets = []
+	if "" not in pos_tags:
+		tagsets.append("Parts-of-Speech")
+	if any(tag != "Untagged" for tag in ds_tags):
+		tagsets.append("DocuScope")
+	if "doc_offsets" in corpus:
+		doc_ids = corpus["doc_offsets"].get_column("doc_id").to_list()
+	else:
+		doc_ids = corpus["ds_tokens"].get_column("doc_id").unique().to_list()
+	metadata = {}
+	metadata['tokens_pos'] = corpus["tt_pos"].get_column("AF").sum() if "Parts-of-Speech" in tagsets else 0
+	metadata['tokens_ds'] = corpus["tt_ds"].get_column("AF").sum() if "DocuScope" in tagsets else 0
+	metadata['ndocs'] = len(doc_ids)
+	metadata['model'] = model
+	metadata['tagsets'] = {'tagsets': tagsets}
+	metadata['docids'] = {'ids': sorted(doc_ids)}
+	metadata['tags_ds'] = {'tags': sorted([tag for tag in ds_tags if tag != "Untagged"])}
+	metadata['tags_pos'] = {'tags': sorted(pos_tags) if "Parts-of-Speech" in tagsets else []}
+	return(metadata)
+
+def init_metadata_target(session_id):
+	temp_metadata_target = corpus_metadata(st.session_state[session_id]["target"])
 	temp_metadata_target['doccats'] = {'cats': ''}
 	temp_metadata_target['collocations'] = {'temp': ''}
 	temp_metadata_target['keyness_parts'] = {'temp': ''}
@@ -118,28 +140,8 @@ def init_metadata_target(session_id):
 	st.session_state[session_id]["metadata_target"] = df
 
 def init_metadata_reference(session_id):
-	df = st.session_state[session_id]["reference"]["ds_tokens"]
-	tags_to_check = df.get_column("ds_tag").to_list()
-	tags = ['Actors', 'Organization', 'Planning', 'Sentiment', 'Signposting', 'Stance']
-	if any(tag in item for item in tags_to_check for tag in tags):
-		model = 'Common Dictionary'
-	else:
-		model = 'Large Dictionary'
-	ds_tags = df.get_column("ds_tag").unique().to_list()
-	tags_pos = df.get_column("pos_tag").unique().to_list()
-	if "Untagged" in ds_tags:
-		ds_tags.remove("Untagged")
-	if "Y" in tags_pos:
-		tags_pos.remove("Y")
-	temp_metadata_reference = {}
-	temp_metadata_reference['tokens_pos'] = df.group_by(["doc_id", "pos_id", "pos_tag"]).agg(pl.col("token").str.concat("")).filter(pl.col("pos_tag") != "Y").height
-	temp_metadata_reference['tokens_ds'] = df.group_by(["doc_id", "ds_id", "ds_tag"]).agg(pl.col("token").str.concat("")).filter(~(pl.col("token").str.contains("^[[[:punct:]] ]+$") & pl.col("ds_tag").str.contains("Untagged"))).height
-	temp_metadata_reference['ndocs'] = len(df.get_column("doc_id").unique().to_list())
-	temp_metadata_reference['model'] = model
+	temp_metadata_reference = corpus_metadata(st.session_state[session_id]["reference"])
 	temp_metadata_reference['doccats'] = False
-	temp_metadata_reference['docids'] = {'ids': sorted(df.get_column("doc_id").unique().to_list())}
-	temp_metadata_reference['tags_ds'] = {'tags': sorted(ds_tags)}
-	temp_metadata_reference['tags_pos'] = {'tags': sorted(tags_pos)}
 
 	df = pl.from_dict(temp_metadata_reference, strict=False)
 	st.session_state[session_id]["metadata_reference"] = df
@@ -150,6 +152,31 @@ def load_metadata(corpus_type, session_id):
 	metadata = metadata.to_dict(as_series=False)
 	return(metadata)
 
+def corpus_tagsets(session_id, corpus_type='target'):
+	# the tagsets a loaded corpus was tagged with; both before a corpus is loaded or if its metadata does not record them
+	metadata = st.session_state[session_id].get("metadata_" + corpus_type)
+	if not isinstance(metadata, pl.DataFrame) or 'tagsets' not in metadata.columns:
+		return(list(TAGSETS.keys()))
+	return(metadata.get_column('tagsets')[0]['tagsets'])
+
+def corpus_profile(session_id, corpus_type='target'):
+	# the tagging profile that gives a loaded corpus' tagsets, so a reference or added documents are tagged like the target
+	tagsets = corpus_tagsets(session_id, corpus_type)
+	if len(tagsets) == 1:
+		return(TAGSETS[tagsets[0]])
+	return("full")
+
+def tagset_choices(choices, session_id, key=None, corpus_types=('target',)):
+	# the options of a tagset radio, without any tagset a loaded corpus was not tagged with; other options (e.g. "No Tag") are kept
+	# a choice remembered under key that is no longer offered is cleared, so the radio falls back to its first option
+	tagsets = set(TAGSETS.keys())
+	for corpus_type in corpus_types:
+		tagsets = tagsets.intersection(corpus_tagsets(session_id, corpus_type))
+	choices = tuple(choice for choice in choices if choice not in TAGSETS or choice in tagsets)
+	if key is not None and key in st.session_state and st.session_state[key] not in choices:
+		del st.session_state[key]
+	return(choices)
+
 def update_metadata(corpus_type, key, value, session_id):
 	table_name = "metadata_" + corpus_type
 	metadata = st.session_state[session_id][table_name]
@@ -169,6 +196,12 @@ def update_metadata(corpus_type, key, value, session_id):
 
 # Functions for handling corpora
 
+@st.cache_data(persist="disk", show_spinner=False)
+def saved_dispersions(db_path, db_stamp, _corpus):
+	# dispersion measures for a saved corpus whose tables predate them, persisted so they are computed once per saved corpus
+	# rather than on every load; db_stamp (names, sizes and modification times of its files) changes if the corpus is replaced
+	return(_analysis.update_dispersions_pl(_corpus))
+
 def load_corpus_internal(db_path, session_id, corpus_type='target'):
 	if corpus_type not in st.session_state[session_id]:
 		st.session_state[session_id][corpus_type] = {}
@@ -195,40 +228,120 @@ def load_corpus_internal(db_path, session_id, corpus_type='target'):
 			if key not in st.session_state[session_id][corpus_type]:
 				st.session_state[session_id][corpus_type][key] = {}
 			st.session_state[session_id][corpus_type][key] = value
-
-def load_corpus_new(ds_tokens,
-					dtm_ds,
-					dtm_pos,
-					ft_ds,
-					ft_pos,
-					tt_ds,
-					tt_pos,
-					session_id, 
-					corpus_type='target'):
-
+		# saved corpora hold the seven tables, so the vocabulary, span tables and offsets are built here
+		ds_tokens = st.session_state[session_id][corpus_type]["ds_tokens"]
+		if isinstance(ds_tokens, pl.DataFrame):
+			st.session_state[session_id][corpus_type].update(_analysis.index_corpus_pl(ds_tokens))
+			# tables saved before the dispersion measures were added are given them from the span tables
+			if "DP" not in st.session_state[session_id][corpus_type]["ft_pos"].columns:
+				db_stamp = tuple((os.path.basename(file), os.path.getsize(file), os.path.getmtime(file)) for file in sorted(files_list))
+				st.session_state[session_id][corpus_type].update(saved_dispersions(str(db_path), db_stamp, st.session_state[session_id][corpus_type]))
+
+def load_corpus_new(corpus, session_id, corpus_type='target'):
+	# corpus holds ds_tokens, the seven tables and the vocabulary, span tables and document offsets (see analysis_functions.build_corpus_pl)
 	if corpus_type not in st.session_state[session_id]:
 		st.session_state[session_id][corpus_type] = {}
-	if "ds_tokens" not in st.session_state[session_id][corpus_type]:
-		st.session_state[session_id][corpus_type]["ds_tokens"] = {}
-	st.session_state[session_id][corpus_type]["ds_tokens"] = ds_tokens
-	if "dtm_ds" not in st.session_state[session_id][corpus_type]:
-		st.session_state[session_id][corpus_type]["dtm_ds"] = {}
-	st.session_state[session_id][corpus_type]["dtm_ds"] = dtm_ds
-	if "dtm_pos" not in st.session_state[session_id][corpus_type]:
-		st.session_state[session_id][corpus_type]["dtm_pos"] = {}
-	st.session_state[session_id][corpus_type]["dtm_pos"] = dtm_pos
-	if "ft_ds" not in st.session_state[session_id][corpus_type]:
-		st.session_state[session_id][corpus_type]["ft_ds"] = {}
-	st.session_state[session_id][corpus_type]["ft_ds"] = ft_ds	
-	if "ft_pos" not in st.session_state[session_id][corpus_type]:
-		st.session_state[session_id][corpus_type]["ft_pos"] = {}
-	st.session_state[session_id][corpus_type]["ft_pos"] = ft_pos	
-	if "tt_ds" not in st.session_state[session_id][corpus_type]:
-		st.session_state[session_id][corpus_type]["tt_ds"] = {}
-	st.session_state[session_id][corpus_type]["tt_ds"] = tt_ds	
-	if "tt_pos" not in st.session_state[session_id][corpus_type]:
-		st.session_state[session_id][corpus_type]["tt_pos"] = {}
-	st.session_state[session_id][corpus_type]["tt_pos"] = tt_pos
+	for key, value in corpus.items():
+		st.session_state[session_id][corpus_type][key] = value
+
+def get_span_tables(session_id, corpus_type='target'):
+	# the span tables of a loaded corpus, or None if they were not built when it was loaded
+	corpus = st.session_state[session_id][corpus_type]
+	if "pos_spans" not in corpus:
+		return(None)
+	return((corpus["pos_spans"], corpus["ds_spans"], corpus["span_vocab"]))
+
+def spool_uploads(docs, session_id, corpus_type='target', target_docs=None, folder_categories=False, max_bytes=None):
+	# uploads are written once to the session's folder in _temp and tagging reads them back from there
+	# the spooled files are remembered across reruns so that they are not copied again
+	# with max_bytes, spooling stops once the decompressed uploads pass it (see process_corpus.spool_corpus)
+	spool_dir = TEMP_DIR.joinpath(session_id, corpus_type)
+	key = "spooled_" + corpus_type
+	if key not in st.session_state[session_id]:
+		st.session_state[session_id][key] = {}
+	return(_process.spool_corpus(docs, spool_dir, st.session_state[session_id][key], target_docs, folder_categories, max_bytes))
+
+def clear_spool(session_id, corpus_type=None):
+	# removes the spooled uploads of a corpus type (or, with corpus_type=None, all of a session's) once they have been tagged
+	# or the session is reset; tagging jobs keep their own links to their inputs, so this is safe while a job exists
+	corpus_types = [corpus_type] if corpus_type is not None else ['target', 'reference', 'added']
+	for item in corpus_types:
+		st.session_state[session_id].pop("spooled_" + item, None)
+		st.session_state[session_id].pop("signatures_" + item, None)
+	spool_dir = TEMP_DIR.joinpath(session_id) if corpus_type is None else TEMP_DIR.joinpath(session_id, corpus_type)
+	shutil.rmtree(spool_dir, ignore_errors=True)
+
+def clean_spools(max_age=SPOOL_MAX_AGE):
+	# Streamlit has no hook for the end of a session, so the spool folders of sessions that have not been touched
+	# for max_age seconds are removed instead; called when a new session starts
+	if not TEMP_DIR.exists():
+		return
+	cutoff = time.time() - max_age
+	for path in TEMP_DIR.iterdir():
+		if not path.is_dir() or path.name == "jobs":
+			continue
+		try:
+			last_used = max([path.stat().st_mtime] + [item.stat().st_mtime for item in path.rglob("*")])
+		except FileNotFoundError:
+			continue
+		if last_used < cutoff:
+			shutil.rmtree(path, ignore_errors=True)
+
+def find_duplicates(docs, session_id, corpus_type='target'):
+	# signatures of the spooled documents are kept across reruns, so each upload is only read once
+	key = "signatures_" + corpus_type
+	if key not in st.session_state[session_id]:
+		st.session_state[session_id][key] = {}
+	signatures = st.session_state[session_id][key]
+	current = set(doc.hash for doc in docs)
+	for doc_hash in [doc_hash for doc_hash in signatures if doc_hash not in current]:
+		del signatures[doc_hash]
+	return(_process.find_duplicates(docs, signatures))
+
+def add_documents(tok_pl, session_id, corpus_type='target'):
+	corpus = _analysis.add_documents_pl(st.session_state[session_id][corpus_type], tok_pl)
+	st.session_state[session_id][corpus_type].update(corpus)
+	refresh_metadata(corpus_type, session_id)
+
+def remove_documents(doc_ids, session_id, corpus_type='target'):
+	corpus = _analysis.remove_documents_pl(st.session_state[session_id][corpus_type], doc_ids)
+	st.session_state[session_id][corpus_type].update(corpus)
+	refresh_metadata(corpus_type, session_id)
+
+def update_language_report(timings, session_id, corpus_type='target', append=False):
+	# per-document language screening (see process_corpus.screen_language), shown on the load page
+	# documents added to a loaded corpus are appended to the rows of the corpus they were added to
+	key = "language_" + corpus_type
+	report = _process.language_report_pl(timings)
+	if append == True and key in st.session_state[session_id]:
+		report = pl.concat([st.session_state[session_id][key], report]).sort("seconds", descending=True)
+	st.session_state[session_id][key] = report
+
+def update_dispersions(session_id, corpus_type='target'):
+	# adding or removing documents drops the dispersion measures rather than counting the whole corpus again on every change,
+	# so views that show them fill them in here when they are missing
+	corpus = st.session_state[session_id][corpus_type]
+	if "DP" not in corpus["ft_pos"].columns:
+		corpus.update(_analysis.update_dispersions_pl(corpus))
+
+def refresh_metadata(corpus_type, session_id):
+	# after documents are added or removed, update counts, ids and tags from the (already updated) tables
+	# and discard any results that were computed from the previous set of documents
+	corpus = st.session_state[session_id][corpus_type]
+	table_name = "metadata_" + corpus_type
+	metadata = st.session_state[session_id][table_name]
+	metadata = metadata.to_dict(as_series=False)
+	metadata.update({key: [value] for key, value in corpus_metadata(corpus).items() if key != 'model'})
+	if corpus_type == 'target':
+		metadata['doccats'] = [{'cats': ''}]
+		metadata['collocations'] = [{'temp': ''}]
+		metadata['keyness_parts'] = [{'temp': ''}]
+		metadata['variance'] = [{'temp': ''}]
+		update_session('has_meta', False, session_id)
+	df = pl.from_dict(metadata, strict=False)
+	st.session_state[session_id][table_name] = df
+	for key in ['keyness_table', 'ngrams', 'kwic', 'keyness_parts', 'pca', 'collocations', 'doc']:
+		update_session(key, False, session_id)
 
 def find_saved(model_type: str):
 	SUB_DIR = CORPUS_DIR.joinpath(model_type)
@@ -267,6 +380,31 @@ def convert_to_excel(_df):
 	processed_data = output.getvalue()
 	return processed_data
 
+def convert_sparse_dtm_to_npz(dtm, docs, types):
+	# the CSR arrays in the layout of scipy.sparse.save_npz, so the file opens with scipy.sparse.load_npz,
+	# together with the row and column labels (doc_id, Token, Tag), which numpy.load reads without pickling
+	dtm = dtm.tocsr()
+	output = BytesIO()
+	np.savez_compressed(
+		output,
+		format=np.array("csr"),
+		shape=np.array(dtm.shape),
+		data=dtm.data,
+		indices=dtm.indices,
+		indptr=dtm.indptr,
+		doc_id=np.array(docs.get_column("doc_id").to_list(), dtype=str),
+		Token=np.array(types.get_column("Token").to_list(), dtype=str),
+		Tag=np.array(types.get_column("Tag").to_list(), dtype=str)
+		)
+	processed_data = output.getvalue()
+	return processed_data
+
+def convert_sparse_dtm_to_parquet(dtm, docs, types):
+	output = BytesIO()
+	_analysis.sparse_dtm_triplets_pl(dtm, docs, types).write_parquet(output)
+	processed_data = output.getvalue()
+	return processed_data
+
 def add_alt_chunk(doc: docx.Document, html: str):
     package = doc.part.package
     partname = package.next_partname('/word/altChunk%d.html')
@@ -327,40 +465,45 @@ def convert_corpus_to_zip(session_id, corpus_type, file_type="parquet"):
 	processed_data = zip_buf.getvalue()
 	return(processed_data)
 
-def convert_to_zip(tok_pl, tagset):
+def convert_to_zip(tok_pl, tagset, span_tables=None):
+	# every document is formatted in one pass over the span table; span texts are formatted once per distinct text
+	if span_tables is None:
+		span_tables = _analysis.span_tables_pl(tok_pl)
+	pos_spans, ds_spans, span_vocab = span_tables
+	texts = (
+		span_vocab
+		.select(["span_id", pl.col("text").alias("token")])
+		.with_columns(pl.col("token").str.strip_chars())
+		.with_columns(pl.col("token").str.replace_all(" ", "_"))
+		)
+	if tagset == "pos":
+		df = (
+			pos_spans
+			.join(texts, on="span_id", how="left")
+			.with_columns(pl.when(pl.col("pos_tag") == "Y").then(pl.lit(""))
+						.when(pl.col("pos_tag") == "FU").then(pl.lit(""))
+						.otherwise(pl.col("pos_tag").cast(pl.String)))
+			.with_columns(pl.concat_str(pl.col("token"), pl.lit("|"), pl.col("pos_tag")))
+			)
+	else:
+		df = (
+			ds_spans
+			.join(texts, on="span_id", how="left")
+			.with_columns(pl.when(pl.col("ds_tag") == "Untagged")
+						.then(pl.lit(""))
+						.otherwise(pl.col("ds_tag").cast(pl.String)))
+			.with_columns(pl.concat_str(pl.col("token"), pl.lit("|"), pl.col("ds_tag")))
+			)
+	docs = (
+		df
+		.with_columns(pl.col("token").str.replace_all("\|$", ""))
+		.group_by(pl.col("doc_id").cast(pl.String), maintain_order = True)
+		.agg(pl.col("token").str.concat(" "))
+		)
 	zip_buf = BytesIO()
 	with zipfile.ZipFile(zip_buf, 'w', zipfile.ZIP_DEFLATED) as file_zip:
-		for id in tok_pl.get_column("doc_id").unique().to_list():
-				if tagset == "pos":
-					df = (
-						tok_pl
-						.filter(pl.col("doc_id") == id)
-						.group_by(["pos_id", "pos_tag"], maintain_order = True)
-						.agg(pl.col("token").str.concat(""))
-						.with_columns(pl.col("token").str.strip_chars())
-						.with_columns(pl.col("token").str.replace_all(" ", "_"))
-						.with_columns(pl.when(pl.col("pos_tag") == "Y").then(pl.col("pos_tag").str.replace("Y", "", literal=True))
-									.when(pl.col("pos_tag") == "FU").then(pl.col("pos_tag").str.replace("FU", "", literal=True))
-									.otherwise(pl.col("pos_tag")))
-						.with_columns(pl.concat_str(pl.col("token"), pl.lit("|"), pl.col("pos_tag")))
-						.with_columns(pl.col("token").str.replace_all("\|$", ""))
-						)
-				else:
-					df = (
-						tok_pl
-						.filter(pl.col("doc_id") == id)
-						.group_by(["ds_id", "ds_tag"], maintain_order = True)
-						.agg(pl.col("token").str.concat(""))
-						.with_columns(pl.col("token").str.strip_chars())
-						.with_columns(pl.col("token").str.replace_all(" ", "_"))
-						.with_columns(pl.when(pl.col("ds_tag") == "Untagged")
-									.then(pl.col("ds_tag").str.replace("Untagged", "", literal=True))
-									.otherwise(pl.col("ds_tag")))
-						.with_columns(pl.concat_str(pl.col("token"), pl.lit("|"), pl.col("ds_tag")))
-						.with_columns(pl.col("token").str.replace_all("\|$", ""))
-						)
-				doc = " ".join(df.get_column("token").to_list())
-				file_zip.writestr(id + "_tagged"+ ".txt", doc)
+		for id, doc in docs.iter_rows():
+			file_zip.writestr(id + "_tagged"+ ".txt", doc)
 	processed_data = zip_buf.getvalue()
 	return(processed_data)
 
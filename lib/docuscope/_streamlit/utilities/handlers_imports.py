@@ -29,6 +29,14 @@ def import_options_load(options_path):
 		options['global']['enable_save'] = False
 		options['global']['desktop_mode'] = False
 		options['global']['max_bytes'] = 0
+		options['global']['batch_size'] = None
+		options['global']['n_process'] = 1
+		options['global']['chunk_size'] = 500
+		options['global']['cache_max_bytes'] = 0
+		options['global']['large_docs'] = False
+		options['global']['pipe_profile'] = 'full'
+		options['global']['warm_up_models'] = []
+		options['global']['token_encoding'] = 'string'
 
 	# language can't be checked on Windows so toggle off.
 	if options['global']['check_language'] == True and (sys.platform == "win" or sys.platform == "cygwin"):
@@ -56,6 +64,14 @@ def import_options_general(options_path):
 		options['global']['enable_save'] = False
 		options['global']['desktop_mode'] = False
 		options['global']['max_bytes'] = 0
+		options['global']['batch_size'] = None
+		options['global']['n_process'] = 1
+		options['global']['chunk_size'] = 500
+		options['global']['cache_max_bytes'] = 0
+		options['global']['large_docs'] = False
+		options['global']['pipe_profile'] = 'full'
+		options['global']['warm_up_models'] = []
+		options['global']['token_encoding'] = 'string'
 
 	return(options)
 			
@@ -0,0 +1,147 @@
+# Copyright (C) 2024 David West Brown
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import pathlib
+import shutil
+import time
+
+from docuscope._streamlit.utilities import process_corpus as _process
+from docuscope._utilities.filehash import hash_bytes
+
+HERE = pathlib.Path(__file__).parents[1].resolve()
+JOBS_DIR = HERE.joinpath("_temp", "jobs")
+# jobs that have not checkpointed a document for this long (in seconds) are removed (see clean_jobs)
+JOB_MAX_AGE = 7*24*60*60
+
+# A tagging job keeps its own copy of the input files and checkpoints each document's tokens as soon as it is tagged:
+#
+#   _temp/jobs/<job_id>/manifest.json      model, profile, corpus type, session and the input documents
+#   _temp/jobs/<job_id>/inputs/*.txt       hard links to (or copies of) the spooled uploads
+#   _temp/jobs/<job_id>/checkpoints/*.parquet
+#
+# If the session disconnects or the server restarts, running the job again only tags the documents without a checkpoint.
+# Job ids are derived from the documents, model and profile, so processing the same files again resumes the same job.
+# Streamlit gives a reconnected session a new id, so jobs are also found by the content hashes of the uploads (see find_jobs).
+
+def get_job_id(docs, corpus_type, model_name, profile="full"):
+	doc_hashes = sorted(doc.name + ":" + doc.hash for doc in docs)
+	return(hash_bytes(corpus_type.encode(), model_name.encode(), profile.encode(), *[h.encode() for h in doc_hashes])[:16])
+
+def job_dir(job_id):
+	return(JOBS_DIR.joinpath(job_id))
+
+def read_manifest(job_id):
+	try:
+		with open(job_dir(job_id).joinpath("manifest.json"), encoding="utf-8") as f:
+			return(json.load(f))
+	except (OSError, ValueError):
+		return(None)
+
+def write_manifest(job_id, manifest):
+	path = job_dir(job_id).joinpath("manifest.json")
+	tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+	with open(tmp_path, "w", encoding="utf-8") as f:
+		json.dump(manifest, f)
+	os.replace(tmp_path, path)
+
+def create_job(docs, session_id, corpus_type, model_name, profile="full"):
+	# docs are spooled documents (see process_corpus.spool_corpus); returns the job id
+	# an existing job for the same documents is taken over by this session rather than started again
+	job_id = get_job_id(docs, corpus_type, model_name, profile)
+	manifest = read_manifest(job_id)
+	if manifest is not None:
+		manifest["session_id"] = session_id
+		write_manifest(job_id, manifest)
+		return(job_id)
+	input_dir = job_dir(job_id).joinpath("inputs")
+	os.makedirs(input_dir, exist_ok=True)
+	os.makedirs(job_dir(job_id).joinpath("checkpoints"), exist_ok=True)
+	inputs = []
+	for i, doc in enumerate(docs):
+		path = input_dir.joinpath(f"{i:06d}.txt")
+		if not path.exists():
+			try:
+				os.link(doc.path, path)
+			except OSError:
+				shutil.copyfile(doc.path, path)
+		inputs.append({"name": doc.name, "path": path.name, "size": doc.size, "hash": doc.hash})
+	manifest = {
+		"job_id": job_id,
+		"session_id": session_id,
+		"corpus_type": corpus_type,
+		"model": model_name,
+		"profile": profile,
+		"created": time.time(),
+		"docs": inputs
+		}
+	# the manifest is written last, so a job only exists once all of its inputs are in place
+	write_manifest(job_id, manifest)
+	return(job_id)
+
+def job_docs(job_id):
+	manifest = read_manifest(job_id)
+	input_dir = job_dir(job_id).joinpath("inputs")
+	return([_process.SpooledDoc(str(input_dir.joinpath(doc["path"])), doc["name"], doc["size"], doc["hash"]) for doc in manifest["docs"]])
+
+def job_progress(job_id):
+	# (documents checkpointed, documents in the job)
+	manifest = read_manifest(job_id)
+	checkpoints = set(path.stem for path in job_dir(job_id).joinpath("checkpoints").glob("*.parquet"))
+	return((sum(doc["hash"] in checkpoints for doc in manifest["docs"]), len(manifest["docs"])))
+
+def list_jobs(session_id=None, corpus_type=None):
+	# manifests of unfinished jobs, newest first, with their progress; session_id=None lists every session's jobs
+	jobs = []
+	if not JOBS_DIR.exists():
+		return(jobs)
+	for path in JOBS_DIR.iterdir():
+		manifest = read_manifest(path.name)
+		if manifest is None:
+			continue
+		if session_id is not None and manifest["session_id"] != session_id:
+			continue
+		if corpus_type is not None and manifest["corpus_type"] != corpus_type:
+			continue
+		manifest["done"], manifest["total"] = job_progress(path.name)
+		jobs.append(manifest)
+	return(sorted(jobs, key=lambda job: job["created"], reverse=True))
+
+def find_jobs(docs, corpus_type=None):
+	# unfinished jobs of any session over exactly these documents, matched on names and content hashes as in get_job_id
+	doc_hashes = sorted(doc.name + ":" + doc.hash for doc in docs)
+	jobs = list_jobs(corpus_type=corpus_type)
+	return([job for job in jobs if sorted(doc["name"] + ":" + doc["hash"] for doc in job["docs"]) == doc_hashes])
+
+def clean_jobs(max_age=JOB_MAX_AGE):
+	# removes jobs (and folders of jobs whose manifest was never written) that have not been touched for max_age seconds
+	if not JOBS_DIR.exists():
+		return
+	cutoff = time.time() - max_age
+	for path in JOBS_DIR.iterdir():
+		try:
+			last_used = max([path.stat().st_mtime] + [item.stat().st_mtime for item in path.rglob("*")])
+		except FileNotFoundError:
+			continue
+		if last_used < cutoff:
+			shutil.rmtree(path, ignore_errors=True)
+
+def run_job(job_id, nlp_model, detect_model=None, detect_language=None, **kwargs):
+	# tags the job's documents with process_corpus.stream_corpus, checkpointing as it goes; kwargs are passed on
+	checkpoint_dir = job_dir(job_id).joinpath("checkpoints")
+	os.makedirs(checkpoint_dir, exist_ok=True)
+	return(_process.stream_corpus(job_docs(job_id), nlp_model, detect_model, detect_language, checkpoint_dir=checkpoint_dir, **kwargs))
+
+def remove_job(job_id):
+	shutil.rmtree(job_dir(job_id), ignore_errors=True)
@@ -0,0 +1,65 @@
+# Copyright (C) 2024 David West Brown
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import pathlib
+import threading
+import time
+
+HERE = pathlib.Path(__file__).parents[1].resolve()
+MODELS = {
+	"Large Dictionary": str(HERE.joinpath("models/en_docusco_spacy")),
+	"Common Dictionary": str(HERE.joinpath("models/en_docusco_spacy_cd"))
+	}
+
+# Models are held once per server process and loaded the first time a dictionary is asked for.
+# Each dictionary has its own lock, so a session waiting for one model is not held up by another being loaded.
+
+_models = {}
+_locks = {}
+_load_times = {}
+_registry_lock = threading.Lock()
+
+def get_model(model_name: str, profile="full"):
+	from docuscope._streamlit.utilities import process_corpus as _process
+	key = (model_name, profile)
+	with _registry_lock:
+		lock = _locks.setdefault(key, threading.Lock())
+	with lock:
+		if key not in _models:
+			start = time.perf_counter()
+			_models[key] = _process.load_model(MODELS[model_name], profile)
+			_load_times[key] = time.perf_counter() - start
+			logging.info("Loaded %s (%s) in %.2fs", model_name, profile, _load_times[key])
+	return(_models[key])
+
+def is_loaded(model_name: str, profile="full"):
+	return((model_name, profile) in _models)
+
+def load_times():
+	# seconds taken to load each model so far, keyed by (model_name, profile)
+	return(dict(_load_times))
+
+def warm_up(model_names=None, profile="full"):
+	# loads models on a daemon thread so they are resident before the first corpus is processed
+	if model_names is None:
+		model_names = list(MODELS.keys())
+	def _load():
+		for model_name in model_names:
+			try:
+				get_model(model_name, profile)
+			except Exception:
+				logging.exception("Could not warm up %s", model_name)
+	thread = threading.Thread(target=_load, name="docuscope-model-warm-up", daemon=True)
+	thread.start()
+	return(thread)
@@ -137,6 +137,7 @@ message_load_target_new = """
     :file_folder: After processing, you will have the option to save your corpus to use for future analysis. This is not necessary, but may be useful if you plan to revisit the data.\n
     :exclamation: Don't forget to select your model from the sidebar if you are processing a new corpus.\n
     :exclamation: Be sure that all file names are unique.\n
+    :package: You can also upload a single .zip or .tar.gz archive of text files. If your files are sorted into folders by category, check the box to use the folder names as document categories.\n
     :alarm_clock: Processing times may vary, but you can expect the initial corpus processing to take roughly 1 minute for every 1 million words.
     """
 
@@ -145,6 +146,7 @@ message_load_reference = """
     * Once you've selected your files, click the **UPLOAD** button and a processing button will appear in the sidebar.\n
     :exclamation: Your reference will be tagged with the same model as your target corpus.\n
     :exclamation: Be sure that all file names are unique and that they don't share names with your target corpus.\n
+    :package: You can also upload a single .zip or .tar.gz archive of text files.\n
     :alarm_clock: Processing times may vary, but you can expect the initial corpus processing to take roughly 1 minute for every 1 million words.
     """
 
@@ -290,9 +292,33 @@ message_naming = """
     You can designate up to 20 categories.
 	"""
 
+message_add_remove = """
+    :heavy_plus_sign: Upload plain text files to tag them with the model of your loaded corpus and add them to it. Files must not have the same names as loaded documents.\n
+    :heavy_minus_sign: Or select documents to remove from the corpus.\n
+    :exclamation: Only the new or removed documents are processed, but any document categories and results you have generated will need to be updated.
+    """
+
+message_language_report = """
+    :mag: Documents were screened for English before tagging. Each row shows how many 1,000-character samples were scored, their mean confidence, whether the document passed and the seconds spent on it.
+    Documents whose first sample is scored with near certainty skip the other samples.
+    """
+
+message_resume_jobs = """
+    :hourglass_flowing_sand: Processing of the corpora below was interrupted. Documents are saved as soon as they are tagged, so resuming only tags the rest.
+    Processing the same files again with the same model also picks up where it left off.
+    """
+
+message_resume_uploads = """
+    :hourglass_flowing_sand: These files were being processed when an earlier session was disconnected. Resuming only tags the documents that are missing.
+    Processing them from the sidebar with the same model also picks up where it left off.
+    """
+
 message_models = """
 	For detailed descriptions, see the tags tables available from the Help menu.
 	But in short, the full dictionary has more categories and coverage than the common dictionary.
+
+	Processing only one tagset is faster. The tools are then limited to that tagset,
+	and a reference corpus or documents added later are processed the same way.
 	"""
 
 message_association_measures = """
@@ -341,6 +367,9 @@ message_columns_tags = """
 	Note that for part-of-speech tags, tokens are normalized against word tokens,
 	while DocuScope tags are normalized against counts of all tokens including punctuation.
 	The **Range** column refers to the percentage of documents in which the token appears in your corpus.
+	The **DP**, **D** and **D2** columns measure how evenly the token is dispersed across documents, taking their lengths into account:
+	Gries' **DP** runs from 0 (spread in proportion to document length) to 1 (concentrated in very few documents),
+	while Juilland's **D** and Carroll's **D2** run from 0 (uneven) to 1 (perfectly even).
 	"""
 
 message_columns_tokens = """
@@ -349,6 +378,9 @@ message_columns_tokens = """
 	Note that for part-of-speech tags, tokens are normalized against word tokens,
 	while DocuScope tags are normalized against counts of all tokens including punctuation.
 	The **Range** column refers to the percentage of documents in which the token appears in your corpus.
+	The **DP**, **D** and **D2** columns measure how evenly the token is dispersed across documents, taking their lengths into account:
+	Gries' **DP** runs from 0 (spread in proportion to document length) to 1 (concentrated in very few documents),
+	while Juilland's **D** and Carroll's **D2** run from 0 (uneven) to 1 (perfectly even).
 	"""
 
 message_anchor_tags = """
@@ -12,36 +12,96 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from collections import OrderedDict
+import bz2
+from collections import Counter, OrderedDict, deque
+import gzip
+import hashlib
+import itertools
+import lzma
 import math
+import numpy as np
 import os
+import pathlib
 import polars as pl
-import random
 import re
+import spacy
 import string
+import tarfile
+import time
 import unidecode
+import zipfile
 
-def check_language(text_str, detect_model, detect_language):
+from spacy.attrs import ENT_IOB, ENT_TYPE, ORTH, SPACY, TAG
+
+from docuscope._streamlit.utilities import handlers_cache as _cache
+from docuscope._utilities.filehash import hash_bytes
+
+IS_PUNCT = re.compile("[{}]+\s*$".format(re.escape(string.punctuation)))
+IS_DIGIT = re.compile("\d[\d{}]*\s*$".format(re.escape(string.punctuation)))
+# "its" or "Its" as a whole word; the lookbehind follows the first letter so the search can skip ahead to candidate letters
+IS_ITS = re.compile(r'([Ii])(?<!\w[Ii])ts\b')
+NON_ASCII = re.compile(r'[^\x00-\x7f]+')
+SENT_SPLIT = re.compile(r'[\.\?!] [A-Z]')
+
+# spaCy's default max_length; longer documents are split into chunks before tagging
+MAX_CHARS = 1000000
+CHUNK_CHARS = 750000
+# in large document mode, long documents are cut into smaller chunks that can be spread across worker processes
+LARGE_DOC_CHARS = 200000
+LARGE_CHUNK_CHARS = 100000
+# uploads are spooled to disk in blocks of this many bytes
+SPOOL_BLOCK = 1048576
+# uploads with these extensions are corpus archives whose .txt members are the documents
+TAR_TYPES = ('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tar.xz')
+# and these are single compressed text files, each holding one document
+COMPRESSED_TYPES = {'.gz': gzip.open, '.bz2': bz2.open, '.xz': lzma.open}
+ARCHIVE_TYPES = ('.zip',) + TAR_TYPES + tuple(COMPRESSED_TYPES.keys())
+# components each tagging profile needs: the tagger writes tag_ (part-of-speech), the ner writes ent_iob_/ent_type_ (DocuScope)
+# and both listen to the shared tok2vec; any other component in a model is never read by the tools
+PIPE_PROFILES = {"full": ["tok2vec", "tagger", "ner"], "pos": ["tok2vec", "tagger"], "ds": ["tok2vec", "ner"]}
+# a first language sample at or above this confidence settles a document without scoring the other samples
+LANGUAGE_SURE = .99
+
+# ds_tokens columns that can be stored as categoricals, and the encodings accepted by encode_tokens_pl
+ENCODED_COLUMNS = ["doc_id", "pos_tag", "ds_tag"]
+TOKEN_ENCODINGS = ("string", "categorical")
+
+# near-duplicate detection: MinHash signatures over word 5-grams, split into LSH bands of 4 rows
+# 16 bands of 4 put documents with a Jaccard similarity of .5 or more in a shared bucket more often than not
+# (and those at .8 all but certainly), and candidates are then confirmed by their exact Jaccard similarity against NEAR_DUP_THRESHOLD
+WORD = re.compile(r'\w+')
+SHINGLE_WORDS = 5
+MINHASH_PERM = 64
+LSH_BANDS = 16
+NEAR_DUP_THRESHOLD = .8
+_MINHASH_RNG = np.random.default_rng(20240501)
+MINHASH_A = _MINHASH_RNG.integers(1, 2**63, size=MINHASH_PERM, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+MINHASH_B = _MINHASH_RNG.integers(0, 2**63, size=MINHASH_PERM, dtype=np.uint64)
+
+def load_model(model_path, profile="full"):
+	# reads the model's pipeline from its config and excludes every component the profile does not need,
+	# so those components are neither loaded nor run
+	pipeline = spacy.util.load_config(pathlib.Path(model_path).joinpath("config.cfg"))["nlp"]["pipeline"]
+	exclude = [pipe for pipe in pipeline if pipe not in PIPE_PROFILES[profile]]
+	nlp = spacy.load(model_path, exclude=exclude)
+	return(nlp)
+
+def language_samples(text_str):
+	# up to three 1,000-character samples taken at fixed positions, so screening is reproducible
 	doc_len = len(text_str)
-	predictions = []
 	if doc_len > 5000:
-		idx_a = random.randint(0, doc_len - 1500)
-		idx_b = random.randint(0, doc_len - 1500)
-		idx_c = random.randint(0, doc_len - 1500)
-		sample_a = text_str[idx_a:idx_a + 1000]
-		sample_a = " ".join(sample_a.split())
-		sample_b = text_str[idx_b:idx_b + 1000]
-		sample_b = " ".join(sample_b.split())
-		sample_c = text_str[idx_c:idx_c + 1000]
-		sample_c = " ".join(sample_c.split())
-		text_sample = [sample_a, sample_b, sample_c]
-		#get prediction for each chunk
-		for chunk in text_sample:  # Language predict each sampled chunk
-			value = detect_model.compute_language_confidence(chunk, detect_language)
-			predictions.append(value)
+		idx_list = [(doc_len - 1500)*k//6 for k in (3, 1, 5)]
+		text_sample = [text_str[idx:idx + 1000] for idx in idx_list]
 	else:
-		text_str = " ".join(text_str.split())
-		value = detect_model.compute_language_confidence(text_str, detect_language)
+		text_sample = [text_str]
+	text_sample = [" ".join(unidecode.unidecode(sample).split()) for sample in text_sample]
+	return text_sample
+
+def check_language(text_str, detect_model, detect_language):
+	predictions = []
+	#get prediction for each chunk
+	for chunk in language_samples(text_str):  # Language predict each sampled chunk
+		value = detect_model.compute_language_confidence(chunk, detect_language)
 		predictions.append(value)
 		
 	confidence = sum(predictions) / len(predictions)
@@ -49,145 +109,470 @@ def check_language(text_str, detect_model, detect_language):
 	# Only want to know if this is english or not.
 	return confidence > .9
 
-def pre_process(txt):
-	txt = re.sub(r'\bits\b', 'it s', txt)
-	txt = re.sub(r'\bIts\b', 'It s', txt)
-	txt = " ".join(txt.split())
-	return(txt)
-
-def process_corpus(corp, nlp_model):
-	is_punct = re.compile("[{}]+\s*$".format(re.escape(string.punctuation)))
-	is_digit = re.compile("\d[\d{}]*\s*$".format(re.escape(string.punctuation)))
-	tp = {}
-	exceptions = []
+def screen_language(corp, detect_model, detect_language, exceptions, timings=None):
+	# language screening as a stage of its own, run before any tagging; returns the documents that pass
+	# the first (middle) sample of every document is scored in one parallel call and documents that are confidently
+	# in the language skip the other two samples; the rest are scored in a second parallel call and averaged as in check_language
+	# documents that cannot be decoded are passed through for read_corpus to report
+	# with timings (a list), a row per document is appended: samples scored, confidence, result and seconds
+	# (time to sample plus its share of the parallel scoring calls)
+	samples = {}
+	seconds = {}
 	for doc in corp:
+		start = time.perf_counter()
 		try:
 			doc_txt = doc.getvalue().decode('utf-8')
 		except:
-			exceptions.append(doc.name)
+			continue
+		samples[doc.name] = language_samples(doc_txt)
+		seconds[doc.name] = time.perf_counter() - start
+	names = list(samples.keys())
+	predictions = {name: [] for name in names}
+	for stage in (0, 1):
+		if stage == 0:
+			batch = [(name, samples[name][0]) for name in names]
+		else:
+			batch = [(name, sample) for name in names for sample in samples[name][1:] if predictions[name][0] < LANGUAGE_SURE]
+		if len(batch) == 0:
+			continue
+		start = time.perf_counter()
+		values = detect_model.compute_language_confidence_in_parallel([sample for name, sample in batch], detect_language)
+		share = (time.perf_counter() - start)/len(batch)
+		for (name, sample), value in zip(batch, values):
+			predictions[name].append(value)
+			seconds[name] += share
+	passed = set()
+	for name in names:
+		confidence = sum(predictions[name]) / len(predictions[name])
+		is_english = predictions[name][0] >= LANGUAGE_SURE or confidence > .9
+		if is_english == True:
+			passed.add(name)
 		else:
-			doc_txt = unidecode.unidecode(doc_txt)
-			doc_id = doc.name.replace(" ", "")
-			doc_id = str(os.path.splitext(doc_id)[0])
-			doc_txt = pre_process(doc_txt)
-			doc_len = len(doc_txt)
-			if doc_len > 1000000:
-				n_chunks = math.ceil(doc_len/750000)
-				chunk_idx = [math.ceil(i/n_chunks*doc_len) for i in range(1, n_chunks)]
-				try:
-					split_idx = [re.search('[\.\?!] [A-Z]', doc_txt[idx:]).span()[1] + (idx-1) for idx in chunk_idx]
-				except:
-					try:
-						split_idx = [re.search(' ', doc_txt[idx:]).span()[0] + idx for idx in chunk_idx]
-					except:
-						exceptions.append(doc.name)
-				else:
-					split_idx.insert(0, 0)
-					doc_chunks = [doc_txt[i:j] for i, j in zip(split_idx, split_idx[1:]+[None])]
-					token_list = []
-					tag_list = []
-					iob_ent = []
-					for chunk in doc_chunks:
-						chunk_taged = nlp_model(chunk)
-						token_chunk = [token.text for token in chunk_taged]
-						ws_chunk = [token.whitespace_ for token in chunk_taged]
-						token_chunk = list(map(''.join, zip(token_chunk, ws_chunk)))
-						iob_chunk = [token.ent_iob_ for token in chunk_taged]
-						ent_chunk = [token.ent_type_ for token in chunk_taged]
-						iob_ent_chunk = list(map('-'.join, zip(iob_chunk, ent_chunk)))
-						tag_chunk = [token.tag_ for token in chunk_taged]
-						tag_chunk = ['Y' if bool(is_punct.match(token_chunk[i])) else v for i, v in enumerate(tag_chunk)]
-						tag_chunk = ['MC' if bool(is_digit.match(token_chunk[i])) and tag_chunk[i] != 'Y' else v for i, v in enumerate(tag_chunk)]
-						token_list.append(token_chunk)
-						tag_list.append(tag_chunk)
-						iob_ent.append(iob_ent_chunk)
-					token_list = [item for sublist in token_list for item in sublist]
-					tag_list = [item for sublist in tag_list for item in sublist]
-					iob_ent = [item for sublist in iob_ent for item in sublist]
-					tp.update({doc_id: (list(zip(token_list, tag_list, iob_ent)))})
+			exceptions.append(name)
+		if timings is not None:
+			timings.append({"doc_id": get_doc_id(name), "samples": len(predictions[name]), "confidence": confidence, "passed": is_english, "seconds": seconds[name]})
+	corp = [doc for doc in corp if doc.name in passed or doc.name not in samples]
+	return corp
+
+def language_report_pl(timings):
+	# the rows appended to timings by screen_language as a frame, slowest documents first
+	schema = OrderedDict([('doc_id', pl.String), ('samples', pl.UInt32), ('confidence', pl.Float64), ('passed', pl.Boolean), ('seconds', pl.Float64)])
+	report = pl.DataFrame(timings, schema=schema).sort("seconds", descending=True)
+	return(report)
+
+def pre_process(txt):
+	# whitespace is collapsed first, so the "its" rewrite scans the shorter string, and is skipped when there is nothing to rewrite
+	txt = " ".join(txt.split())
+	if "its" in txt or "Its" in txt:
+		txt = IS_ITS.sub(r'\1t s', txt)
+	return(txt)
+
+def normalize_text(doc_txt):
+	# unidecode returns ASCII unchanged and transliterates character by character,
+	# so pure-ASCII documents skip it and other documents only pass their non-ASCII runs through it
+	if not doc_txt.isascii():
+		doc_txt = NON_ASCII.sub(lambda match: unidecode.unidecode(match.group()), doc_txt)
+	doc_txt = pre_process(doc_txt)
+	return(doc_txt)
+
+def split_doc(doc_txt, max_chars=MAX_CHARS, chunk_chars=CHUNK_CHARS):
+	# documents longer than max_chars are split into chunks of roughly chunk_chars at sentence boundaries
+	# split points are found in one forward pass: each search starts from its target position in the original string (no slicing),
+	# falling back to the next space when no sentence boundary follows
+	# each chunk keeps its trailing space, so the last token of a chunk carries its whitespace when chunks are stitched back together
+	doc_len = len(doc_txt)
+	if doc_len <= max_chars:
+		return [doc_txt]
+	n_chunks = math.ceil(doc_len/chunk_chars)
+	split_idx = [0]
+	for i in range(1, n_chunks):
+		idx = max(math.ceil(i/n_chunks*doc_len), split_idx[-1])
+		match = SENT_SPLIT.search(doc_txt, idx)
+		if match is not None:
+			split = match.end() - 1
+		else:
+			split = doc_txt.find(' ', idx) + 1
+			if split == 0:
+				return None
+		if split > split_idx[-1] and split < doc_len:
+			split_idx.append(split)
+	doc_chunks = [doc_txt[i:j] for i, j in zip(split_idx, split_idx[1:]+[None])]
+	return doc_chunks
+
+def tag_doc_pl(doc_taged):
+	# the tokens of a tagged doc as a polars frame (token with its trailing whitespace, pos_tag, ds_tag as iob-entity)
+	# attributes are read from the doc as hash arrays and each distinct hash is resolved against the vocab only once
+	# (iob 0, no annotation, reads as outside)
+	attrs = doc_taged.to_array([ORTH, SPACY, TAG, ENT_IOB, ENT_TYPE])
+	keys = np.unique(attrs[:, [0, 2, 4]])
+	values = [doc_taged.vocab.strings[int(k)] for k in keys]
+	df = (
+		pl.DataFrame(
+			{"token": attrs[:, 0], "ws": attrs[:, 1], "pos_tag": attrs[:, 2], "iob": attrs[:, 3], "ent": attrs[:, 4]},
+			schema={"token": pl.UInt64, "ws": pl.UInt64, "pos_tag": pl.UInt64, "iob": pl.UInt64, "ent": pl.UInt64}
+		)
+		.with_columns(
+			pl.col(["token", "pos_tag", "ent"]).replace_strict(keys, values, return_dtype=pl.String)
+		)
+		.with_columns(
+			pl.concat_str(pl.col("token"), pl.when(pl.col("ws") == 1).then(pl.lit(" ")).otherwise(pl.lit(""))),
+			pl.concat_str(pl.col("iob").replace_strict([0, 1, 2, 3], ["O", "I", "O", "B"], return_dtype=pl.String), pl.lit("-"), pl.col("ent"))
+			.alias("ds_tag")
+		)
+		.with_columns(
+			pl.when(pl.col("token").str.contains("^" + IS_PUNCT.pattern))
+			.then(pl.lit("Y"))
+			.when(pl.col("token").str.contains("^" + IS_DIGIT.pattern))
+			.then(pl.lit("MC"))
+			.otherwise(pl.col("pos_tag"))
+			.alias("pos_tag")
+		)
+		.select(["token", "pos_tag", "ds_tag"])
+	)
+	return df
+
+def get_doc_id(file_name):
+	doc_id = file_name.replace(" ", "")
+	doc_id = str(os.path.splitext(doc_id)[0])
+	return doc_id
+
+class SpooledDoc:
+	# an upload spooled to disk: it reads like an UploadedFile (name, getvalue) but its bytes are only held while being read
+	def __init__(self, path, name, size, doc_hash):
+		self.path = path
+		self.name = name
+		self.size = size
+		self.hash = doc_hash
+
+	def getvalue(self):
+		with open(self.path, 'rb') as f:
+			return(f.read())
+
+def is_archive(file_name):
+	return(file_name.lower().endswith(ARCHIVE_TYPES))
+
+def spool_file(fileobj, path, name, max_bytes=None):
+	# copies a file object to path in blocks, hashing it on the way
+	# with max_bytes, copying stops once more than max_bytes have been written, leaving a partial file for the caller to remove
+	hasher = hashlib.sha1()
+	size = 0
+	with open(path, 'wb') as f:
+		for block in iter(lambda: fileobj.read(SPOOL_BLOCK), b''):
+			hasher.update(block)
+			f.write(block)
+			size += len(block)
+			if max_bytes is not None and size > max_bytes:
+				break
+	return(SpooledDoc(path, name, size, hasher.hexdigest()))
+
+def archive_members(archive, folder_categories=False):
+	# yields (doc name, file object) for each .txt member of a .zip or .tar(.gz/.bz2/.xz) archive, decompressing one member at a time
+	# tar archives are read as a stream, so members are never seeked back to
+	# a single compressed file (e.g. essay.txt.gz) is one member, named without its compression extension
+	# doc names come from member file names; with folder_categories the name of the folder holding a member is prefixed
+	# (e.g. BIO/essay 1.txt becomes BIO_essay1), so that sub-folders become document categories
+	def doc_name(member_path):
+		parts = [part for part in member_path.replace('\\', '/').split('/') if part != '']
+		if len(parts) == 0 or parts[-1].startswith('.') or '__MACOSX' in parts or not parts[-1].lower().endswith('.txt'):
+			return(None)
+		if folder_categories == True and len(parts) > 1:
+			return(parts[-2].replace('_', '-') + '_' + parts[-1])
+		return(parts[-1])
+	archive.seek(0)
+	if archive.name.lower().endswith('.zip'):
+		with zipfile.ZipFile(archive) as zf:
+			for info in zf.infolist():
+				name = doc_name(info.filename)
+				if info.is_dir() or name is None:
+					continue
+				with zf.open(info) as member:
+					yield name, member
+	elif not archive.name.lower().endswith(TAR_TYPES):
+		name, ext = os.path.splitext(archive.name)
+		if not name.lower().endswith('.txt'):
+			name = name + '.txt'
+		with COMPRESSED_TYPES[ext.lower()](archive, 'rb') as member:
+			yield name, member
+	else:
+		with tarfile.open(fileobj=archive, mode='r|*') as tf:
+			for info in tf:
+				name = doc_name(info.name)
+				if not info.isfile() or name is None:
+					continue
+				yield name, tf.extractfile(info)
+	archive.seek(0)
+
+def spool_corpus(docs, spool_dir, spooled=None, target_docs=None, folder_categories=False, max_bytes=None):
+	# copies uploads to spool_dir in one streaming pass, computing each file's size and content hash as it is written
+	# and collecting duplicate doc ids (and ids already in target_docs) along the way
+	# archives (.zip, .tar.gz, etc.) are expanded member by member, each member becoming a document of its own
+	# spooled is an optional dict kept between calls (e.g. across Streamlit reruns): uploads already spooled are not copied again
+	# and spooled files that are no longer among the uploads are removed
+	# with max_bytes, spooling stops as soon as the decompressed total passes it, so that a small archive that expands
+	# to many gigabytes is never written out in full; the files of the upload being spooled are removed
+	# and no documents are returned, with a total size over max_bytes
+	# returns the spooled documents, duplicate ids, ids shared with target_docs and the total size in bytes
+	os.makedirs(spool_dir, exist_ok=True)
+	if spooled is None:
+		spooled = {}
+	target_docs = set(target_docs) if target_docs is not None else set()
+	spooled_docs = []
+	seen = set()
+	dup_ids = set()
+	corpus_size = 0
+	for i, doc in enumerate(docs):
+		# only Streamlit uploads carry a file_id that identifies their content; anything else is always copied
+		file_id = getattr(doc, 'file_id', None)
+		if file_id is None:
+			file_id = f"doc_{i:06d}"
+			spooled.pop(file_id, None)
+		source = (doc.name, folder_categories)
+		# an upload is spooled again if its source changed or its files were cleaned up in the meantime
+		if file_id not in spooled or spooled[file_id][0] != source or not all(os.path.exists(member.path) for member in spooled[file_id][1]):
+			members = []
+			remaining = None if max_bytes is None else max_bytes - corpus_size
+			if is_archive(doc.name):
+				for j, (name, member) in enumerate(archive_members(doc, folder_categories)):
+					members.append(spool_file(member, os.path.join(spool_dir, f"{file_id}_{j:06d}.txt"), name, remaining))
+					if remaining is not None:
+						remaining -= members[-1].size
+						if remaining < 0:
+							break
 			else:
-				doc_taged = nlp_model(doc_txt)
-				token_list = [token.text for token in doc_taged]
-				ws_list = [token.whitespace_ for token in doc_taged]
-				token_list = list(map(''.join, zip(token_list, ws_list)))
-				iob_list = [token.ent_iob_ for token in doc_taged]
-				ent_list = [token.ent_type_ for token in doc_taged]
-				iob_ent = list(map('-'.join, zip(iob_list, ent_list)))
-				tag_list = [token.tag_ for token in doc_taged]
-				tag_list = ['Y' if bool(is_punct.match(token_list[i])) else v for i, v in enumerate(tag_list)]
-				tag_list = ['MC' if bool(is_digit.match(token_list[i])) and tag_list[i] != 'Y' else v for i, v in enumerate(tag_list)]
-				tp.update({doc_id: (list(zip(token_list, tag_list, iob_ent)))})
-				tp = dict(sorted(tp.items()))
-	return tp, exceptions
-
-def process_corpus_detect(corp, nlp_model, detect_model, detect_language):
-	is_punct = re.compile("[{}]+\s*$".format(re.escape(string.punctuation)))
-	is_digit = re.compile("\d[\d{}]*\s*$".format(re.escape(string.punctuation)))
-	tp = {}
-	exceptions = []
+				doc.seek(0)
+				members.append(spool_file(doc, os.path.join(spool_dir, f"{file_id}.txt"), doc.name, remaining))
+				doc.seek(0)
+			if remaining is not None and remaining < 0:
+				for member in members:
+					os.remove(member.path)
+				return([], [], [], corpus_size + sum(member.size for member in members))
+			spooled[file_id] = (source, members)
+		for member in spooled[file_id][1]:
+			doc_id = get_doc_id(member.name)
+			if doc_id in seen:
+				dup_ids.add(doc_id)
+			seen.add(doc_id)
+			spooled_docs.append(member)
+			corpus_size += member.size
+		# uploads spooled on an earlier call count towards the limit too
+		if max_bytes is not None and corpus_size > max_bytes:
+			return([], [], [], corpus_size)
+	current = set(doc.path for doc in spooled_docs)
+	for file_id in list(spooled.keys()):
+		if all(member.path not in current for member in spooled[file_id][1]):
+			for member in spooled[file_id][1]:
+				if os.path.exists(member.path):
+					os.remove(member.path)
+			del spooled[file_id]
+	return(spooled_docs, sorted(dup_ids), sorted(seen.intersection(target_docs)), corpus_size)
+
+def shingle_hashes(doc_txt):
+	# sorted, unique uint64 hashes of the word shingles in a text, or None if it has no words
+	# words are hashed by polars, and shingles with wrapping uint64 arithmetic
+	words = WORD.findall(doc_txt.lower())
+	if len(words) == 0:
+		return(None)
+	word_hashes = pl.Series(words, dtype=pl.String).hash(seed=0).to_numpy()
+	n = max(len(words) - SHINGLE_WORDS + 1, 1)
+	shingles = np.zeros(n, dtype=np.uint64)
+	for k in range(min(SHINGLE_WORDS, len(words))):
+		shingles = shingles * np.uint64(1000003) + word_hashes[k:k + n]
+	return(np.unique(shingles))
+
+def minhash_signature(doc_txt):
+	# MinHash signature (MINHASH_PERM uint64 values) of the set of word shingles in a text, or None if it has no words
+	# shingles are permuted with wrapping uint64 arithmetic (multiply-shift)
+	shingles = shingle_hashes(doc_txt)
+	if shingles is None:
+		return(None)
+	signature = np.full(MINHASH_PERM, np.iinfo(np.uint64).max, dtype=np.uint64)
+	for start in range(0, len(shingles), 4096):
+		block = shingles[start:start + 4096]
+		hashed = (np.outer(MINHASH_A, block) + MINHASH_B[:, None]) >> np.uint64(32)
+		signature = np.minimum(signature, hashed.min(axis=1))
+	return(signature)
+
+def find_duplicates(docs, signatures=None, threshold=NEAR_DUP_THRESHOLD):
+	# groups documents with identical content (by hash) and near-duplicates (by MinHash/LSH) in time linear in the corpus
+	# signatures is an optional dict of doc hash -> signature kept between calls, so documents are only read once
+	# returns (exact, near), each a list of groups of documents in upload order; the first of each group is the one to keep
+	if signatures is None:
+		signatures = {}
+	by_hash = {}
+	for doc in docs:
+		doc_hash = getattr(doc, 'hash', None) or hash_bytes(doc.getvalue())
+		by_hash.setdefault(doc_hash, []).append(doc)
+	exact = [group for group in by_hash.values() if len(group) > 1]
+	# near-duplicates are looked for among one document of each distinct content
+	hashes = list(by_hash.keys())
+	for doc_hash in hashes:
+		if doc_hash not in signatures:
+			try:
+				signatures[doc_hash] = minhash_signature(by_hash[doc_hash][0].getvalue().decode('utf-8'))
+			except UnicodeDecodeError:
+				signatures[doc_hash] = None
+	parent = list(range(len(hashes)))
+	def find(i):
+		while parent[i] != i:
+			parent[i] = parent[parent[i]]
+			i = parent[i]
+		return(i)
+	rows = MINHASH_PERM // LSH_BANDS
+	buckets = {}
+	for i, doc_hash in enumerate(hashes):
+		signature = signatures[doc_hash]
+		if signature is None:
+			continue
+		for band in range(LSH_BANDS):
+			buckets.setdefault((band, signature[band*rows:(band + 1)*rows].tobytes()), []).append(i)
+	# every pair of documents sharing a bucket is a candidate, confirmed by the exact Jaccard similarity of their shingles
+	# (a MinHash estimate over 64 permutations misses a few pairs near the threshold); only candidates are read again
+	candidates = set()
+	for members in buckets.values():
+		candidates.update(itertools.combinations(members, 2))
+	shingles = {}
+	def doc_shingles(i):
+		if i not in shingles:
+			shingles[i] = shingle_hashes(by_hash[hashes[i]][0].getvalue().decode('utf-8'))
+		return(shingles[i])
+	for i, j in sorted(candidates):
+		if find(i) == find(j):
+			continue
+		a, b = doc_shingles(i), doc_shingles(j)
+		shared = np.intersect1d(a, b, assume_unique=True).size
+		if shared/(a.size + b.size - shared) >= threshold:
+			parent[find(j)] = find(i)
+	groups = {}
+	for i in range(len(hashes)):
+		groups.setdefault(find(i), []).append(by_hash[hashes[i]][0])
+	near = [group for group in groups.values() if len(group) > 1]
+	return(exact, near)
+
+def drop_duplicates(docs, exact, near):
+	# keeps the first document of each group returned by find_duplicates
+	drop = set(id(doc) for group in exact + near for doc in group[1:])
+	return([doc for doc in docs if id(doc) not in drop])
+
+def read_corpus(corp, exceptions, detect_model=None, detect_language=None, cache_model=None, cached=None, max_chars=MAX_CHARS, chunk_chars=CHUNK_CHARS, timings=None, checkpoint_dir=None):
+	# yields (text, (doc_id, is_last_chunk, [(cache_key, cache_dir), ...])) pairs suitable for nlp.pipe(as_tuples=True)
+	# with cache_model set, documents found in the tagging cache are appended to cached as (doc_id, frame) and not yielded
+	# with checkpoint_dir set, the same happens for documents already checkpointed there, and tagged documents are checkpointed to it
+	if detect_model is not None:
+		corp = screen_language(corp, detect_model, detect_language, exceptions, timings)
 	for doc in corp:
 		try:
-			doc_txt = doc.getvalue().decode('utf-8')
+			doc_bytes = doc.getvalue()
+			doc_txt = doc_bytes.decode('utf-8')
 		except:
 			exceptions.append(doc.name)
+			continue
+		doc_id = get_doc_id(doc.name)
+		doc_hash = getattr(doc, 'hash', None) or hash_bytes(doc_bytes)
+		keys = []
+		if checkpoint_dir is not None:
+			keys.append((doc_hash, checkpoint_dir))
+		if cache_model is not None:
+			keys.append((_cache.cache_key(doc_hash, cache_model), None))
+		doc_tokens = None
+		for key, cache_dir in keys:
+			doc_tokens = _cache.read_cached(key, cache_dir)
+			if doc_tokens is not None:
+				break
+		if doc_tokens is not None:
+			cached.append((doc_id, doc_tokens.select(pl.lit(doc_id).alias("doc_id"), pl.all())))
+			continue
+		doc_txt = normalize_text(doc_txt)
+		doc_chunks = split_doc(doc_txt, max_chars, chunk_chars)
+		if doc_chunks is None:
+			exceptions.append(doc.name)
+			continue
+		for i, chunk in enumerate(doc_chunks):
+			yield chunk, (doc_id, i == len(doc_chunks) - 1, keys)
+
+def iter_corpus(texts, nlp_model, batch_size=None, n_process=1, cached=None):
+	# batch_size=None tags one document at a time; otherwise documents are streamed through nlp.pipe
+	# with n_process > 1 (or -1 for all cores) spaCy fans batches out to worker processes, each with its own copy of the model
+	# nlp.pipe returns documents in input order, so the chunks of long documents arrive together
+	# yields (doc_id, tokens) as soon as the last chunk of a document has been tagged, as one polars frame (doc_id, token, pos_tag, ds_tag)
+	# documents read from the tagging cache or a job's checkpoints are merged back in doc_id order,
+	# and newly tagged ones are written to each (key, cache_dir) in their context
+	if batch_size is None and n_process == 1:
+		tagged = ((nlp_model(txt), context) for txt, context in texts)
+	else:
+		tagged = nlp_model.pipe(texts, as_tuples=True, batch_size=batch_size, n_process=n_process)
+	if cached is None:
+		cached = deque()
+	doc_tokens = []
+	for doc_taged, (doc_id, is_last, keys) in tagged:
+		doc_tokens.append(tag_doc_pl(doc_taged))
+		if is_last:
+			doc_tokens = pl.concat(doc_tokens).select(pl.lit(doc_id).alias("doc_id"), pl.all())
+			for key, cache_dir in keys:
+				_cache.write_cached(key, doc_tokens, cache_dir)
+			while len(cached) > 0 and cached[0][0] < doc_id:
+				yield cached.popleft()
+			yield doc_id, doc_tokens
+			doc_tokens = []
+	while len(cached) > 0:
+		yield cached.popleft()
+
+def stream_corpus(corp, nlp_model, detect_model=None, detect_language=None, batch_size=None, n_process=1, chunk_size=500, spill_dir=None, cache_max_bytes=0, large_docs=False, timings=None, checkpoint_dir=None):
+	# tags, converts and appends chunk_size documents at a time, so spaCy docs and per-document frames are only ever held for one chunk
+	# uploads are ordered by doc_id first so the result is sorted like the output of tokens_to_pl
+	# with spill_dir each converted chunk is written to a parquet file and a LazyFrame scanning those files is returned
+	# cache_max_bytes > 0 reuses previously tagged documents from the on-disk cache, which is then trimmed to that size
+	# large_docs=True (with n_process != 1) cuts long documents into smaller chunks and pipes them one at a time,
+	# so that the chunks of a single book-length text are tagged in parallel rather than by one worker
+	# with a detect_model, per-document language screening timings are appended to timings (see screen_language)
+	# with checkpoint_dir, each tagged document is checkpointed there and a rerun over the same documents only tags what is missing
+	exceptions = []
+	corp = sorted(corp, key=lambda doc: get_doc_id(doc.name))
+	max_chars, chunk_chars = MAX_CHARS, CHUNK_CHARS
+	if large_docs == True and n_process != 1:
+		max_chars, chunk_chars, batch_size = LARGE_DOC_CHARS, LARGE_CHUNK_CHARS, 1
+	cache_model = _cache.model_id(nlp_model, max_chars, chunk_chars) if cache_max_bytes > 0 else None
+	cached = deque()
+	texts = read_corpus(corp, exceptions, detect_model, detect_language, cache_model=cache_model, cached=cached, max_chars=max_chars, chunk_chars=chunk_chars, timings=timings, checkpoint_dir=checkpoint_dir)
+	docs = iter_corpus(texts, nlp_model, batch_size=batch_size, n_process=n_process, cached=cached)
+	chunks = []
+	carry = {"pos_id": None, "pos_tag": None, "ds_id": None, "ds_tag": None}
+	for i in itertools.count():
+		chunk = [doc_tokens for doc_id, doc_tokens in itertools.islice(docs, chunk_size)]
+		if len(chunk) == 0:
+			break
+		df = (
+			tokens_to_pl({"chunk": pl.concat(chunk, rechunk=False)})
+			# ids are cumulative over the whole corpus, so continue from the previous chunk
+			.with_columns(
+				pl.col("pos_id").add(carry["pos_id"] or 0).cast(pl.UInt32),
+				pl.col("ds_id").add(carry["ds_id"] or 0).cast(pl.UInt32)
+			)
+			# ids and tags are forward filled, so any leading gap takes the values that ended the previous chunk
+			.with_columns(
+				pl.col("pos_id").fill_null(pl.lit(carry["pos_id"], dtype=pl.UInt32)),
+				pl.col("pos_tag").fill_null(pl.lit(carry["pos_tag"], dtype=pl.String)),
+				pl.col("ds_id").fill_null(pl.lit(carry["ds_id"], dtype=pl.UInt32)),
+				pl.col("ds_tag").fill_null(pl.lit(carry["ds_tag"], dtype=pl.String))
+			)
+		)
+		# blank documents have no token rows, so a chunk of only blank documents has nothing to carry over or write
+		if df.height == 0:
+			continue
+		carry = df.select(list(carry.keys())).row(-1, named=True)
+		if spill_dir is not None:
+			df.write_parquet(os.path.join(spill_dir, f"ds_tokens_{i:05d}.parquet"))
+			chunks.append(i)
 		else:
-			doc_txt = unidecode.unidecode(doc_txt)
-			is_english = check_language(doc_txt, detect_model, detect_language)
-			if is_english == False:
-				exceptions.append(doc.name)
-			else:
-				doc_id = doc.name.replace(" ", "")
-				doc_id = str(os.path.splitext(doc_id)[0])
-				doc_txt = pre_process(doc_txt)
-				doc_len = len(doc_txt)
-				if doc_len > 1000000:
-					n_chunks = math.ceil(doc_len/750000)
-					chunk_idx = [math.ceil(i/n_chunks*doc_len) for i in range(1, n_chunks)]
-					try:
-						split_idx = [re.search('[\.\?!] [A-Z]', doc_txt[idx:]).span()[1] + (idx-1) for idx in chunk_idx]
-					except:
-						try:
-							split_idx = [re.search(' ', doc_txt[idx:]).span()[0] + idx for idx in chunk_idx]
-						except:
-							exceptions.append(doc.name)
-					else:
-						split_idx.insert(0, 0)
-						doc_chunks = [doc_txt[i:j] for i, j in zip(split_idx, split_idx[1:]+[None])]
-						token_list = []
-						tag_list = []
-						iob_ent = []
-						for chunk in doc_chunks:
-							chunk_taged = nlp_model(chunk)
-							token_chunk = [token.text for token in chunk_taged]
-							ws_chunk = [token.whitespace_ for token in chunk_taged]
-							token_chunk = list(map(''.join, zip(token_chunk, ws_chunk)))
-							iob_chunk = [token.ent_iob_ for token in chunk_taged]
-							ent_chunk = [token.ent_type_ for token in chunk_taged]
-							iob_ent_chunk = list(map('-'.join, zip(iob_chunk, ent_chunk)))
-							tag_chunk = [token.tag_ for token in chunk_taged]
-							tag_chunk = ['Y' if bool(is_punct.match(token_chunk[i])) else v for i, v in enumerate(tag_chunk)]
-							tag_chunk = ['MC' if bool(is_digit.match(token_chunk[i])) and tag_chunk[i] != 'Y' else v for i, v in enumerate(tag_chunk)]
-							token_list.append(token_chunk)
-							tag_list.append(tag_chunk)
-							iob_ent.append(iob_ent_chunk)
-						token_list = [item for sublist in token_list for item in sublist]
-						tag_list = [item for sublist in tag_list for item in sublist]
-						iob_ent = [item for sublist in iob_ent for item in sublist]
-						tp.update({doc_id: (list(zip(token_list, tag_list, iob_ent)))})
-				else:
-					doc_taged = nlp_model(doc_txt)
-					token_list = [token.text for token in doc_taged]
-					ws_list = [token.whitespace_ for token in doc_taged]
-					token_list = list(map(''.join, zip(token_list, ws_list)))
-					iob_list = [token.ent_iob_ for token in doc_taged]
-					ent_list = [token.ent_type_ for token in doc_taged]
-					iob_ent = list(map('-'.join, zip(iob_list, ent_list)))
-					tag_list = [token.tag_ for token in doc_taged]
-					tag_list = ['Y' if bool(is_punct.match(token_list[i])) else v for i, v in enumerate(tag_list)]
-					tag_list = ['MC' if bool(is_digit.match(token_list[i])) and tag_list[i] != 'Y' else v for i, v in enumerate(tag_list)]
-					tp.update({doc_id: (list(zip(token_list, tag_list, iob_ent)))})
-					tp = dict(sorted(tp.items()))
-	return tp, exceptions
+			chunks.append(df)
+	if cache_model is not None:
+		_cache.evict_cache(cache_max_bytes)
+	if len(chunks) == 0:
+		validation = OrderedDict([('doc_id', pl.String), ('token', pl.String), ('pos_tag', pl.String), ('ds_tag', pl.String), ('pos_id', pl.UInt32), ('ds_id', pl.UInt32)])
+		return pl.DataFrame(schema=validation), exceptions
+	if spill_dir is not None:
+		return pl.scan_parquet(os.path.join(spill_dir, "ds_tokens_*.parquet")), exceptions
+	ds_tokens = pl.concat(chunks)
+	return ds_tokens, exceptions
 
 def get_corpus_features(ibis_conn):
 	df = ibis_conn.table('ds_tokens').to_polars()
@@ -207,11 +592,7 @@ def check_corpus(docs, check_size=False, check_ref=False, target_docs=None):
 		#check for duplicates
 		doc_ids = [str(os.path.splitext(doc.name)[0]) for doc in docs]
 		doc_ids = [doc.replace(" ", "") for doc in doc_ids]
-		if len(doc_ids) > len(set(doc_ids)):
-			dup_ids = [x for x in doc_ids if doc_ids.count(x) >= 2]
-			dup_ids = list(set(dup_ids))
-		else:
-			dup_ids = []
+		dup_ids = [x for x, n in Counter(doc_ids).items() if n >= 2]
 		if check_ref and target_docs is not None:
 			dup_docs = list(set(target_docs).intersection(doc_ids))
 	else:
@@ -228,8 +609,22 @@ def check_corpus(docs, check_size=False, check_ref=False, target_docs=None):
 		return(dup_ids)
 
 def check_schema(tok_pl):
+	# doc_id, pos_tag and ds_tag may also be categorical (see encode_tokens_pl)
 	validation = OrderedDict([('doc_id', pl.String), ('token', pl.String), ('pos_tag', pl.String), ('ds_tag', pl.String), ('pos_id', pl.UInt32), ('ds_id', pl.UInt32)])
-	return tok_pl.schema == validation
+	schema = tok_pl.schema
+	if list(schema.keys()) != list(validation.keys()):
+		return False
+	return all(schema[col] == dtype or (col in ENCODED_COLUMNS and schema[col] in (pl.Categorical, pl.Enum)) for col, dtype in validation.items())
+
+def encode_tokens_pl(tok_pl, encoding="categorical"):
+	# doc_id, pos_tag and ds_tag repeat a few thousand values over every token row
+	# "categorical" stores them as pl.Categorical under the global string cache, so that target and reference corpora
+	# share one mapping and can be joined or concatenated; "string" turns them back into pl.String
+	# parquet files written from categorical frames keep the encoding (as dictionary columns)
+	if encoding == "categorical":
+		pl.enable_string_cache()
+		return(tok_pl.with_columns(pl.col(ENCODED_COLUMNS).cast(pl.String).cast(pl.Categorical)))
+	return(tok_pl.with_columns(pl.col(ENCODED_COLUMNS).cast(pl.String)))
 
 def check_corpus_pl(tok_pl, check_size=False, check_ref=False, target_docs=None):
 	is_valid = check_schema(tok_pl)
@@ -276,9 +671,14 @@ def get_doc_cats(doc_ids):
 	return doc_cats
 
 def tokens_to_pl(tok):
-    data = [[k, *v] for k, lst in tok.items() for v in lst]
+    # output from stream_corpus is already one frame per document, so it only needs concatenating
+    if len(tok) > 0 and all(isinstance(v, pl.DataFrame) for v in tok.values()):
+        df = pl.concat(list(tok.values()), rechunk=False)
+    else:
+        data = [[k, *v] for k, lst in tok.items() for v in lst]
+        df = pl.DataFrame(data, schema =["doc_id", "token", "pos_tag", "ds_tag"], orient="row")
     df = (
-        pl.DataFrame(data, schema =["doc_id", "token", "pos_tag", "ds_tag"], orient="row")
+        df
         # assign unique ids to part-of-speech tags for grouping
         .with_columns(
             pl.when(
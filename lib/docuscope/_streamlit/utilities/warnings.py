@@ -66,6 +66,38 @@ def _21_reference_duplicates(duplicates):
     '''
     return html_code
 
+_22_remove_all = """
+	<div style="background-color: #fddfd7; padding-left: 5px;">
+	&#128555; You cannot remove every document from your corpus.
+	To start over with a new corpus, use the <b>Reset Corpus</b> button.
+	</div>
+	"""
+
+def _24_loaded_duplicates(duplicates):
+    dups = ', '.join(duplicates)
+    html_code = f'''
+	<div style="background-color: #fddfd7; padding-left: 5px;">
+	<p>&#128555; The files you selected could not be added.
+	Documents with these <b>names</b> are already in your corpus:</p>
+	<p><b>{dups}</b></p>
+	To replace them, remove those documents first and then add the new files.
+	</div>
+    '''
+    return html_code
+
+def _23_content_duplicates(exact, near):
+    groups = [' = '.join(group) for group in exact] + [' &#8776; '.join(group) for group in near]
+    dups = '<br>'.join(groups)
+    html_code = f'''
+	<div style="background-color: #fddfd7; padding-left: 5px;">
+	<p>&#128555; Some of the files you selected have <b>the same or nearly the same content</b>
+	(= identical, &#8776; near-duplicate):</p>
+	<p><b>{dups}</b></p>
+	Unless you drop them, every copy will be processed and counted.
+	</div>
+    '''
+    return html_code
+
 _30_corpus_size = """
 	<div style="background-color: #fddfd7; padding-left: 5px;">
 	&#128555; Your corpus is too large for online processing.
@@ -15,4 +15,4 @@
 """
 
 
-from .core import hash_file
+from .core import hash_bytes, hash_file
@@ -29,3 +29,11 @@ def hash_file(filename, dot_feedback=False):
         print(".", end="", flush=True)
 
     return hasher.hexdigest()
+
+
+def hash_bytes(*data):
+    hasher = hashlib.sha1()
+    for item in data:
+        hasher.update(item)
+
+    return hasher.hexdigest()
@@ -17,9 +17,12 @@ import sys
 from docuscope import _config
 from docuscope._vendor.patchlogging import apply_logging_patch
 
+from .cache import cache_cli
 from .dev import dev_cli
 from .gui import gui_cli
 from .streamlit import streamlit_cli
+from .summary import summary_cli
+from .tag import tag_cli
 
 
 class DefaultHelpParser(argparse.ArgumentParser):
@@ -33,9 +36,12 @@ def define_parser():
     parser = DefaultHelpParser(prog="docuscope")
     subparsers = parser.add_subparsers()
 
+    cache_cli(subparsers)
     dev_cli(subparsers)
     gui_cli(subparsers)
     streamlit_cli(subparsers)
+    summary_cli(subparsers)
+    tag_cli(subparsers)
 
     # https://stackoverflow.com/a/20663028/3912576
     parser.add_argument(
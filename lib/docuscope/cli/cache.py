@@ -0,0 +1,77 @@
+# Copyright (C) 2024 David West Brown
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pathlib
+
+from docuscope._streamlit.utilities import handlers_cache, handlers_imports
+
+OPTIONS = str(
+    pathlib.Path(__file__).parents[1].joinpath("_streamlit", "options.toml").resolve()
+)
+
+
+def cache_cli(subparsers):
+    cache_parser = subparsers.add_parser(
+        "cache", help=("Manage the on-disk cache of tagged documents")
+    )
+    cache_subparsers = cache_parser.add_subparsers(dest="cache")
+    add_info_parser(cache_subparsers)
+    add_prune_parser(cache_subparsers)
+
+    return cache_parser
+
+
+def add_info_parser(cache_subparsers):
+    parser = cache_subparsers.add_parser("info")
+    parser.set_defaults(func=info)
+
+
+def add_prune_parser(cache_subparsers):
+    parser = cache_subparsers.add_parser("prune")
+
+    parser.add_argument(
+        "--max-bytes",
+        help=(
+            "Remove least recently used documents until the cache is no larger "
+            "than this. Defaults to cache_max_bytes in options.toml."
+        ),
+        type=int,
+        default=None,
+    )
+    parser.add_argument(
+        "--all",
+        help="Remove every cached document.",
+        action="store_true",
+    )
+
+    parser.set_defaults(func=prune)
+
+
+def info(args):
+    n_files, n_bytes = handlers_cache.cache_info()
+    print(f"{handlers_cache.get_cache_dir()}")
+    print(f"{n_files} cached documents, {n_bytes} bytes")
+
+
+def prune(args):
+    if args.all:
+        max_bytes = 0
+    elif args.max_bytes is not None:
+        max_bytes = args.max_bytes
+    else:
+        options = handlers_imports.import_options_general(OPTIONS)
+        max_bytes = options["global"].get("cache_max_bytes", 0)
+
+    n_files, n_bytes = handlers_cache.evict_cache(max_bytes)
+    print(f"Removed {n_files} cached documents ({n_bytes} bytes)")
@@ -0,0 +1,97 @@
+# Copyright (C) 2024 David West Brown
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pathlib
+import sys
+
+
+def summary_cli(subparsers):
+    summary_parser = subparsers.add_parser(
+        "summary",
+        help=("Merge the count summaries of separately tagged shards into tables"),
+    )
+    summary_subparsers = summary_parser.add_subparsers(dest="summary")
+    add_merge_parser(summary_subparsers)
+    add_tables_parser(summary_subparsers)
+
+    return summary_parser
+
+
+def add_merge_parser(summary_subparsers):
+    parser = summary_subparsers.add_parser("merge")
+
+    parser.add_argument(
+        "inputs",
+        nargs="+",
+        help="Count summaries written by 'docuscope tag --summary' or by this command",
+    )
+    parser.add_argument(
+        "-o", "--output", required=True, help="Path of the merged summary to write"
+    )
+    parser.add_argument(
+        "--allow-overlap",
+        action="store_true",
+        help=(
+            "Add up the counts of documents found in more than one summary, "
+            "instead of stopping with an error"
+        ),
+    )
+
+    parser.set_defaults(func=merge)
+
+
+def add_tables_parser(summary_subparsers):
+    parser = summary_subparsers.add_parser("tables")
+
+    parser.add_argument("input", help="Count summary to build the tables from")
+    parser.add_argument(
+        "-o",
+        "--output",
+        required=True,
+        help="Directory to write the frequency, tag and document-term tables to",
+    )
+
+    parser.set_defaults(func=tables)
+
+
+def merge(args):
+    from docuscope._streamlit.utilities import analysis_functions as _analysis
+
+    # merging is associative, so shards can be merged in any grouping or order
+    summaries = [_analysis.read_count_summary_pl(path) for path in args.inputs]
+    try:
+        summary = _analysis.merge_count_summaries_pl(
+            summaries, allow_overlap=args.allow_overlap
+        )
+    except ValueError as e:
+        sys.exit(f"{e}; pass --allow-overlap to add up their counts")
+    _analysis.write_count_summary_pl(summary, args.output)
+
+    print(
+        f"Merged {len(summaries)} summaries ({summary['docs'].height} documents, "
+        f"{summary['docs']['tokens'].sum()} tokens) and wrote {args.output}"
+    )
+
+
+def tables(args):
+    from docuscope._streamlit.utilities import analysis_functions as _analysis
+
+    summary = _analysis.read_count_summary_pl(args.input)
+    output = pathlib.Path(args.output)
+    output.mkdir(parents=True, exist_ok=True)
+
+    for key, df in _analysis.summary_tables_pl(summary).items():
+        df.write_parquet(output.joinpath(f"{key}.parquet"))
+
+    print(f"Wrote tables for {summary['docs'].height} documents to {output}")
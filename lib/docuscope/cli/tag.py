@@ -0,0 +1,242 @@
+# Copyright (C) 2024 David West Brown
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import glob
+import os
+import pathlib
+import sys
+import tempfile
+import time
+
+import polars as pl
+
+from docuscope._streamlit.utilities import handlers_imports
+
+OPTIONS = str(
+    pathlib.Path(__file__).parents[1].joinpath("_streamlit", "options.toml").resolve()
+)
+MODEL_NAMES = {"large": "Large Dictionary", "common": "Common Dictionary"}
+
+
+def tag_cli(subparsers):
+    options = handlers_imports.import_options_general(OPTIONS)["global"]
+
+    parser = subparsers.add_parser(
+        "tag",
+        help=(
+            "Tag plain text files and write a ds_tokens parquet file that can be "
+            "loaded as an External corpus"
+        ),
+    )
+    parser.add_argument(
+        "inputs",
+        nargs="+",
+        help="Directories of .txt files, or glob patterns (e.g. 'corpus/**/*.txt')",
+    )
+    parser.add_argument(
+        "-o", "--output", required=True, help="Path of the parquet file to write"
+    )
+    parser.add_argument(
+        "-m",
+        "--model",
+        choices=sorted(MODEL_NAMES.keys()),
+        default="large",
+        help="DocuScope dictionary to tag with",
+    )
+    parser.add_argument(
+        "-n",
+        "--n-process",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of worker processes (default: all cores)",
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=options.get("batch_size") or 50
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=options.get("chunk_size", 500),
+        help="Documents converted and written per chunk",
+    )
+    parser.add_argument(
+        "--profile",
+        choices=["full", "pos", "ds"],
+        default=options.get("pipe_profile", "full"),
+        help="Tag with both tagsets, or only part-of-speech or DocuScope",
+    )
+    parser.add_argument(
+        "--encoding",
+        choices=["string", "categorical"],
+        default=options.get("token_encoding", "string"),
+        help="Store doc_id, pos_tag and ds_tag as strings or as categoricals",
+    )
+    parser.add_argument(
+        "--large-docs",
+        action="store_true",
+        help="Spread the chunks of very long documents across worker processes",
+    )
+    parser.add_argument(
+        "--check-language",
+        action="store_true",
+        help=(
+            "Exclude documents that are not in English (requires lingua), and write "
+            "the screening of each document to <output>_language.csv"
+        ),
+    )
+    parser.add_argument(
+        "--drop-duplicates",
+        action="store_true",
+        help="Skip files whose content is identical or nearly identical to an earlier file",
+    )
+    parser.add_argument(
+        "--cache-max-bytes",
+        type=int,
+        default=0,
+        help="Reuse and keep up to this many bytes of previously tagged documents",
+    )
+    parser.add_argument(
+        "--summary",
+        default=None,
+        help=(
+            "Also write a count summary of the tagged documents to this path, "
+            "which can be merged with the summaries of other shards"
+        ),
+    )
+
+    parser.set_defaults(func=tag)
+
+    return parser
+
+
+class TextFile:
+    """A text file on disk, read on demand like an uploaded file."""
+
+    def __init__(self, path):
+        self.path = pathlib.Path(path)
+        self.name = self.path.name
+
+    def getvalue(self):
+        return self.path.read_bytes()
+
+
+def find_files(inputs):
+    paths = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            paths.update(pathlib.Path(item).glob("*.txt"))
+        else:
+            paths.update(pathlib.Path(path) for path in glob.glob(item, recursive=True))
+
+    return [TextFile(path) for path in sorted(paths) if path.is_file()]
+
+
+def tag(args):
+    from docuscope._streamlit.utilities import handlers_models
+    from docuscope._streamlit.utilities import process_corpus as _process
+
+    corp = find_files(args.inputs)
+    if len(corp) == 0:
+        sys.exit("No .txt files found")
+
+    if args.drop_duplicates:
+        exact, near = _process.find_duplicates(corp)
+        kept = _process.drop_duplicates(corp, exact, near)
+        for group in exact + near:
+            print(
+                f"Dropped duplicates of {group[0].name}: "
+                + ", ".join(doc.name for doc in group[1:]),
+                file=sys.stderr,
+            )
+        corp = kept
+
+    dup_ids = _process.check_corpus(corp)
+    if len(dup_ids) > 0:
+        sys.exit("Duplicate file names: " + ", ".join(sorted(dup_ids)))
+
+    start = time.perf_counter()
+    nlp = _process.load_model(
+        handlers_models.MODELS[MODEL_NAMES[args.model]], args.profile
+    )
+    print(f"Loaded the {args.model} model in {time.perf_counter() - start:.1f}s")
+
+    detector, language = None, None
+    if args.check_language:
+        from lingua import Language, LanguageDetectorBuilder
+
+        detector = (
+            LanguageDetectorBuilder.from_all_languages().with_low_accuracy_mode().build()
+        )
+        language = Language.ENGLISH
+
+    output = pathlib.Path(args.output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    # per-document language screening, written next to the output
+    timings = [] if detector is not None else None
+
+    start = time.perf_counter()
+    # chunks are spilled next to the output, so memory stays flat however large the corpus
+    with tempfile.TemporaryDirectory(dir=output.parent) as spill_dir:
+        ds_tokens, exceptions = _process.stream_corpus(
+            corp,
+            nlp,
+            detector,
+            language,
+            batch_size=args.batch_size,
+            n_process=args.n_process,
+            chunk_size=args.chunk_size,
+            spill_dir=spill_dir,
+            cache_max_bytes=args.cache_max_bytes,
+            large_docs=args.large_docs,
+            timings=timings,
+        )
+        _process.encode_tokens_pl(ds_tokens.lazy(), args.encoding).sink_parquet(output)
+    elapsed = time.perf_counter() - start
+
+    if timings is not None:
+        report = _process.language_report_pl(timings)
+        report_path = output.with_name(output.stem + "_language.csv")
+        report.write_csv(report_path)
+        n_sampled = report.filter(pl.col("samples") > 1).height
+        print(
+            f"Screened {report.height} documents for language in "
+            f"{report['seconds'].sum():.1f}s ({n_sampled} needed more than one "
+            f"sample) and wrote {report_path}"
+        )
+
+    if args.summary is not None:
+        from docuscope._streamlit.utilities import analysis_functions as _analysis
+
+        summary = _analysis.count_summary_pl(pl.scan_parquet(output))
+        _analysis.write_count_summary_pl(summary, args.summary)
+        print(f"Wrote count summary to {args.summary}")
+
+    n_docs, n_tokens = (
+        pl.scan_parquet(output)
+        .select(pl.col("doc_id").n_unique(), pl.len())
+        .collect()
+        .row(0)
+    )
+    print(
+        f"Tagged {n_docs} documents ({n_tokens} tokens) in {elapsed:.1f}s "
+        f"and wrote {output}"
+    )
+    if len(exceptions) > 0:
+        print(
+            f"{len(exceptions)} files could not be processed: "
+            + ", ".join(sorted(exceptions)),
+            file=sys.stderr,
+        )
+    if n_docs == 0:
+        sys.exit(1)
@@ -0,0 +1,168 @@
+import random
+
+import numpy as np
+import polars as pl
+import pytest
+import scipy.sparse
+
+from docuscope._streamlit.utilities import analysis_functions
+
+
+def make_tokens(n_docs, seed=1):
+    # a corpus in ds_tokens format with a span of one to three tokens per tag
+    rng = random.Random(seed)
+    words = ["the", "cat", "sat", "on", "a", "mat", ".", "New", "York"]
+    rows = []
+    for k in range(n_docs):
+        pos_id = ds_id = 0
+        ds_tag = "Untagged"
+        for _ in range(rng.randint(1, 40)):
+            pos_id += 1
+            pos_tag = rng.choice(["AT", "NN1", "VVD", "Y"])
+            if rng.random() < 0.5:
+                ds_id += 1
+                ds_tag = rng.choice(["Character", "Narrative", "Untagged"])
+            for _ in range(rng.randint(1, 3)):
+                token = rng.choice(words)
+                rows.append((f"BIO_doc_{k}", token, pos_tag, ds_tag, pos_id, ds_id))
+    return pl.DataFrame(
+        rows,
+        schema={
+            "doc_id": pl.String,
+            "token": pl.String,
+            "pos_tag": pl.String,
+            "ds_tag": pl.String,
+            "pos_id": pl.UInt32,
+            "ds_id": pl.UInt32,
+        },
+        orient="row",
+    )
+
+
+def test_count_summary_of_lazy_corpus(tmp_path):
+    tok_pl = make_tokens(30)
+    path = tmp_path.joinpath("tokens.parquet")
+    tok_pl.write_parquet(path)
+
+    eager = analysis_functions.count_summary_pl(tok_pl)
+    # small batches cut the corpus into several parts that are summarized and merged
+    for batch_tokens in [1, 100, 2**22]:
+        lazy = analysis_functions.count_summary_pl(
+            pl.scan_parquet(path), batch_tokens=batch_tokens
+        )
+        for key in analysis_functions.COUNT_SUMMARY_KEYS:
+            assert lazy[key].equals(eager[key])
+
+
+def test_merge_count_summaries_overlap():
+    summary = analysis_functions.count_summary_pl(make_tokens(5))
+
+    with pytest.raises(ValueError, match="5 documents appear in more than one"):
+        analysis_functions.merge_count_summaries_pl([summary, summary])
+
+    merged = analysis_functions.merge_count_summaries_pl(
+        [summary, summary], allow_overlap=True
+    )
+    assert merged["docs"]["tokens"].sum() == 2 * summary["docs"]["tokens"].sum()
+
+
+def test_sparse_dtm_scale():
+    counts = np.array([[1, 0, 2], [3, 0, 2], [0, 4, 2]], dtype=np.float64)
+
+    scaled = analysis_functions.sparse_dtm_weight(
+        scipy.sparse.csr_matrix(counts), "scale"
+    ).toarray()
+
+    # columns are divided by their standard deviation but not centered,
+    # and the third column, which does not vary, is left unscaled
+    assert np.allclose(scaled[:, :2], counts[:, :2] / counts[:, :2].std(0, ddof=1))
+    assert np.array_equal(scaled[:, 2], counts[:, 2])
+    assert np.isfinite(scaled).all()
+
+    # one document has no standard deviation
+    single = analysis_functions.sparse_dtm_weight(
+        scipy.sparse.csr_matrix(counts[:1]), "scale"
+    ).toarray()
+    assert np.array_equal(single, counts[:1])
+
+
+def assert_tables_equal(left, right):
+    # the same rows in the same order; floats are compared to within rounding
+    assert left.columns == right.columns
+    assert left.dtypes == right.dtypes
+    floats = [col for col, dtype in left.schema.items() if dtype == pl.Float64]
+    assert left.drop(floats).equals(right.drop(floats))
+    for col in floats:
+        assert np.allclose(left[col].to_numpy(), right[col].to_numpy(), equal_nan=True)
+
+
+def test_add_and_remove_documents():
+    tok_pl = make_tokens(30)
+    added_ids = ["BIO_doc_3", "BIO_doc_17", "BIO_doc_29"]
+    part_pl = tok_pl.filter(~pl.col("doc_id").is_in(added_ids))
+    full = analysis_functions.build_corpus_pl(tok_pl)
+    part = analysis_functions.build_corpus_pl(part_pl)
+
+    added = analysis_functions.add_documents_pl(
+        part, tok_pl.filter(pl.col("doc_id").is_in(added_ids))
+    )
+    removed = analysis_functions.remove_documents_pl(added, added_ids)
+
+    # the dispersions dropped by adding and removing are filled in as the app does
+    for corpus, expected in [(added, full), (removed, part)]:
+        corpus.update(analysis_functions.update_dispersions_pl(corpus))
+        for key in ["ft_pos", "ft_ds", "tt_pos", "tt_ds", "dtm_pos", "dtm_ds"]:
+            assert_tables_equal(corpus[key], expected[key])
+
+
+def test_dispersions():
+    # documents of 4, 2 and 4 tokens; Z is only found in the third
+    counts = pl.DataFrame(
+        {
+            "doc_id": ["a", "a", "b", "b", "c"],
+            "Tag": ["X", "Y", "X", "Y", "Z"],
+            "len": [2, 2, 1, 1, 4],
+        },
+        schema_overrides={"len": pl.UInt32},
+    )
+
+    df = analysis_functions.summarize_counts_pl(counts, ["Tag"], dispersion=True)
+    rows = {row["Tag"]: row for row in df.sort("Tag").iter_rows(named=True)}
+
+    # X: shares of the corpus are .4, .2 and .4 and shares of X are 2/3, 1/3 and 0,
+    # so DP = (4/15 + 2/15 + 6/15) / 2; relative frequencies in the documents are
+    # .5, .5 and 0, with a coefficient of variation of 1/sqrt(2) and an entropy of 1 bit
+    assert rows["X"]["AF"] == 3
+    assert rows["X"]["Range"] == pytest.approx(200 / 3)
+    assert rows["X"]["DP"] == pytest.approx(0.4)
+    assert rows["X"]["D"] == pytest.approx(1 - (1 / np.sqrt(2)) / np.sqrt(2))
+    assert rows["X"]["D2"] == pytest.approx(1 / np.log2(3))
+    assert [rows["Y"][key] for key in analysis_functions.DISPERSIONS] == [
+        rows["X"][key] for key in analysis_functions.DISPERSIONS
+    ]
+    # Z: DP = (.4 + .2 + .6) / 2, and a tag in one document is as uneven as it can be
+    assert rows["Z"]["Range"] == pytest.approx(100 / 3)
+    assert rows["Z"]["DP"] == pytest.approx(0.6)
+    assert rows["Z"]["D"] == pytest.approx(0)
+    assert rows["Z"]["D2"] == pytest.approx(0)
+
+    # in a one-document corpus DP is 0 and D and D2 are undefined
+    single = analysis_functions.summarize_counts_pl(
+        counts.filter(pl.col("doc_id") == "a"), ["Tag"], dispersion=True
+    )
+    assert single["DP"].to_list() == [pytest.approx(0), pytest.approx(0)]
+    assert single["D"].null_count() == 2
+    assert single["D2"].null_count() == 2
+
+
+def test_update_dispersions():
+    corpus = analysis_functions.build_corpus_pl(make_tokens(10))
+    stripped = {
+        key: df.drop(analysis_functions.DISPERSIONS, strict=False)
+        for key, df in corpus.items()
+    }
+
+    updated = analysis_functions.update_dispersions_pl(stripped)
+
+    for key in ["ft_pos", "ft_ds", "tt_pos", "tt_ds"]:
+        assert_tables_equal(updated[key], corpus[key])
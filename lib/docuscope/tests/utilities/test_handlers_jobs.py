@@ -0,0 +1,78 @@
+import io
+import time
+
+import pytest
+import spacy
+from spacy.language import Language
+
+from docuscope._streamlit.utilities import handlers_jobs
+from docuscope._streamlit.utilities import process_corpus
+
+RUN = {"interrupt": False, "tagged": []}
+
+
+@Language.component("count_or_fail")
+def count_or_fail(doc):
+    # records each tagged text; with interrupt set, "interrupt" in a text stops the run
+    if RUN["interrupt"] and "interrupt" in doc.text:
+        raise KeyboardInterrupt
+    RUN["tagged"].append(doc.text)
+    return doc
+
+
+def upload(name, text):
+    fileobj = io.BytesIO(text.encode("utf-8"))
+    fileobj.name = name
+    return fileobj
+
+
+@pytest.fixture
+def jobs_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(handlers_jobs, "JOBS_DIR", tmp_path.joinpath("jobs"))
+    return tmp_path.joinpath("jobs")
+
+
+def test_resume_interrupted_job(tmp_path, jobs_dir):
+    nlp = spacy.blank("en")
+    nlp.add_pipe("count_or_fail")
+    texts = ["The cat sat.", "It was happy.", "We interrupt here.", "The end."]
+    uploads = [upload(f"doc_{i}.txt", text) for i, text in enumerate(texts)]
+    docs, _, _, _ = process_corpus.spool_corpus(uploads, tmp_path.joinpath("spool"))
+
+    job_id = handlers_jobs.create_job(docs, "session_1", "target", "Large Dictionary")
+    RUN.update(interrupt=True, tagged=[])
+    with pytest.raises(KeyboardInterrupt):
+        handlers_jobs.run_job(job_id, nlp, chunk_size=1)
+    assert handlers_jobs.job_progress(job_id) == (2, 4)
+
+    # a reconnected session has a new id, so the job is found from the uploads
+    assert handlers_jobs.list_jobs("session_2") == []
+    assert [job["job_id"] for job in handlers_jobs.find_jobs(docs, "target")] == [
+        job_id
+    ]
+    assert (
+        handlers_jobs.create_job(docs, "session_2", "target", "Large Dictionary")
+        == job_id
+    )
+
+    # resuming only tags the documents without a checkpoint
+    RUN.update(interrupt=False, tagged=[])
+    resumed, exceptions = handlers_jobs.run_job(job_id, nlp, chunk_size=1)
+    assert RUN["tagged"] == texts[2:]
+    assert exceptions == []
+    whole, _ = process_corpus.stream_corpus(docs, nlp, chunk_size=1)
+    assert resumed.equals(whole)
+
+
+def test_clean_jobs(tmp_path, jobs_dir):
+    docs, _, _, _ = process_corpus.spool_corpus(
+        [upload("doc_1.txt", "The cat sat.")], tmp_path.joinpath("spool")
+    )
+    job_id = handlers_jobs.create_job(docs, "session_1", "target", "Large Dictionary")
+
+    handlers_jobs.clean_jobs()
+    assert handlers_jobs.read_manifest(job_id) is not None
+
+    time.sleep(0.01)
+    handlers_jobs.clean_jobs(max_age=0)
+    assert not jobs_dir.joinpath(job_id).exists()
@@ -0,0 +1,285 @@
+import bz2
+import gzip
+import io
+import lzma
+import tarfile
+import zipfile
+
+import numpy as np
+import polars as pl
+import spacy
+from spacy.language import Language
+from spacy.tokens import Span
+
+from docuscope._streamlit.utilities import handlers_cache
+from docuscope._streamlit.utilities import process_corpus
+
+# multi-word tags: the first word's tag ends in 1 and the others continue it
+FAKE_TAGS = {"new": "NP21", "york": "NP22", "in": "II21", "front": "II22", "of": "II23"}
+
+
+class TextDoc:
+    def __init__(self, name, text):
+        self.name = name
+        self.text = text
+
+    def getvalue(self):
+        return self.text.encode("utf-8")
+
+
+def blank_model(pipe_names):
+    # components that set nothing, named like the ones a tagging profile keeps
+    nlp = spacy.blank("en")
+    for name in pipe_names:
+        nlp.add_pipe("sentencizer", name=name)
+    return nlp
+
+
+def test_cache_key_includes_profile_and_chunking(tmp_path, monkeypatch):
+    monkeypatch.setattr(handlers_cache, "get_cache_dir", lambda: tmp_path)
+    docs = [TextDoc("doc_1.txt", "The cat sat on the mat. It was happy.")]
+
+    def run(pipe_names):
+        process_corpus.stream_corpus(
+            docs, blank_model(pipe_names), cache_max_bytes=2**30
+        )
+        return len(list(tmp_path.glob("*.parquet")))
+
+    # a ds run must not be served to a full run, nor the other way round
+    assert run(["tok2vec", "ner"]) == 1
+    assert run(["tok2vec", "tagger", "ner"]) == 2
+    assert run(["tok2vec", "tagger", "ner"]) == 2
+
+    nlp = blank_model(["tok2vec", "tagger", "ner"])
+    assert handlers_cache.model_id(
+        nlp, process_corpus.MAX_CHARS, process_corpus.CHUNK_CHARS
+    ) != handlers_cache.model_id(
+        nlp, process_corpus.LARGE_DOC_CHARS, process_corpus.LARGE_CHUNK_CHARS
+    )
+
+
+class FakeDetector:
+    # scores samples with the word "bonjour" as certainly not English
+    def compute_language_confidence_in_parallel(self, texts, language):
+        return [0.0 if "bonjour" in text else 1.0 for text in texts]
+
+
+def test_language_report():
+    docs = [
+        TextDoc("english.txt", "The cat sat on the mat. " * 10),
+        TextDoc("french.txt", "bonjour le monde " * 400),
+        TextDoc("binary.txt", ""),
+    ]
+    docs[2].getvalue = lambda: b"\xff\xfe"
+    exceptions = []
+    timings = []
+
+    kept = process_corpus.screen_language(
+        docs, FakeDetector(), "en", exceptions, timings
+    )
+    report = process_corpus.language_report_pl(timings)
+
+    # undecodable documents are passed on without a row for read_corpus to report
+    assert [doc.name for doc in kept] == ["english.txt", "binary.txt"]
+    assert exceptions == ["french.txt"]
+    assert report.columns == ["doc_id", "samples", "confidence", "passed", "seconds"]
+    rows = {row["doc_id"]: row for row in report.iter_rows(named=True)}
+    assert sorted(rows) == ["english", "french"]
+    # a confident first sample settles a document,
+    # and a long one that fails is scored on all three samples
+    assert (rows["english"]["samples"], rows["english"]["passed"]) == (1, True)
+    assert (rows["french"]["samples"], rows["french"]["passed"]) == (3, False)
+    assert rows["french"]["confidence"] == 0.0
+    assert all(row["seconds"] >= 0 for row in rows.values())
+
+    assert process_corpus.language_report_pl([]).height == 0
+
+
+def upload(name, data):
+    fileobj = io.BytesIO(data)
+    fileobj.name = name
+    return fileobj
+
+
+def test_spool_compressed_files(tmp_path):
+    text = "The cat sat on the mat."
+    tar_bytes = io.BytesIO()
+    with tarfile.open(fileobj=tar_bytes, mode="w:gz") as tf:
+        info = tarfile.TarInfo("BIO/essay 4.txt")
+        info.size = len(text.encode("utf-8"))
+        tf.addfile(info, io.BytesIO(text.encode("utf-8")))
+    docs = [
+        upload("essay 1.txt.gz", gzip.compress(text.encode("utf-8"))),
+        upload("essay 2.bz2", bz2.compress(text.encode("utf-8"))),
+        upload("essay 3.txt.xz", lzma.compress(text.encode("utf-8"))),
+        upload("corpus.tar.gz", tar_bytes.getvalue()),
+    ]
+
+    spooled, dup_ids, dup_docs, corpus_size = process_corpus.spool_corpus(
+        docs, tmp_path
+    )
+
+    # single compressed files are one document each, named without the extension
+    assert [doc.name for doc in spooled] == [
+        "essay 1.txt",
+        "essay 2.txt",
+        "essay 3.txt",
+        "essay 4.txt",
+    ]
+    assert all(doc.getvalue().decode("utf-8") == text for doc in spooled)
+    assert corpus_size == 4 * len(text)
+
+
+def test_spool_stops_at_max_bytes(tmp_path):
+    # a small archive that expands to far more than max_bytes
+    zip_bytes = io.BytesIO()
+    with zipfile.ZipFile(zip_bytes, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("small.txt", "The cat sat on the mat.")
+        zf.writestr("large.txt", b" " * 64 * process_corpus.SPOOL_BLOCK)
+    max_bytes = 2 * process_corpus.SPOOL_BLOCK
+    spooled = {}
+    docs = [
+        upload("essay.txt", b"The cat sat on the mat."),
+        upload("corpus.zip", zip_bytes.getvalue()),
+    ]
+
+    spooled_docs, dup_ids, dup_docs, corpus_size = process_corpus.spool_corpus(
+        docs, tmp_path, spooled, max_bytes=max_bytes
+    )
+
+    # copying stopped a block past the limit and the archive's files were removed
+    assert spooled_docs == []
+    assert max_bytes < corpus_size <= max_bytes + 2 * process_corpus.SPOOL_BLOCK
+    assert [path.name for path in tmp_path.iterdir()] == ["doc_000000.txt"]
+
+    spooled_docs, dup_ids, dup_docs, corpus_size = process_corpus.spool_corpus(
+        docs[:1], tmp_path, spooled, max_bytes=max_bytes
+    )
+    assert [doc.name for doc in spooled_docs] == ["essay.txt"]
+
+
+def test_find_near_duplicates():
+    # 200 pairs of 500-word documents with 5 words changed, so each pair has
+    # a shingle Jaccard similarity of about .9, and no pair shares text with another
+    rng = np.random.default_rng(1)
+    vocab = [f"w{i}" for i in range(5000)]
+    docs = []
+    for k in range(200):
+        words = list(rng.choice(vocab, 500))
+        near = list(words)
+        for position in range(50, 500, 100):
+            near[position] = "changed"
+        docs.append(TextDoc(f"doc_{k}_a.txt", " ".join(words)))
+        docs.append(TextDoc(f"doc_{k}_b.txt", " ".join(near)))
+    docs.append(TextDoc("copy.txt", docs[0].text))
+
+    exact, near = process_corpus.find_duplicates(docs)
+
+    assert [[doc.name for doc in group] for group in exact] == [
+        ["doc_0_a.txt", "copy.txt"]
+    ]
+    assert sorted([doc.name for doc in group] for group in near) == sorted(
+        [f"doc_{k}_a.txt", f"doc_{k}_b.txt"] for k in range(200)
+    )
+
+
+def test_stream_corpus_blank_documents(tmp_path):
+    nlp = blank_model(["tok2vec", "tagger", "ner"])
+
+    # a corpus of only blank documents
+    blank = [TextDoc("blank_1.txt", ""), TextDoc("blank_2.txt", "  \n ")]
+    for chunk_size in [1, 500]:
+        ds_tokens, exceptions = process_corpus.stream_corpus(
+            blank, nlp, chunk_size=chunk_size
+        )
+        assert ds_tokens.height == 0
+        assert exceptions == []
+
+    # a chunk of only blank documents between, and after, chunks with tokens
+    docs = [
+        TextDoc("doc_1.txt", "The cat sat on the mat."),
+        TextDoc("doc_2.txt", ""),
+        TextDoc("doc_3.txt", "It was happy."),
+        TextDoc("doc_4.txt", " "),
+    ]
+    whole, _ = process_corpus.stream_corpus(docs, nlp, chunk_size=500)
+    chunked, _ = process_corpus.stream_corpus(docs, nlp, chunk_size=1)
+    spilled, _ = process_corpus.stream_corpus(
+        docs, nlp, chunk_size=1, spill_dir=tmp_path
+    )
+    assert whole.height > 0
+    assert chunked.equals(whole)
+    assert spilled.collect().equals(whole)
+    assert len(list(tmp_path.glob("*.parquet"))) == 2
+
+
+@Language.component("fake_tags")
+def fake_tags(doc):
+    # tags every word, with multi-word tags from FAKE_TAGS, and makes each "cat"
+    # and each "very happy" an entity
+    for token in doc:
+        token.tag_ = FAKE_TAGS.get(token.lower_, "NN1")
+    ents = []
+    for token in doc:
+        if token.lower_ == "cat":
+            ents.append(Span(doc, token.i, token.i + 1, "Character"))
+        if token.lower_ == "very" and token.i + 1 < len(doc):
+            ents.append(Span(doc, token.i, token.i + 2, "Sentiment"))
+    doc.set_ents(ents)
+    return doc
+
+
+def test_stream_corpus_chunks():
+    nlp = spacy.blank("en")
+    nlp.add_pipe("fake_tags")
+    texts = [
+        "The cat sat in front of New York.",
+        # starts inside a multi-word tag, so its ids continue the previous document's
+        "York is very happy. The cat was very happy",
+        "",
+        "In front of the cat, very happy cats sat.",
+        "of New York",
+        "A cat in New York, very happy in front of it.",
+        "The end.",
+    ]
+    docs = [TextDoc(f"doc_{i}.txt", text) for i, text in enumerate(texts)]
+
+    # every document tagged on its own, in doc_id order, as one frame
+    tokens = {}
+    for doc in sorted(docs, key=lambda doc: process_corpus.get_doc_id(doc.name)):
+        doc_id = process_corpus.get_doc_id(doc.name)
+        tagged = process_corpus.tag_doc_pl(
+            nlp(process_corpus.normalize_text(doc.text))
+        )
+        tokens[doc_id] = tagged.select(pl.lit(doc_id).alias("doc_id"), pl.all())
+    expected = process_corpus.tokens_to_pl(tokens)
+
+    assert expected.get_column("pos_id").max() > len(texts)
+    for chunk_size in [1, 3, 500]:
+        ds_tokens, exceptions = process_corpus.stream_corpus(
+            docs, nlp, chunk_size=chunk_size
+        )
+        assert exceptions == []
+        assert ds_tokens.equals(expected)
+
+
+def test_encode_tokens():
+    nlp = spacy.blank("en")
+    nlp.add_pipe("fake_tags")
+    ds_tokens, _ = process_corpus.stream_corpus(
+        [TextDoc("doc_1.txt", "The very happy cat sat in front of New York.")], nlp
+    )
+
+    encoded = process_corpus.encode_tokens_pl(ds_tokens, "categorical")
+    decoded = process_corpus.encode_tokens_pl(encoded, "string")
+
+    for col in process_corpus.ENCODED_COLUMNS:
+        assert encoded.schema[col] == pl.Categorical
+    assert decoded.equals(ds_tokens)
+    # encoding twice, or from a lazy frame, gives the same frame
+    assert process_corpus.encode_tokens_pl(encoded, "categorical").equals(encoded)
+    assert (
+        process_corpus.encode_tokens_pl(ds_tokens.lazy(), "categorical")
+        .collect()
+        .equals(encoded)
+    )